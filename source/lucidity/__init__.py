@@ -3,15 +3,38 @@
 # :license: See LICENSE.txt.
 
 import os
+import sys
+import copy
+import collections
 import uuid
 import imp
+import threading
+import multiprocessing.pool
 
 from ._version import __version__
 from .template import Template, Resolver
-from .error import ParseError, FormatError, NotFound
+from .template_set import TemplateSet
+from .adaptive_template_set import AdaptiveTemplateSet
+from .registry import Registry
+from . import definition
+from .error import ParseError, FormatError, NotFound, ResolveError
 
 
-def discover_templates(paths=None, recursive=True):
+#: Maximum number of threads used by asynchronous operations such as
+#: :func:`discover_templates_async`.
+THREADS = 4
+
+#: Pool of threads shared by asynchronous operations, created on first use.
+_THREAD_POOL = None
+_THREAD_POOL_LOCK = threading.Lock()
+
+#: Cache of loaded mount points keyed by module path. Each value is a tuple of
+#: ``(mtime, size, module, templates)``, with a module of None for definition
+#: files.
+_MOUNT_POINT_CACHE = {}
+
+
+def discover_templates(paths=None, recursive=True, cache=True, threads=1):
     '''Search *paths* for mount points and load templates from them.
 
     *paths* should be a list of filesystem paths to search for mount points.
@@ -20,34 +43,46 @@ def discover_templates(paths=None, recursive=True):
 
     A mount point is a Python file that defines a 'register' function. The
     function should return a list of instantiated
-    :py:class:`~lucidity.template.Template` objects.
+    :py:class:`~lucidity.template.Template` objects. Alternatively, a mount
+    point can be a declarative definition file named with
+    :data:`lucidity.definition.EXTENSION` (see :mod:`lucidity.definition`).
 
     If *recursive* is True (the default) then all directories under a path
     will also be searched.
 
-    '''
-    templates = []
+    If *cache* is True (the default) then a mount point is only loaded again
+    if its modification time or size has changed since it was last loaded by
+    this process. Otherwise the templates it registered previously are
+    returned. Set *cache* to False to always load mount points.
+
+    Each call returns shallow copies of the cached templates, sharing their
+    compiled state, so that changes made to a returned template, such as
+    setting its *template_resolver*, are not seen by other callers. Any
+    objects the templates reference, such as a shared template resolver, are
+    not copied.
 
+    If *threads* is greater than 1 then list directories and read mount
+    points in a pool of that many threads, overlapping the time spent waiting
+    on slow, such as network, filesystems. Mount points are still executed
+    one at a time in the calling thread, and templates returned, in the same
+    order as when searching serially.
+
+    '''
     if paths is None:
         paths = os.environ.get('LUCIDITY_TEMPLATE_PATH', '').split(os.pathsep)
 
+    if threads > 1:
+        return _discover_templates_threaded(paths, recursive, cache, threads)
+
+    templates = []
     for path in paths:
         for base, directories, filenames in os.walk(path):
             for filename in filenames:
-                _, extension = os.path.splitext(filename)
-                if extension != '.py':
+                if not _is_mount_point(filename):
                     continue
 
                 module_path = os.path.join(base, filename)
-                module_name = uuid.uuid4().hex
-                module = imp.load_source(module_name, module_path)
-                try:
-                    registered = module.register()
-                except AttributeError:
-                    pass
-                else:
-                    if registered:
-                        templates.extend(registered)
+                templates.extend(_load_mount_point(module_path, cache=cache))
 
             if not recursive:
                 del directories[:]
@@ -55,20 +90,247 @@ def discover_templates(paths=None, recursive=True):
     return templates
 
 
+def _discover_templates_threaded(paths, recursive, cache, threads):
+    '''Return templates from mount points under *paths* using *threads*.
+
+    Each directory's subdirectories are queued for listing, and its mount
+    points for reading, as soon as it has been listed. Mount points are then
+    loaded in the same order as :func:`os.walk` would visit them.
+
+    '''
+    pool = multiprocessing.pool.ThreadPool(threads)
+    listings = {}
+    reads = {}
+
+    def list_directory(directory):
+        listings[directory] = pool.apply_async(
+            _list_mount_point_directory, (directory,), callback=queue
+        )
+
+    def queue(listing):
+        # Called in the pool's result thread before the listing is ready.
+        directories, module_paths = listing
+        for module_path in module_paths:
+            reads[module_path] = pool.apply_async(
+                _read_mount_point, (module_path, cache)
+            )
+
+        if recursive:
+            for directory in directories:
+                list_directory(directory)
+
+    def walk(directory):
+        try:
+            directories, module_paths = listings[directory].get()
+        except OSError:
+            return
+
+        for module_path in module_paths:
+            yield module_path
+
+        if recursive:
+            for directory in directories:
+                for module_path in walk(directory):
+                    yield module_path
+
+    try:
+        for path in paths:
+            list_directory(path)
+
+        templates = []
+        loaded = set()
+        for path in paths:
+            for module_path in walk(path):
+                # Mount points found again under another path are checked
+                # against the cache as when searching serially.
+                read = None
+                if module_path not in loaded:
+                    read = reads[module_path].get()
+                    loaded.add(module_path)
+
+                templates.extend(
+                    _load_mount_point(module_path, cache=cache, read=read)
+                )
+
+        return templates
+
+    finally:
+        # Let remaining work finish in the background rather than waiting on
+        # the pool's handler threads, which poll at intervals, to terminate.
+        pool.close()
+
+
+def _list_mount_point_directory(path):
+    '''Return subdirectories and mount point paths in directory at *path*.
+
+    Return a tuple of (directories, module_paths) ordered and filtered as
+    :func:`os.walk` would for *path*, so that symbolic links to directories
+    are not included in *directories*.
+
+    '''
+    directories = []
+    module_paths = []
+    for name in os.listdir(path):
+        entry_path = os.path.join(path, name)
+        if os.path.isdir(entry_path):
+            if not os.path.islink(entry_path):
+                directories.append(entry_path)
+
+        elif _is_mount_point(name):
+            module_paths.append(entry_path)
+
+    return (directories, module_paths)
+
+
+def _is_mount_point(filename):
+    '''Return whether file named *filename* is a mount point.'''
+    return (
+        os.path.splitext(filename)[1] == '.py'
+        or filename.endswith(definition.EXTENSION)
+    )
+
+
+def discover_templates_async(paths=None, recursive=True, cache=True,
+                             threads=1, callback=None):
+    '''Start discovering templates without blocking the calling thread.
+
+    Search *paths* for mount points as :func:`discover_templates` does, with
+    the same arguments, in a shared pool of at most :data:`THREADS` threads.
+
+    Return a :py:class:`multiprocessing.pool.AsyncResult`. Call its ``get``
+    method to wait for and return the list of templates, or raise any error
+    encountered. If *callback* is specified then it will be called with the
+    list of templates, in a pool thread, once discovery has succeeded.
+
+    '''
+    return _get_thread_pool().apply_async(
+        discover_templates, (paths, recursive, cache, threads),
+        callback=callback
+    )
+
+
+def _get_thread_pool():
+    '''Return pool of threads shared by asynchronous operations.'''
+    global _THREAD_POOL
+
+    with _THREAD_POOL_LOCK:
+        if _THREAD_POOL is None:
+            _THREAD_POOL = multiprocessing.pool.ThreadPool(THREADS)
+
+        return _THREAD_POOL
+
+
+def _read_mount_point(path, cache=True):
+    '''Return ``(key, source)`` read for mount point at *path*.
+
+    *key* identifies the version of the file by modification time and size.
+    *source* is the Python source of the mount point or, for a definition
+    file, the list of templates it defines as definition files are data so
+    are safe to load in any thread. If *cache* is True and templates for that
+    version are already cached then *source* is None rather than read.
+
+    '''
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+
+    entry = _MOUNT_POINT_CACHE.get(path)
+    if cache and entry is not None and entry[:2] == key:
+        return (key, None)
+
+    if path.endswith(definition.EXTENSION):
+        return (key, definition.load(path))
+
+    with open(path, 'rU') as file_object:
+        return (key, file_object.read())
+
+
+def _load_mount_point(path, cache=True, read=None):
+    '''Return list of templates registered by mount point at *path*.
+
+    If *cache* is True then reuse templates from a previous load when the file
+    modification time and size are unchanged.
+
+    *read* can be the result of :func:`_read_mount_point` for *path* if
+    already read.
+
+    Loaded modules are held in a cache rather than :data:`sys.modules` so that
+    they are not leaked on reload.
+
+    '''
+    if read is None:
+        read = _read_mount_point(path, cache=cache)
+
+    key, source = read
+    if source is None:
+        return _copy_templates(_MOUNT_POINT_CACHE[path][3])
+
+    if isinstance(source, list):
+        _MOUNT_POINT_CACHE[path] = key + (None, source)
+        return _copy_templates(source)
+
+    module_name = uuid.uuid4().hex
+    module = imp.new_module(module_name)
+    module.__file__ = path
+
+    sys.modules[module_name] = module
+    try:
+        exec compile(source, path, 'exec') in module.__dict__
+    finally:
+        sys.modules.pop(module_name, None)
+
+    templates = []
+    try:
+        registered = module.register()
+    except AttributeError:
+        pass
+    else:
+        if registered:
+            templates.extend(registered)
+
+    _MOUNT_POINT_CACHE[path] = key + (module, templates)
+
+    return _copy_templates(templates)
+
+
+def _copy_templates(templates):
+    '''Return shallow copies of cached *templates* for a caller.
+
+    The copies share the compiled state of the cached templates, which each
+    rebuilds separately if later changed, so that copying is cheap.
+
+    '''
+    copies = []
+    for template in templates:
+        copied = copy.copy(template)
+        copied._cache = template._cache
+        copies.append(copied)
+
+    return copies
+
+
 def parse(path, templates):
     '''Parse *path* against *templates*.
 
     *path* should be a string to parse.
 
     *templates* should be a list of :py:class:`~lucidity.template.Template`
-    instances in the order that they should be tried.
+    instances in the order that they should be tried. Alternatively, pass a
+    :py:class:`~lucidity.template_set.TemplateSet` to parse against all
+    templates in a single pass.
 
     Return ``(data, template)`` from first successful parse.
 
     Raise :py:class:`~lucidity.error.ParseError` if *path* is not
     parseable by any of the supplied *templates*.
 
+    If a :mod:`parse cache <lucidity.parse_cache>` is enabled then results
+    are stored against each template tried, or against the template set as a
+    whole.
+
     '''
+    if isinstance(templates, TemplateSet):
+        return templates.parse(path)
+
     for template in templates:
         try:
             data = template.parse(path)
@@ -83,6 +345,74 @@ def parse(path, templates):
     )
 
 
+def parse_many(paths, templates, processes=1, chunk_size=1000, ordered=True):
+    '''Parse each of *paths* against *templates*.
+
+    *paths* can be any iterable of strings, including an open file of newline
+    separated paths. Trailing newline characters are stripped from each path.
+
+    *templates* should be a list of :py:class:`~lucidity.template.Template`
+    instances in the order that they should be tried or a
+    :py:class:`~lucidity.template_set.TemplateSet`. A list is converted to a
+    template set once so that compiled state is reused for every path.
+
+    Yield ``(path, data, template)`` for each path in turn. If a path is not
+    parseable by any of the *templates* then yield ``(path, None, None)``
+    rather than raising :py:class:`~lucidity.error.ParseError`.
+
+    If *processes* is greater than 1 (or None for one per CPU) then parse in a
+    pool of worker processes, distributing *paths* in lists of *chunk_size*.
+    Set *ordered* to False to receive results as each chunk completes rather
+    than in input order. See
+    :py:meth:`~lucidity.template_set.TemplateSet.parse_many`.
+
+    '''
+    if not isinstance(templates, TemplateSet):
+        templates = TemplateSet(templates)
+
+    return templates.parse_many(
+        paths, processes=processes, chunk_size=chunk_size, ordered=ordered
+    )
+
+
+def parse_columns(paths, templates, numpy=False):
+    '''Parse each of *paths* against *templates* returning columns of data.
+
+    *templates* should be a list of :py:class:`~lucidity.template.Template`
+    instances in the order that they should be tried or a
+    :py:class:`~lucidity.template_set.TemplateSet`.
+
+    Return ``(template_indices, columns)`` holding the index of the template
+    that parsed each path and a list of values per placeholder. See
+    :py:meth:`~lucidity.template_set.TemplateSet.parse_columns`.
+
+    '''
+    if not isinstance(templates, TemplateSet):
+        templates = TemplateSet(templates)
+
+    return templates.parse_columns(paths, numpy=numpy)
+
+
+def scan(root, templates, follow_links=False, threads=1):
+    '''Walk directory tree under *root* parsing file paths with *templates*.
+
+    *templates* should be a list of :py:class:`~lucidity.template.Template`
+    instances in the order that they should be tried or a
+    :py:class:`~lucidity.template_set.TemplateSet`.
+
+    Yield ``(path, data, template)`` for each file parseable by *templates*.
+    Directories that could not contain a matching path are not descended
+    into. If *threads* is greater than 1 then list up to that many directories
+    at once in a pool of threads. See
+    :py:meth:`~lucidity.template_set.TemplateSet.scan`.
+
+    '''
+    if not isinstance(templates, TemplateSet):
+        templates = TemplateSet(templates)
+
+    return templates.scan(root, follow_links=follow_links, threads=threads)
+
+
 def format(data, templates):  # @ReservedAssignment
     '''Format *data* using *templates*.
 
@@ -96,9 +426,20 @@ def format(data, templates):  # @ReservedAssignment
     Raise :py:class:`~lucidity.error.FormatError` if *data* is not
     formattable by any of the supplied *templates*.
 
-
     '''
+    # Rule out templates requiring keys that data does not have before
+    # attempting substitution. Only plain dictionaries are checked as other
+    # mappings may supply values for keys they do not list.
+    keys = None
+    if isinstance(data, dict) and not hasattr(type(data), '__missing__'):
+        keys = data.viewkeys()
+
     for template in templates:
+        if keys is not None and not template._get_cached(
+            'required_keys', template._construct_required_keys
+        ) <= keys:
+            continue
+
         try:
             path = template.format(data)
         except FormatError:
@@ -112,17 +453,126 @@ def format(data, templates):  # @ReservedAssignment
     )
 
 
+def format_many(records, templates):
+    '''Format each of *records* using *templates*.
+
+    *records* can be an iterable of dictionaries of data to format into
+    paths or a mapping of placeholder name to a sequence of values. See
+    :py:meth:`Template.format_many
+    <lucidity.template.Template.format_many>`.
+
+    *templates* should be a list of :py:class:`~lucidity.template.Template`
+    instances in the order that they should be tried.
+
+    Yield ``(path, template)`` from the first successful format of each record
+    in turn. If a record is not formattable by any of the *templates* then
+    yield ``(None, None)`` rather than raising
+    :py:class:`~lucidity.error.FormatError`.
+
+    '''
+    templates = list(templates)
+    if isinstance(records, collections.Mapping):
+        return iter(_format_columns(records, templates))
+
+    formatters = [
+        (template._get_cached('formatter', template._construct_formatter),
+         template)
+        for template in templates
+    ]
+    return _format_records(records, formatters)
+
+
+def _format_records(records, formatters):
+    '''Yield ``(path, template)`` for each of *records* using *formatters*.'''
+    for record in records:
+        for formatter, template in formatters:
+            path = formatter(record)
+            if path is not None:
+                yield (path, template)
+                break
+        else:
+            yield (None, None)
+
+
+def _format_columns(columns, templates):
+    '''Return list of ``(path, template)`` for each row of *columns*.
+
+    Each template formats only the rows that earlier templates could not.
+
+    '''
+    count = len(next(iter(columns.values()))) if columns else 0
+    results = [(None, None)] * count
+    pending = list(range(count))
+
+    for template in templates:
+        if not pending:
+            break
+
+        subset = columns
+        if len(pending) != count:
+            subset = dict(
+                (key, [column[index] for index in pending])
+                for key, column in columns.items()
+            )
+
+        remaining = []
+        for index, path in zip(pending, template.format_many(subset)):
+            if path is None:
+                remaining.append(index)
+            else:
+                results[index] = (path, template)
+
+        pending = remaining
+
+    return results
+
+
+def validate_all(templates, resolve=True):
+    '''Validate each of *templates*, including any deferred by lazy mode.
+
+    If *resolve* is True (the default) then also resolve template references
+    and compile the expanded pattern of each template.
+
+    Raise :exc:`ValueError` for the first template with an invalid pattern or
+    :py:class:`~lucidity.error.ResolveError` for the first template with a
+    reference that cannot be resolved. The error message is prefixed with the
+    name of the template.
+
+    '''
+    for template in templates:
+        try:
+            template.validate()
+            if resolve:
+                template._get_cached(
+                    'regex', template._construct_regular_expression
+                )
+
+        except (ValueError, ResolveError) as error:
+            raise error.__class__(
+                'Template {0!r} is invalid: {1}'.format(template.name, error)
+            )
+
+
 def get_template(name, templates):
     '''Retrieve a template from *templates* by *name*.
 
     Raise :py:exc:`~lucidity.error.NotFound` if no matching template with
     *name* found in *templates*.
 
+    If *templates* is a :py:class:`~lucidity.registry.Registry` then lookup
+    is by name rather than by searching each template in turn.
+
     '''
-    for template in templates:
-        if template.name == name:
+    if isinstance(templates, Registry):
+        template = templates.get(name)
+        if template is not None:
             return template
 
+    else:
+        for template in templates:
+            if template.name == name:
+                return template
+
     raise NotFound(
         '{0} template not found in specified templates.'.format(name)
     )
@@ -0,0 +1,426 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import re
+import sre_parse
+import sre_constants
+
+import lucidity.error
+from lucidity.template import Template
+from lucidity.template_set import TemplateSet, _DEFAULT_FLAGS
+
+
+#: Expression splitting a placeholder into its name and expression.
+_PLACEHOLDER_REGEX = re.compile(
+    r'{(?P<placeholder>.+?)(:(?P<expression>(\\}|.)+?))?}'
+)
+
+#: Character set categories that never match '/'.
+_SEPARATOR_FREE_CATEGORIES = (
+    sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_WORD,
+    sre_constants.CATEGORY_SPACE, sre_constants.CATEGORY_LINEBREAK
+)
+
+
+class AdaptiveTemplateSet(TemplateSet):
+    '''Template set that tries the most frequently matching templates first.
+
+    The templates that have matched most often are tried individually before
+    falling back to matching all templates as a
+    :class:`~lucidity.template_set.TemplateSet` does. Paths following a skewed
+    distribution are therefore usually parsed by a single template, however
+    it was declared. Other paths are parsed slightly more slowly than by a
+    :class:`~lucidity.template_set.TemplateSet` as the frequently matching
+    templates are tried first.
+
+    The result is always the same as trying templates in declared order. When
+    a frequently matching template matches, the earlier declared templates
+    that could also match the path are checked, using combined expressions,
+    and the first of those to match wins. Two templates are known not to match
+    the same path if their anchored literal prefixes or suffixes differ, if
+    they require differing numbers of '/' separated segments or if a segment
+    at the same position, counting from an anchored end, is literal text in
+    one that the other cannot match. Segments are only compared where every
+    placeholder is known not to match '/', such as with the default
+    placeholder expression. Templates that differ by literal text in a
+    directory name therefore keep this check cheap.
+
+    '''
+
+    def __init__(self, templates=None, attempts=3, reorder_interval=100):
+        '''Initialise with *templates*.
+
+        *templates* should be an iterable of
+        :py:class:`~lucidity.template.Template` instances in the order that
+        they should be tried.
+
+        Up to *attempts* of the most frequently matching templates are tried
+        individually for each path. Templates are reordered by hit count after
+        every *reorder_interval* parses. Hit counts are halved at the same
+        time so that the order follows changes in the workload.
+
+        '''
+        super(AdaptiveTemplateSet, self).__init__(templates)
+        self.attempts = attempts
+        self.reorder_interval = reorder_interval
+        self._order = list(range(len(self._templates)))
+        self._hits = [0] * len(self._templates)
+        self._parses = 0
+        self._attempted = None
+        self._overlapping = {}
+        self._bounds = None
+
+    def __getstate__(self):
+        '''Return state for copying and pickling without compiled state.'''
+        state = super(AdaptiveTemplateSet, self).__getstate__()
+        state['_attempted'] = None
+        state['_overlapping'] = {}
+        state['_bounds'] = None
+        return state
+
+    def refresh(self):
+        '''Discard compiled state so that it is rebuilt on next use.'''
+        super(AdaptiveTemplateSet, self).refresh()
+        self._attempted = None
+        self._overlapping = {}
+        self._bounds = None
+
+    def order(self):
+        '''Return templates in the order they are currently tried.'''
+        return [self._templates[position] for position in self._order]
+
+    def reorder(self):
+        '''Order templates by descending hit count, then declared order.'''
+        hits = self._hits
+        self._order = sorted(
+            range(len(self._templates)),
+            key=lambda position: (-hits[position], position)
+        )
+        self._hits = [count // 2 for count in hits]
+        self._parses = 0
+        self._attempted = None
+
+    def _match(self, path, record=False):
+        '''Return ``(data, template)`` parsed from *path* or None.
+
+        If *record* is True then data is returned as a
+        :class:`~lucidity.record.Record`.
+
+        '''
+        self._parses += 1
+        if self._parses >= self.reorder_interval:
+            self.reorder()
+
+        attempted = self._attempted
+        if attempted is None:
+            attempted = self._attempted = self._construct_attempted()
+
+        # Templates are matched directly, rather than parsed, to avoid raising
+        # an error for each that fails and so that results are not stored for
+        # each template as well as for the set in the parse cache.
+        for position, template, search, overlapping in attempted:
+            match = search(path)
+            if match is None:
+                continue
+
+            try:
+                if record:
+                    data = template._extract_record(match.groups())
+                else:
+                    data = template._extract(match.groups())
+            except lucidity.error.ParseError:
+                continue
+
+            # Earlier declared templates that could also match take priority.
+            if overlapping:
+                for regex, branches, templates in self._get_chunks(
+                    overlapping
+                ):
+                    earlier = self._parse_chunk(
+                        path, regex, branches, templates, record=record
+                    )
+                    if earlier is not None:
+                        self._hits[self._get_position(earlier[1])] += 1
+                        return earlier
+
+            self._hits[position] += 1
+            return (data, template)
+
+        result = super(AdaptiveTemplateSet, self)._match(path, record=record)
+        if result is not None:
+            self._hits[self._get_position(result[1])] += 1
+
+        return result
+
+    def _construct_attempted(self):
+        '''Return templates to try individually before all templates.
+
+        Each entry is a tuple of (position, template, search, overlapping) for
+        one of the most frequently matching templates, where *search* is the
+        function returned by
+        :meth:`Template._construct_search
+        <lucidity.template.Template._construct_search>` and *overlapping* the
+        earlier declared positions returned by :meth:`_construct_overlapping`.
+
+        '''
+        attempted = []
+        for position in self._order[:self.attempts]:
+            template = self._templates[position]
+            overlapping = self._overlapping.get(position)
+            if overlapping is None:
+                overlapping = self._construct_overlapping(position)
+                self._overlapping[position] = overlapping
+
+            attempted.append((
+                position, template,
+                template._get_cached('search', template._construct_search),
+                overlapping
+            ))
+
+        return attempted
+
+    def _construct_overlapping(self, position):
+        '''Return earlier declared positions that may overlap *position*.
+
+        Return a tuple of positions, in declared order, of templates declared
+        before the template at *position* that cannot be proven to never match
+        the same path. Only templates that match frequently are checked so
+        this is constructed on first use for each position.
+
+        '''
+        if self._bounds is None:
+            self._bounds = [None] * len(self._templates)
+
+        bounds = self._bounds
+        for index in range(position + 1):
+            if bounds[index] is None:
+                bounds[index] = _construct_bounds(self._templates[index])
+
+        return tuple(
+            earlier for earlier in range(position)
+            if not _disjoint(bounds[position], bounds[earlier])
+        )
+
+
+def _construct_bounds(template):
+    '''Return literal bounds of paths that *template* can match.
+
+    Return a tuple of (prefix, suffix, count, exact, head, tail) where
+    *prefix* and *suffix* are the literal text a path must start or end with
+    and *count* the number of '/' separated segments a path must have at
+    least, or exactly if *exact* is True. *head* is a tuple of the segments
+    from the start and *tail* of the segments before the last from the end
+    that each match a whole path segment, where every placeholder is known
+    not to match '/'. Each segment is either literal text or a compiled
+    expression matching a whole segment. Any bound of None is unknown.
+
+    '''
+    pattern = template.expanded_pattern()
+    prefix, suffix = template._get_cached(
+        'literals', template._construct_literals
+    )
+    anchor = template._anchor or 0
+
+    # Inline flags in placeholder expressions can relax literals and anchors.
+    regex = template._get_cached(
+        'regex', template._construct_regular_expression
+    )
+    if regex.flags & (re.IGNORECASE | re.MULTILINE):
+        anchor = 0
+
+    if not anchor & Template.ANCHOR_START:
+        prefix = None
+
+    # An end anchor also matches before a trailing newline so suffixes ending
+    # with one cannot be compared.
+    if not anchor & Template.ANCHOR_END or suffix.endswith('\n'):
+        suffix = None
+
+    segments = None
+    if regex.flags == _DEFAULT_FLAGS:
+        segments = _construct_segments(template, pattern)
+
+    if segments is None:
+        return (prefix, suffix, None, False, None, None)
+
+    # The last segment matched from the start, or the first matched from the
+    # end, can stop part way through a path segment.
+    head = None
+    if anchor & Template.ANCHOR_START:
+        head = tuple(segments[:-1])
+
+    tail = None
+    if anchor & Template.ANCHOR_END:
+        tail = tuple(reversed(segments[1:-1]))
+
+    return (
+        prefix, suffix, len(segments), anchor == Template.ANCHOR_BOTH,
+        head, tail
+    )
+
+
+def _construct_segments(template, pattern):
+    '''Return list of '/' separated segments of *pattern* for *template*.
+
+    Each segment is literal text or a compiled expression matching a whole
+    segment. Return None if any placeholder could match '/'.
+
+    '''
+    segments = [[]]
+    for match in Template._COMPONENT_REGEX.finditer(pattern):
+        other = match.group('other')
+        if other is not None:
+            parts = other.split('/')
+            segments[-1].append(parts[0])
+            segments.extend([part] for part in parts[1:])
+            continue
+
+        expression = _PLACEHOLDER_REGEX.match(
+            match.group('placeholder')
+        ).group('expression')
+        if expression is None:
+            expression = template._default_placeholder_expression
+
+        expression = expression.replace('\{', '{').replace('\}', '}')
+        if not _excludes_separator(expression):
+            return None
+
+        # Mark placeholder expressions apart from literal text.
+        segments[-1].append((expression,))
+
+    result = []
+    for components in segments:
+        if all(not isinstance(component, tuple) for component in components):
+            result.append(''.join(components))
+            continue
+
+        expression = ''.join(
+            '(?:{0})'.format(component[0]) if isinstance(component, tuple)
+            else re.escape(component)
+            for component in components
+        )
+        try:
+            result.append(re.compile(r'(?:{0})\Z'.format(expression)))
+        except re.error:
+            return None
+
+    return result
+
+
+def _excludes_separator(expression):
+    '''Return whether regular *expression* never matches '/'.
+
+    Only expressions built from literals, character sets, repeats, groups and
+    alternatives are considered, as anchors, lookarounds and group references
+    depend on the rest of the pattern.
+
+    '''
+    try:
+        parsed = sre_parse.parse(expression)
+    except (re.error, OverflowError, RuntimeError):
+        return False
+
+    return _excludes_character(parsed, ord('/'))
+
+
+def _excludes_character(items, character):
+    '''Return whether parsed expression *items* never match *character*.'''
+    for operation, argument in items:
+        if operation == sre_constants.LITERAL:
+            if argument == character:
+                return False
+
+        elif operation == sre_constants.IN:
+            for item, value in argument:
+                if item == sre_constants.LITERAL:
+                    if value == character:
+                        return False
+
+                elif item == sre_constants.RANGE:
+                    if value[0] <= character <= value[1]:
+                        return False
+
+                elif item == sre_constants.CATEGORY:
+                    if value not in _SEPARATOR_FREE_CATEGORIES:
+                        return False
+
+                else:
+                    return False
+
+        elif operation in (
+            sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT
+        ):
+            if not _excludes_character(argument[2], character):
+                return False
+
+        elif operation == sre_constants.SUBPATTERN:
+            if not _excludes_character(argument[-1], character):
+                return False
+
+        elif operation == sre_constants.BRANCH:
+            for branch in argument[1]:
+                if not _excludes_character(branch, character):
+                    return False
+
+        else:
+            return False
+
+    return True
+
+
+def _disjoint(bounds, other_bounds):
+    '''Return whether literal bounds prove that no path can match both.
+
+    *bounds* and *other_bounds* should be as returned by
+    :func:`_construct_bounds`.
+
+    '''
+    prefix, suffix, count, exact, head, tail = bounds
+    (
+        other_prefix, other_suffix, other_count, other_exact, other_head,
+        other_tail
+    ) = other_bounds
+
+    if prefix is not None and other_prefix is not None:
+        if not (
+            prefix.startswith(other_prefix) or other_prefix.startswith(prefix)
+        ):
+            return True
+
+    if suffix is not None and other_suffix is not None:
+        if not (
+            suffix.endswith(other_suffix) or other_suffix.endswith(suffix)
+        ):
+            return True
+
+    if count is not None and other_count is not None:
+        if (
+            (exact and other_count > count) or
+            (other_exact and count > other_count)
+        ):
+            return True
+
+    for segments, other_segments in ((head, other_head), (tail, other_tail)):
+        if segments is None or other_segments is None:
+            continue
+
+        for segment, other_segment in zip(segments, other_segments):
+            if _disjoint_segments(segment, other_segment):
+                return True
+
+    return False
+
+
+def _disjoint_segments(segment, other_segment):
+    '''Return whether no path segment can match both segments.'''
+    if isinstance(segment, basestring):
+        if isinstance(other_segment, basestring):
+            return segment != other_segment
+
+        return other_segment.match(segment) is None
+
+    if isinstance(other_segment, basestring):
+        return segment.match(other_segment) is None
+
+    return False
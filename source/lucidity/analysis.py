@@ -0,0 +1,538 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Static analysis of which paths templates can match.
+
+Each template's expanded pattern, including placeholder expressions, is
+converted to an automaton recognising every path the template could match.
+Comparing automata determines whether two templates can match the same path
+and whether a template can match any path that earlier templates would not
+match first.
+
+Expressions using features that cannot be represented exactly, such as
+back references, look around assertions, anchors within placeholder
+expressions, case insensitive matching or characters outside the range 0-255,
+are reported as unknown rather than guessed at.
+
+'''
+
+import collections
+import sre_parse
+import sre_constants
+
+from lucidity.template import Template
+
+
+class Analysis(object):
+    '''Result of analysing a list of templates.
+
+    *overlapping* lists pairs of templates that can match the same path and
+    *disjoint* pairs that can never match the same path. Pairs that could not
+    be analysed are listed in *unknown*. Each pair is ordered by declaration.
+
+    *shadowed* lists ``(template, templates)`` for templates that can never
+    be the first to match a path because every path they match is matched by
+    one of the earlier declared *templates*. Templates in
+    :attr:`~lucidity.template.Template.STRICT` duplicate placeholder mode with
+    duplicate placeholders are not considered to shadow others, as their
+    matches can be rejected during a parse.
+
+    '''
+
+    def __init__(self, templates):
+        '''Initialise empty analysis of *templates*.'''
+        super(Analysis, self).__init__()
+        self.templates = list(templates)
+        self.overlapping = []
+        self.disjoint = []
+        self.unknown = []
+        self.shadowed = []
+        self._overlaps = {}
+
+    def __repr__(self):
+        '''Return unambiguous representation of analysis.'''
+        return (
+            '{0}(overlapping={1}, disjoint={2}, unknown={3}, shadowed={4})'
+            .format(
+                self.__class__.__name__, len(self.overlapping),
+                len(self.disjoint), len(self.unknown), len(self.shadowed)
+            )
+        )
+
+    def overlaps(self, template, other):
+        '''Return whether *template* and *other* can match the same path.
+
+        Return None if unknown.
+
+        '''
+        key = (id(template), id(other))
+        if key not in self._overlaps:
+            key = (id(other), id(template))
+
+        return self._overlaps[key]
+
+    def report(self):
+        '''Return human readable report of analysis.'''
+        lines = []
+
+        for title, pairs in (
+            ('Overlapping', self.overlapping), ('Unknown', self.unknown)
+        ):
+            if pairs:
+                lines.append('{0}:'.format(title))
+                for template, other in pairs:
+                    lines.append('    {0} / {1}'.format(
+                        template.name, other.name
+                    ))
+
+        if self.shadowed:
+            lines.append('Shadowed:')
+            for template, shadowing in self.shadowed:
+                lines.append('    {0} by {1}'.format(
+                    template.name,
+                    ', '.join(other.name for other in shadowing)
+                ))
+
+        lines.append(
+            '{0} overlapping, {1} disjoint, {2} unknown, {3} shadowed.'
+            .format(
+                len(self.overlapping), len(self.disjoint), len(self.unknown),
+                len(self.shadowed)
+            )
+        )
+
+        return '\n'.join(lines)
+
+
+def analyse(templates, limit=10000):
+    '''Return :class:`Analysis` of *templates* in declared order.
+
+    *limit* is the maximum number of states to explore when comparing
+    templates before giving up and reporting the result as unknown.
+
+    '''
+    templates = list(templates)
+    analysis = Analysis(templates)
+
+    automata = []
+    for template in templates:
+        try:
+            automata.append(_Automaton.from_template(template))
+        except _Unsupported:
+            automata.append(None)
+
+    # Partition symbols once so that steps are shared between comparisons.
+    symbol_sets = set()
+    for automaton in automata:
+        if automaton is not None:
+            symbol_sets.update(automaton.symbol_sets())
+
+    symbols = _partition(symbol_sets)
+
+    for position, template in enumerate(templates):
+        earlier = []
+
+        for other_position in range(position):
+            other = templates[other_position]
+            automaton = automata[position]
+            other_automaton = automata[other_position]
+
+            result = None
+            if automaton is not None and other_automaton is not None:
+                result = _search(
+                    other_automaton, automaton, _both_accept, symbols, limit
+                )
+
+            analysis._overlaps[(id(other), id(template))] = result
+            if result is None:
+                analysis.unknown.append((other, template))
+            elif result:
+                analysis.overlapping.append((other, template))
+                if _can_shadow(other):
+                    earlier.append(other_position)
+            else:
+                analysis.disjoint.append((other, template))
+
+        if earlier and automata[position] is not None:
+            union = _Automaton.union(
+                [automata[other_position] for other_position in earlier]
+            )
+            result = _search(
+                automata[position], union, _only_first, symbols, limit
+            )
+            if result is False:
+                analysis.shadowed.append((
+                    template,
+                    [templates[other_position] for other_position in earlier]
+                ))
+
+    return analysis
+
+
+def _can_shadow(template):
+    '''Return whether a match of *template* is always a successful parse.'''
+    if template.duplicate_placeholder_mode != Template.STRICT:
+        return True
+
+    segments = template._get_cached(
+        'format_segments', template._construct_format_segments
+    )
+    placeholders = [
+        placeholder for _, placeholder, _ in segments
+        if placeholder is not None
+    ]
+    return len(placeholders) == len(set(placeholders))
+
+
+def _both_accept(first, second):
+    '''Return whether both automata accept.'''
+    return first and second
+
+
+def _only_first(first, second):
+    '''Return whether only the first automaton accepts.'''
+    return first and not second
+
+
+class _Unsupported(Exception):
+    '''Raise when an expression cannot be represented by an automaton.'''
+
+
+#: Symbol representing every character outside the range 0-255.
+_OTHER = -1
+
+#: Every symbol an automaton transition can consume.
+_UNIVERSE = frozenset(list(range(256)) + [_OTHER])
+
+_NEWLINE = frozenset([ord('\n')])
+
+_DIGIT = frozenset(ord(character) for character in '0123456789')
+
+_SPACE = frozenset(ord(character) for character in ' \t\n\r\f\v')
+
+_WORD = frozenset(
+    ord(character) for character in
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'
+)
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: _DIGIT,
+    sre_constants.CATEGORY_NOT_DIGIT: _UNIVERSE - _DIGIT,
+    sre_constants.CATEGORY_SPACE: _SPACE,
+    sre_constants.CATEGORY_NOT_SPACE: _UNIVERSE - _SPACE,
+    sre_constants.CATEGORY_WORD: _WORD,
+    sre_constants.CATEGORY_NOT_WORD: _UNIVERSE - _WORD
+}
+
+#: Maximum number of copies made of a subpattern with a bounded repeat.
+_MAXIMUM_REPEAT = 100
+
+
+class _Automaton(object):
+    '''Nondeterministic automaton over character sets.'''
+
+    def __init__(self):
+        '''Initialise automaton with only a start state.'''
+        super(_Automaton, self).__init__()
+        self.transitions = []
+        self.epsilon = []
+        self.start = self.add_state()
+        self.accept = None
+        self._closures = {}
+        self._steps = {}
+
+    @classmethod
+    def from_template(cls, template):
+        '''Return automaton accepting paths that *template* can match.
+
+        Raise :exc:`_Unsupported` if the template expression cannot be
+        represented.
+
+        '''
+        expression = template._construct_expression(
+            template.expanded_pattern(), named_groups=False
+        )
+
+        try:
+            parsed = sre_parse.parse(expression)
+        except sre_constants.error:
+            raise _Unsupported()
+
+        if parsed.pattern.flags & (
+            sre_constants.SRE_FLAG_IGNORECASE | sre_constants.SRE_FLAG_LOCALE
+            | sre_constants.SRE_FLAG_MULTILINE | sre_constants.SRE_FLAG_UNICODE
+        ):
+            raise _Unsupported()
+
+        dot = _UNIVERSE
+        if not parsed.pattern.flags & sre_constants.SRE_FLAG_DOTALL:
+            dot = _UNIVERSE - _NEWLINE
+
+        automaton = cls()
+        anchor = template._anchor or 0
+
+        state = automaton.start
+        if not anchor & Template.ANCHOR_START:
+            automaton.add_transition(state, _UNIVERSE, state)
+
+        state = automaton.add_subpattern(parsed, state, dot)
+
+        accept = automaton.add_state()
+        if anchor & Template.ANCHOR_END:
+            # An end anchor also matches before a trailing newline.
+            automaton.add_epsilon(state, accept)
+            automaton.add_transition(state, _NEWLINE, accept)
+        else:
+            automaton.add_epsilon(state, accept)
+            automaton.add_transition(accept, _UNIVERSE, accept)
+
+        automaton.accept = accept
+        return automaton
+
+    @classmethod
+    def union(cls, automata):
+        '''Return automaton accepting paths accepted by any of *automata*.'''
+        automaton = cls()
+        accept = automaton.add_state()
+
+        for other in automata:
+            offset = len(automaton.transitions)
+            for transitions, epsilon in zip(other.transitions, other.epsilon):
+                automaton.transitions.append([
+                    (symbols, target + offset)
+                    for symbols, target in transitions
+                ])
+                automaton.epsilon.append([
+                    target + offset for target in epsilon
+                ])
+
+            automaton.add_epsilon(automaton.start, other.start + offset)
+            automaton.add_epsilon(other.accept + offset, accept)
+
+        automaton.accept = accept
+        return automaton
+
+    def add_state(self):
+        '''Add a new state and return it.'''
+        self.transitions.append([])
+        self.epsilon.append([])
+        return len(self.transitions) - 1
+
+    def add_transition(self, source, symbols, target):
+        '''Add transition from *source* to *target* consuming *symbols*.'''
+        self.transitions[source].append((symbols, target))
+
+    def add_epsilon(self, source, target):
+        '''Add transition from *source* to *target* consuming nothing.'''
+        self.epsilon[source].append(target)
+
+    def add_subpattern(self, subpattern, state, dot):
+        '''Add states for parsed *subpattern* following *state*.
+
+        *dot* is the set of symbols matched by any character. Return the final
+        state of the added states.
+
+        '''
+        for code, value in subpattern:
+            if code == sre_constants.LITERAL:
+                state = self._add_symbols(state, _literal(value))
+
+            elif code == sre_constants.NOT_LITERAL:
+                state = self._add_symbols(state, _UNIVERSE - _literal(value))
+
+            elif code == sre_constants.ANY:
+                state = self._add_symbols(state, dot)
+
+            elif code == sre_constants.IN:
+                state = self._add_symbols(state, _character_set(value))
+
+            elif code == sre_constants.SUBPATTERN:
+                state = self.add_subpattern(value[-1], state, dot)
+
+            elif code == sre_constants.BRANCH:
+                end = self.add_state()
+                for branch in value[1]:
+                    start = self.add_state()
+                    self.add_epsilon(state, start)
+                    self.add_epsilon(
+                        self.add_subpattern(branch, start, dot), end
+                    )
+
+                state = end
+
+            elif code in (
+                sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT
+            ):
+                state = self._add_repeat(state, value, dot)
+
+            else:
+                raise _Unsupported()
+
+        return state
+
+    def _add_symbols(self, state, symbols):
+        '''Add transition on *symbols* from *state* and return target.'''
+        target = self.add_state()
+        self.add_transition(state, symbols, target)
+        return target
+
+    def _add_repeat(self, state, value, dot):
+        '''Add states repeating a subpattern following *state*.'''
+        minimum, maximum, subpattern = value
+        unbounded = maximum == sre_constants.MAXREPEAT
+
+        if minimum > _MAXIMUM_REPEAT or (
+            not unbounded and maximum > _MAXIMUM_REPEAT
+        ):
+            raise _Unsupported()
+
+        for _ in range(minimum):
+            state = self.add_subpattern(subpattern, state, dot)
+
+        if unbounded:
+            loop = self.add_state()
+            self.add_epsilon(state, loop)
+            self.add_epsilon(self.add_subpattern(subpattern, loop, dot), loop)
+            return loop
+
+        end = self.add_state()
+        self.add_epsilon(state, end)
+        for _ in range(maximum - minimum):
+            state = self.add_subpattern(subpattern, state, dot)
+            self.add_epsilon(state, end)
+
+        return end
+
+    def closure(self, states):
+        '''Return frozenset of *states* and states reachable without input.'''
+        key = frozenset(states)
+        closure = self._closures.get(key)
+        if closure is None:
+            closure = set(states)
+            pending = list(states)
+            while pending:
+                for target in self.epsilon[pending.pop()]:
+                    if target not in closure:
+                        closure.add(target)
+                        pending.append(target)
+
+            closure = self._closures[key] = frozenset(closure)
+
+        return closure
+
+    def step(self, states, symbol):
+        '''Return closure of states reached from *states* on *symbol*.'''
+        key = (states, symbol)
+        result = self._steps.get(key)
+        if result is None:
+            result = self._steps[key] = self.closure([
+                target
+                for state in states
+                for symbols, target in self.transitions[state]
+                if symbol in symbols
+            ])
+
+        return result
+
+    def symbol_sets(self):
+        '''Return set of distinct symbol sets used by transitions.'''
+        return set(
+            symbols
+            for transitions in self.transitions
+            for symbols, _ in transitions
+        )
+
+
+def _literal(code):
+    '''Return symbols for literal character *code*.'''
+    if code > 255:
+        raise _Unsupported()
+
+    return frozenset([code])
+
+
+def _character_set(items):
+    '''Return symbols matched by parsed character set *items*.'''
+    symbols = set()
+    negate = False
+
+    for code, value in items:
+        if code == sre_constants.NEGATE:
+            negate = True
+
+        elif code == sre_constants.LITERAL:
+            symbols.update(_literal(value))
+
+        elif code == sre_constants.RANGE:
+            low, high = value
+            if high > 255:
+                raise _Unsupported()
+
+            symbols.update(range(low, high + 1))
+
+        elif code == sre_constants.CATEGORY and value in _CATEGORIES:
+            symbols.update(_CATEGORIES[value])
+
+        else:
+            raise _Unsupported()
+
+    if negate:
+        return _UNIVERSE - symbols
+
+    return frozenset(symbols)
+
+
+def _partition(symbol_sets):
+    '''Return one representative symbol for each class of equivalent symbols.
+
+    Symbols are equivalent if they belong to exactly the same *symbol_sets*.
+
+    '''
+    signatures = collections.OrderedDict()
+    symbol_sets = list(symbol_sets)
+    for symbol in sorted(_UNIVERSE):
+        signature = tuple(symbol in symbols for symbols in symbol_sets)
+        signatures.setdefault(signature, symbol)
+
+    return list(signatures.values())
+
+
+def _search(first, second, goal, symbols, limit):
+    '''Return whether a path can reach a state pair satisfying *goal*.
+
+    Both automata are determinised together, *goal* being called with whether
+    each accepts after reading a path. *symbols* should hold a representative
+    of each class of symbols that the automata treat equivalently. Return None
+    if more than *limit* state pairs would be explored.
+
+    '''
+    # A goal that requires the second automaton to accept is unreachable once
+    # it has no states.
+    requires_second = goal(True, True) and not goal(True, False)
+
+    start = (first.closure([first.start]), second.closure([second.start]))
+    seen = set([start])
+    pending = [start]
+
+    while pending:
+        first_states, second_states = pending.pop()
+        if goal(first.accept in first_states, second.accept in second_states):
+            return True
+
+        for symbol in symbols:
+            pair = (
+                first.step(first_states, symbol),
+                second.step(second_states, symbol)
+            )
+            if not pair[0] or (requires_second and not pair[1]):
+                continue
+
+            if pair not in seen:
+                if len(seen) >= limit:
+                    return None
+
+                seen.add(pair)
+                pending.append(pair)
+
+    return False
@@ -0,0 +1,189 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Persistent cache of regular expressions constructed for templates.
+
+When a cache is enabled, :py:class:`~lucidity.template.Template` stores the
+regular expression constructed for each pattern in it, keyed by a hash of the
+pattern, anchor and default placeholder expression. A template whose key is
+found in the cache skips pattern processing, and the validation compile on
+construction, entirely. Its expression is compiled on first use instead.
+
+Enable a cache with :func:`enable` or by setting the environment variable
+:envvar:`LUCIDITY_COMPILED_CACHE_PATH` to the path of the cache file before
+importing :mod:`lucidity`. The file holds JSON so that loading a cache
+written by someone else, such as one shared between users, cannot run code.
+
+'''
+
+import os
+import json
+import errno
+import atexit
+import hashlib
+import tempfile
+
+from lucidity._version import __version__
+
+
+class CompiledCache(object):
+    '''Cache of constructed regular expressions persisted to a file.'''
+
+    def __init__(self, path):
+        '''Initialise cache stored at *path*.
+
+        Existing entries are loaded from *path* on first access. A missing,
+        unreadable or incompatible file is treated as an empty cache.
+
+        '''
+        super(CompiledCache, self).__init__()
+        self.path = path
+        self._entries = None
+        self._modified = False
+
+    def __repr__(self):
+        '''Return unambiguous representation of cache.'''
+        return '{0}(path={1!r})'.format(self.__class__.__name__, self.path)
+
+    @staticmethod
+    def key(pattern, anchor, default_placeholder_expression):
+        '''Return key for entry representing template settings.'''
+        identity = repr((
+            pattern, anchor, default_placeholder_expression
+        )).encode('utf-8')
+
+        return hashlib.sha1(identity).hexdigest()
+
+    def get(self, key, default=None):
+        '''Return value stored for *key* or *default* if not present.'''
+        return self._get_entries().get(key, default)
+
+    def set(self, key, value):
+        '''Store *value* for *key*.'''
+        entries = self._get_entries()
+        if entries.get(key) != value:
+            entries[key] = value
+            self._modified = True
+
+    def load(self):
+        '''Load entries from file, discarding any unsaved entries.'''
+        self._entries = {}
+        self._modified = False
+
+        try:
+            with open(self.path, 'rb') as stream:
+                data = json.load(stream)
+        except (IOError, OSError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get('version') != __version__:
+            return
+
+        entries = data.get('entries')
+        if not isinstance(entries, dict):
+            return
+
+        self._entries = dict(
+            (_to_native(key), _to_native(value))
+            for key, value in entries.items()
+            if isinstance(value, basestring)
+        )
+
+    def save(self):
+        '''Write entries to file if modified since last load or save.
+
+        The file is replaced atomically so that concurrent processes never read
+        a partially written cache.
+
+        '''
+        if not self._modified:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+        handle, temporary_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, 'w') as stream:
+                json.dump(
+                    {'version': __version__, 'entries': self._entries}, stream
+                )
+
+            if os.name == 'nt' and os.path.exists(self.path):
+                os.remove(self.path)
+
+            os.rename(temporary_path, self.path)
+
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        self._modified = False
+
+    def _get_entries(self):
+        '''Return entries, loading them from file if not yet loaded.'''
+        if self._entries is None:
+            self.load()
+
+        return self._entries
+
+
+def _to_native(text):
+    '''Return *text* loaded from JSON as a native string.'''
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+
+    return text
+
+
+#: Cache consulted by templates or None if disabled.
+_active = None
+
+
+def get_active():
+    '''Return enabled :class:`CompiledCache` or None if disabled.'''
+    return _active
+
+
+def enable(path=None, save_on_exit=True):
+    '''Enable cache stored at *path* and return it.
+
+    If *path* is not specified use the value of environment variable
+    :envvar:`LUCIDITY_COMPILED_CACHE_PATH`, falling back to a file in the
+    user's home directory.
+
+    If *save_on_exit* is True then the cache is saved when the interpreter
+    exits. Otherwise call :meth:`CompiledCache.save` as required.
+
+    '''
+    global _active
+
+    if path is None:
+        path = os.environ.get(
+            'LUCIDITY_COMPILED_CACHE_PATH',
+            os.path.join(
+                os.path.expanduser('~'), '.lucidity', 'compiled_cache'
+            )
+        )
+
+    _active = CompiledCache(path)
+    if save_on_exit:
+        atexit.register(_active.save)
+
+    return _active
+
+
+def disable():
+    '''Disable cache so templates construct expressions from scratch.'''
+    global _active
+    _active = None
+
+
+if os.environ.get('LUCIDITY_COMPILED_CACHE_PATH'):
+    enable()
@@ -0,0 +1,253 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Declarative template definition files.
+
+A definition file describes templates as data, without executing code, so it
+can be used in place of a Python mount point. Files named with
+:data:`EXTENSION` are loaded by :func:`lucidity.discover_templates`. The file
+holds a JSON object with a list of templates, each with a name and pattern
+and optionally the other arguments accepted by
+:py:class:`~lucidity.template.Template`::
+
+    {
+        "templates": [
+            {"name": "job", "pattern": "/jobs/{job.code}"},
+            {
+                "name": "shot",
+                "pattern": "{@job}/shots/{scene.code}_{shot.code}",
+                "anchor": "both",
+                "default_placeholder_expression": "[^/]+",
+                "duplicate_placeholder_mode": "strict"
+            }
+        ]
+    }
+
+*anchor* is one of 'start' (the default), 'end', 'both' or null and
+*duplicate_placeholder_mode* one of 'relaxed' (the default) or 'strict'.
+Templates in the same file share a :class:`~lucidity.registry.Registry` as
+their template resolver so can reference each other.
+
+Call :func:`precompile` to write a sidecar file, named with
+:data:`SIDECAR_EXTENSION` appended, holding the validated templates in a
+binary form. :func:`load` uses the sidecar, skipping parsing and validation,
+for as long as the definition file is unchanged.
+
+'''
+
+import os
+import json
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from lucidity._version import __version__
+from lucidity.template import Template
+from lucidity.registry import Registry
+import lucidity.error
+
+
+#: Suffix of definition file names.
+EXTENSION = '.lucidity.json'
+
+#: Suffix appended to a definition file path to name its sidecar file.
+SIDECAR_EXTENSION = '.cache'
+
+#: Values accepted for the 'anchor' of a template definition.
+ANCHORS = {
+    'start': Template.ANCHOR_START,
+    'end': Template.ANCHOR_END,
+    'both': Template.ANCHOR_BOTH,
+    None: None
+}
+
+#: Values accepted for the 'duplicate_placeholder_mode' of a template
+#: definition.
+DUPLICATE_PLACEHOLDER_MODES = {
+    'relaxed': Template.RELAXED,
+    'strict': Template.STRICT
+}
+
+
+def load(path, use_sidecar=True):
+    '''Return list of templates defined in file at *path*.
+
+    If *use_sidecar* is True and a sidecar file written by :func:`precompile`
+    is current for the file then load templates from it instead.
+
+    Raise :exc:`ValueError` if the file is not a valid definition or defines
+    an invalid template.
+
+    '''
+    if use_sidecar:
+        templates = _load_sidecar(path)
+        if templates is not None:
+            return templates
+
+    with open(path, 'rb') as stream:
+        return parse(stream.read(), path)
+
+
+def parse(text, path='<string>'):
+    '''Return list of templates defined by JSON *text*.
+
+    *path* identifies the source of *text* in error messages.
+
+    Raise :exc:`ValueError` if *text* is not a valid definition or defines
+    an invalid template.
+
+    '''
+    try:
+        data = json.loads(text)
+    except ValueError as error:
+        raise ValueError(
+            'Invalid template definition {0!r}: {1}'.format(path, error)
+        )
+
+    if not isinstance(data, dict) or not isinstance(
+        data.get('templates'), list
+    ):
+        raise ValueError(
+            'Invalid template definition {0!r}: expected an object with a '
+            'list of templates.'.format(path)
+        )
+
+    registry = Registry()
+    templates = []
+    for definition in data['templates']:
+        template = _construct_template(definition, registry, path)
+        registry.add(template)
+        templates.append(template)
+
+    # Check patterns and references once all templates are registered.
+    for template in templates:
+        try:
+            template._get_cached(
+                'regex', template._construct_regular_expression
+            )
+        except (ValueError, lucidity.error.ResolveError) as error:
+            raise ValueError(
+                'Invalid template definition {0!r}: template {1!r} is '
+                'invalid: {2}'.format(path, template.name, error)
+            )
+
+    return templates
+
+
+def precompile(path):
+    '''Write sidecar file for definition file at *path* and return its path.
+
+    The sidecar holds the validated templates so that :func:`load` can skip
+    parsing and validating the definition. It is ignored once the definition
+    file is modified.
+
+    Raise :exc:`ValueError` if the file is not a valid definition.
+
+    '''
+    stat = os.stat(path)
+    templates = load(path, use_sidecar=False)
+
+    sidecar_path = path + SIDECAR_EXTENSION
+    handle, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(sidecar_path))
+    )
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            pickle.dump(
+                (__version__, (stat.st_mtime, stat.st_size), templates),
+                stream, pickle.HIGHEST_PROTOCOL
+            )
+
+        if os.name == 'nt' and os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+
+        os.rename(temporary_path, sidecar_path)
+
+    except Exception:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    return sidecar_path
+
+
+def _load_sidecar(path):
+    '''Return templates from current sidecar for *path* or None.
+
+    A missing, unreadable, incompatible or outdated sidecar returns None.
+
+    '''
+    try:
+        stat = os.stat(path)
+        with open(path + SIDECAR_EXTENSION, 'rb') as stream:
+            version, key, templates = pickle.load(stream)
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+
+    if version != __version__ or key != (stat.st_mtime, stat.st_size):
+        return None
+
+    return templates
+
+
+def _construct_template(definition, registry, path):
+    '''Return template for *definition* resolving references in *registry*.
+
+    *path* identifies the source of *definition* in error messages.
+
+    '''
+    def invalid(message):
+        return ValueError(
+            'Invalid template definition {0!r}: {1}'.format(path, message)
+        )
+
+    if not isinstance(definition, dict):
+        raise invalid('expected an object for each template.')
+
+    arguments = dict(definition)
+    try:
+        name = arguments.pop('name')
+        pattern = arguments.pop('pattern')
+    except KeyError as error:
+        raise invalid('template is missing {0}.'.format(error))
+
+    if 'anchor' in arguments:
+        try:
+            arguments['anchor'] = ANCHORS[arguments['anchor']]
+        except (KeyError, TypeError):
+            raise invalid('template {0!r} has unknown anchor {1!r}.'.format(
+                name, arguments['anchor']
+            ))
+
+    if 'duplicate_placeholder_mode' in arguments:
+        try:
+            arguments['duplicate_placeholder_mode'] = (
+                DUPLICATE_PLACEHOLDER_MODES[
+                    arguments['duplicate_placeholder_mode']
+                ]
+            )
+        except (KeyError, TypeError):
+            raise invalid(
+                'template {0!r} has unknown duplicate placeholder mode '
+                '{1!r}.'.format(name, arguments['duplicate_placeholder_mode'])
+            )
+
+    unknown = set(arguments) - set([
+        'anchor', 'default_placeholder_expression',
+        'duplicate_placeholder_mode'
+    ])
+    if unknown:
+        raise invalid('template {0!r} has unknown fields {1}.'.format(
+            name, ', '.join(sorted(unknown))
+        ))
+
+    # Validation happens once all templates in the file are registered so
+    # that references can be resolved.
+    return Template(
+        name, pattern, template_resolver=registry, lazy=True, **arguments
+    )
@@ -0,0 +1,278 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Opt-in instrumentation of parse and format operations.
+
+Call :func:`enable` to start collecting :class:`Statistics` and optionally
+notify a callback of each operation. While disabled (the default) the
+operations are the original, uninstrumented, functions so there is no
+overhead. Enabling replaces :meth:`Template.parse
+<lucidity.template.Template.parse>`, :meth:`Template.format
+<lucidity.template.Template.format>`, :func:`lucidity.parse`,
+:func:`lucidity.format` and the matching used by
+:class:`~lucidity.template_set.TemplateSet` with instrumented versions.
+
+.. note::
+
+    Functions imported directly, such as with ``from lucidity import parse``,
+    before enabling are not instrumented. Neither are operations performed
+    in worker processes by :func:`lucidity.parse_many`.
+
+'''
+
+import functools
+import timeit
+
+import lucidity
+import lucidity.error
+from lucidity.template import Template
+from lucidity.template_set import TemplateSet
+
+
+class Counters(object):
+    '''Counts and cumulative time of an operation.'''
+
+    __slots__ = ('attempts', 'hits', 'misses', 'time')
+
+    def __init__(self):
+        '''Initialise counters at zero.'''
+        self.attempts = 0
+        self.hits = 0
+        self.misses = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        '''Return unambiguous representation of counters.'''
+        return (
+            '{0}(attempts={1}, hits={2}, misses={3}, time={4:.6f})'.format(
+                self.__class__.__name__, self.attempts, self.hits,
+                self.misses, self.time
+            )
+        )
+
+    @property
+    def hit_rate(self):
+        '''Return proportion of attempts that were hits.'''
+        if not self.attempts:
+            return 0.0
+
+        return float(self.hits) / self.attempts
+
+    def record(self, hit, duration):
+        '''Record an attempt that was a *hit* and took *duration* seconds.'''
+        self.attempts += 1
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        self.time += duration
+
+
+class Statistics(object):
+    '''Statistics collected while instrumentation is enabled.
+
+    *parse* and *format* map each :class:`~lucidity.template.Template` to
+    :class:`Counters` for that operation. Matches made by a
+    :class:`~lucidity.template_set.TemplateSet` are recorded as a hit against
+    the matching template without recording misses for the templates it
+    ruled out.
+
+    *parse_all* and *format_all* hold :class:`Counters` for operations
+    against multiple templates, such as :func:`lucidity.parse`. Misses count
+    paths or data that no template could handle.
+
+    '''
+
+    def __init__(self):
+        '''Initialise empty statistics.'''
+        super(Statistics, self).__init__()
+        self.parse = {}
+        self.format = {}
+        self.parse_all = Counters()
+        self.format_all = Counters()
+
+    def templates_by_hit_rate(self, operation='parse'):
+        '''Return list of ``(template, counters)`` for *operation*.
+
+        Templates are sorted by descending hit rate, then descending hits.
+
+        '''
+        counters = getattr(self, operation)
+        return sorted(
+            counters.items(),
+            key=lambda item: (-item[1].hit_rate, -item[1].hits)
+        )
+
+
+#: Functions replaced while instrumentation enabled, stored against the owner
+#: and attribute name they were retrieved from.
+_ORIGINALS = {
+    (Template, 'parse'): Template.__dict__['parse'],
+    (Template, 'format'): Template.__dict__['format'],
+    (TemplateSet, '_parse'): TemplateSet.__dict__['_parse'],
+    (lucidity, 'parse'): lucidity.parse,
+    (lucidity, 'format'): lucidity.format
+}
+
+_statistics = None
+_callback = None
+_last_hit = None
+_timer = timeit.default_timer
+
+
+def enable(callback=None):
+    '''Enable instrumentation and return new :class:`Statistics`.
+
+    If *callback* is specified it will be called after each operation with
+    ``(operation, template, value, result, duration)``. *operation* is one of
+    'template.parse', 'template.format', 'parse' or 'format'. *template* is
+    the template used, or None for 'parse' and 'format' operations that no
+    template could handle. *value* is the path or data passed in and *result*
+    the data or path produced, or None on failure. *duration* is the time
+    taken in seconds.
+
+    Calling again resets statistics and replaces the callback.
+
+    '''
+    global _statistics, _callback
+
+    _statistics = Statistics()
+    _callback = callback
+
+    Template.parse = _instrument_template(
+        _ORIGINALS[(Template, 'parse')], 'parse', lucidity.error.ParseError
+    )
+    Template.format = _instrument_template(
+        _ORIGINALS[(Template, 'format')], 'format', lucidity.error.FormatError
+    )
+    TemplateSet._parse = _instrument_template_set(
+        _ORIGINALS[(TemplateSet, '_parse')]
+    )
+    lucidity.parse = _instrument_collection(
+        _ORIGINALS[(lucidity, 'parse')], 'parse', lucidity.error.ParseError
+    )
+    lucidity.format = _instrument_collection(
+        _ORIGINALS[(lucidity, 'format')], 'format', lucidity.error.FormatError
+    )
+
+    return _statistics
+
+
+def disable():
+    '''Disable instrumentation, restoring original functions.
+
+    Return :class:`Statistics` collected while enabled or None if not enabled.
+
+    '''
+    global _statistics, _callback
+
+    for (owner, name), original in _ORIGINALS.items():
+        setattr(owner, name, original)
+
+    statistics = _statistics
+    _statistics = None
+    _callback = None
+
+    return statistics
+
+
+def get_statistics():
+    '''Return :class:`Statistics` being collected or None if not enabled.'''
+    return _statistics
+
+
+def _notify(operation, template, value, result, duration):
+    '''Call callback, if set, with operation details.'''
+    if _callback is not None:
+        _callback(operation, template, value, result, duration)
+
+
+def _counters(operation, template):
+    '''Return counters for *operation* and *template*, creating if needed.'''
+    counters = getattr(_statistics, operation)
+    try:
+        return counters[template]
+    except KeyError:
+        counters[template] = Counters()
+        return counters[template]
+
+
+def _instrument_template(function, operation, error):
+    '''Return instrumented version of template *operation* *function*.'''
+    @functools.wraps(function)
+    def instrumented(self, value):
+        global _last_hit
+
+        start = _timer()
+        try:
+            result = function(self, value)
+        except error:
+            duration = _timer() - start
+            _counters(operation, self).record(False, duration)
+            _notify('template.' + operation, self, value, None, duration)
+            raise
+
+        duration = _timer() - start
+        _counters(operation, self).record(True, duration)
+        _notify('template.' + operation, self, value, result, duration)
+        _last_hit = self
+
+        return result
+
+    return instrumented
+
+
+def _instrument_template_set(function):
+    '''Return instrumented version of template set match *function*.'''
+    @functools.wraps(function)
+    def instrumented(self, path):
+        global _last_hit
+        _last_hit = None
+
+        start = _timer()
+        result = function(self, path)
+        duration = _timer() - start
+
+        _statistics.parse_all.record(result is not None, duration)
+        if result is None:
+            _notify('parse', None, path, None, duration)
+        else:
+            # Templates that cannot be combined are parsed individually so
+            # will already have recorded the hit.
+            if result[1] is not _last_hit:
+                _counters('parse', result[1]).record(True, duration)
+            _notify('parse', result[1], path, result[0], duration)
+
+        return result
+
+    return instrumented
+
+
+def _instrument_collection(function, operation, error):
+    '''Return instrumented version of module level *operation* *function*.'''
+    @functools.wraps(function)
+    def instrumented(value, templates):
+        # Template sets record their own statistics.
+        if isinstance(templates, TemplateSet):
+            return function(value, templates)
+
+        counters = getattr(_statistics, operation + '_all')
+
+        start = _timer()
+        try:
+            result, template = function(value, templates)
+        except error:
+            duration = _timer() - start
+            counters.record(False, duration)
+            _notify(operation, None, value, None, duration)
+            raise
+
+        duration = _timer() - start
+        counters.record(True, duration)
+        _notify(operation, template, value, result, duration)
+
+        return (result, template)
+
+    return instrumented
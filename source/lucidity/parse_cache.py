@@ -0,0 +1,161 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Bounded cache of parse results for repeatedly parsed paths.
+
+When a cache is enabled with :func:`enable`,
+:meth:`Template.parse <lucidity.template.Template.parse>`,
+:class:`~lucidity.template_set.TemplateSet` and :func:`lucidity.parse` store
+the result of parsing each path, including failures, and return the stored
+result when the same path is parsed again. The least recently used results
+are discarded once the cache is full.
+
+Results are keyed by template or template set together with a revision
+that changes whenever its compiled state is rebuilt, such as after
+:meth:`TemplateSet.refresh <lucidity.template_set.TemplateSet.refresh>`, so
+stale results are never returned. Parsing against a list of templates stores
+a result for each template tried whereas a template set stores a single
+result for the set as a whole. Each caller receives its own copy of the
+extracted data so that modifying it does not affect the cache.
+
+'''
+
+import threading
+
+
+class ParseCache(object):
+    '''Least recently used cache of parse results.'''
+
+    def __init__(self, size=1024):
+        '''Initialise empty cache holding at most *size* results.'''
+        super(ParseCache, self).__init__()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # Circular doubly linked list of [previous, next, key, value] links
+        # from least to most recently used, starting after the root link.
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __repr__(self):
+        '''Return unambiguous representation of cache.'''
+        return '{0}(size={1!r})'.format(self.__class__.__name__, self.size)
+
+    def __len__(self):
+        '''Return number of results stored.'''
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        '''Return value stored for *key* or *default* if not present.
+
+        Mark the value as most recently used and count a hit or miss.
+
+        '''
+        with self._lock:
+            link = self._entries.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+
+            self._move_to_end(link)
+            self.hits += 1
+
+            return link[3]
+
+    def set(self, key, value):
+        '''Store *value* for *key*, discarding least recently used values.'''
+        with self._lock:
+            link = self._entries.get(key)
+            if link is not None:
+                link[3] = value
+                self._move_to_end(link)
+                return
+
+            root = self._root
+            last = root[0]
+            link = [last, root, key, value]
+            last[1] = root[0] = self._entries[key] = link
+
+            while len(self._entries) > self.size:
+                oldest = root[1]
+                root[1] = oldest[1]
+                oldest[1][0] = root
+                del self._entries[oldest[2]]
+
+    def clear(self):
+        '''Discard all stored values and reset statistics.'''
+        with self._lock:
+            self._entries.clear()
+            self._root[:] = [self._root, self._root, None, None]
+            self.hits = 0
+            self.misses = 0
+
+    def _move_to_end(self, link):
+        '''Move *link* to the most recently used end of the list.'''
+        previous, following = link[0], link[1]
+        previous[1] = following
+        following[0] = previous
+
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+
+
+def snapshot(data):
+    '''Return value to store in a cache for parsed *data*.
+
+    The value records which keys hold nested dictionaries so that
+    :func:`restore` can copy *data* without inspecting every value.
+
+    '''
+    return (data, _nested_keys(data))
+
+
+def restore(value):
+    '''Return copy of parsed data from *value* created by :func:`snapshot`.'''
+    return _copy(*value)
+
+
+def _nested_keys(data):
+    '''Return tuple of ``(key, nested)`` for nested dictionaries in *data*.'''
+    return tuple(
+        (key, _nested_keys(value)) for key, value in data.items()
+        if isinstance(value, dict)
+    )
+
+
+def _copy(data, nested):
+    '''Return copy of *data* and the nested dictionaries under *nested*.'''
+    copied = data.copy()
+    for key, value in nested:
+        copied[key] = _copy(data[key], value)
+
+    return copied
+
+
+#: Cache consulted during parsing or None if disabled.
+_active = None
+
+
+def get_active():
+    '''Return enabled :class:`ParseCache` or None if disabled.'''
+    return _active
+
+
+def enable(size=1024):
+    '''Enable cache holding at most *size* results and return it.'''
+    global _active
+    _active = ParseCache(size)
+    return _active
+
+
+def disable():
+    '''Disable cache so that every path is parsed.'''
+    global _active
+    _active = None
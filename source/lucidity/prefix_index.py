@@ -0,0 +1,141 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import re
+
+from lucidity.template import Template
+
+
+class PrefixIndex(object):
+    '''Index of templates by the literal text a matching path must contain.
+
+    Templates anchored at the start of a path are indexed by the static text
+    before their first placeholder and templates anchored at the end by the
+    static text after their last placeholder. Looking up a path then returns
+    only the templates that could possibly match it, in declared order.
+
+    '''
+
+    def __init__(self, templates):
+        '''Initialise index from *templates*.
+
+        *templates* should be a list of :py:class:`~lucidity.template.Template`
+        instances. Their expanded patterns are read once on construction so
+        the index should be rebuilt if template references change.
+
+        '''
+        super(PrefixIndex, self).__init__()
+        self._templates = list(templates)
+        self._prefixes = _Trie()
+        self._suffixes = _Trie()
+
+        for position, template in enumerate(self._templates):
+            prefix, suffix = template._get_cached(
+                'literals', template._construct_literals
+            )
+            anchor = template._anchor or 0
+
+            # Inline flags in placeholder expressions can relax literals and
+            # anchors so such templates are always candidates.
+            regex = template._get_cached(
+                'regex', template._construct_regular_expression
+            )
+            if regex.flags & (re.IGNORECASE | re.MULTILINE):
+                anchor = 0
+
+            if not anchor & Template.ANCHOR_START:
+                prefix = ''
+
+            if not anchor & Template.ANCHOR_END:
+                suffix = ''
+
+            self._prefixes.add(prefix, position)
+            self._suffixes.add(suffix[::-1], position)
+
+    def lookup(self, path):
+        '''Return positions of templates that could match *path*.
+
+        The positions index into the templates the index was constructed from
+        and are returned as a sorted tuple.
+
+        '''
+        candidates = self._prefixes.find(path)
+
+        if self._suffixes.depth:
+            suffixed = self._suffixes.find(path[::-1])
+
+            # An end anchor also matches before a trailing newline.
+            if path.endswith('\n'):
+                suffixed.extend(self._suffixes.find(path[-2::-1]))
+
+            suffixed = set(suffixed)
+            candidates = [
+                position for position in candidates if position in suffixed
+            ]
+
+        return tuple(sorted(candidates))
+
+    def candidates(self, path):
+        '''Return templates that could match *path* in declared order.'''
+        return [self._templates[position] for position in self.lookup(path)]
+
+    def could_match_prefix(self, prefix):
+        '''Return whether any template could match a path starting *prefix*.
+
+        This is always True when a template is not anchored at the start or
+        has no literal prefix.
+
+        '''
+        return self._prefixes.could_extend(prefix)
+
+
+class _Trie(object):
+    '''Character trie mapping keys to lists of values.'''
+
+    def __init__(self):
+        '''Initialise empty trie.'''
+        super(_Trie, self).__init__()
+        self._root = ({}, [])
+
+        #: Length of longest key added.
+        self.depth = 0
+
+    def add(self, key, value):
+        '''Add *value* against *key*.'''
+        node = self._root
+        for character in key:
+            node = node[0].setdefault(character, ({}, []))
+
+        node[1].append(value)
+        self.depth = max(self.depth, len(key))
+
+    def could_extend(self, key):
+        '''Return whether a key added could start with or prefix *key*.'''
+        node = self._root
+        if node[1]:
+            return True
+
+        for character in key:
+            node = node[0].get(character)
+            if node is None:
+                return False
+
+            if node[1]:
+                return True
+
+        return True
+
+    def find(self, key):
+        '''Return list of values added against any prefix of *key*.'''
+        node = self._root
+        values = list(node[1])
+
+        for character in key:
+            node = node[0].get(character)
+            if node is None:
+                break
+
+            values.extend(node[1])
+
+        return values
@@ -0,0 +1,200 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Compact representation of data parsed from a path.
+
+A :class:`Record` stores only the values extracted for each placeholder, in a
+tuple, and shares the names of those placeholders with every other record
+parsed by templates with the same placeholders. Nested dictionaries are only
+created when requested.
+
+'''
+
+
+class Record(tuple):
+    '''Data parsed from a path, stored as a tuple of placeholder values.
+
+    Records support the same read only mapping access as the dictionaries
+    returned by :meth:`Template.parse <lucidity.template.Template.parse>`,
+    with nested keys returned as new dictionaries::
+
+        >>> record = template.parse_record('/jobs/monty/sh010')
+        >>> record['job']
+        {'code': 'monty'}
+
+    Values can also be read by full placeholder name, such as
+    ``record['job.code']``, or as attributes by top level key, such as
+    ``record.shot``. Use :meth:`to_dict` to convert to a dictionary.
+
+    .. note::
+
+        Attributes of records take precedence over keys of the same name, so
+        keys such as 'index', 'count', 'keys', 'values', 'items', 'get',
+        'fields' or 'to_dict' cannot be read as attributes. Read them with
+        ``record[key]``, which always returns the value.
+
+    Records are created by a subclass specific to each set of placeholder
+    names, see :func:`get_type`.
+
+    '''
+
+    __slots__ = ()
+
+    #: Placeholder names in the order their values are stored.
+    _fields = ()
+
+    #: Mapping of placeholder name to position of its value.
+    _positions = {}
+
+    #: Mapping of top level key to position of its value or a tuple of
+    #: ``(key, node)`` describing a nested dictionary.
+    _tree = {}
+
+    def __reduce__(self):
+        '''Return state for copying and pickling.'''
+        return (_restore, (self._fields, tuple(tuple.__iter__(self))))
+
+    def __repr__(self):
+        '''Return unambiguous representation of record.'''
+        return 'Record({0!r})'.format(self.to_dict())
+
+    def __getitem__(self, key):
+        '''Return value for top level *key* or full placeholder name.'''
+        node = self._tree.get(key)
+        if node is None:
+            position = self._positions.get(key)
+            if position is None:
+                raise KeyError(key)
+
+            return tuple.__getitem__(self, position)
+
+        return self._materialise(node)
+
+    def __getattr__(self, name):
+        '''Return value for top level key *name*.
+
+        Only called for names that are not attributes of the record.
+
+        '''
+        node = self._tree.get(name)
+        if node is None:
+            raise AttributeError(name)
+
+        return self._materialise(node)
+
+    def __iter__(self):
+        '''Iterate over top level keys.'''
+        return iter(self._tree)
+
+    def __len__(self):
+        '''Return number of top level keys.'''
+        return len(self._tree)
+
+    def __contains__(self, key):
+        '''Return whether *key* is a top level key or placeholder name.'''
+        return key in self._tree or key in self._positions
+
+    def __eq__(self, other):
+        '''Return whether data equals *other* record or dictionary.'''
+        if isinstance(other, Record):
+            other = other.to_dict()
+
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        '''Return whether data does not equal *other*.'''
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def keys(self):
+        '''Return list of top level keys.'''
+        return list(self._tree)
+
+    def values(self):
+        '''Return list of values for top level keys.'''
+        return [self._materialise(node) for node in self._tree.values()]
+
+    def items(self):
+        '''Return list of ``(key, value)`` for top level keys.'''
+        return [
+            (key, self._materialise(node)) for key, node in self._tree.items()
+        ]
+
+    def get(self, key, default=None):
+        '''Return value for *key* or *default* if not present.'''
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def fields(self):
+        '''Return list of ``(placeholder name, value)`` in stored order.'''
+        return list(zip(self._fields, tuple.__iter__(self)))
+
+    def to_dict(self):
+        '''Return data as nested dictionaries.'''
+        return dict(
+            (key, self._materialise(node)) for key, node in self._tree.items()
+        )
+
+    def _materialise(self, node):
+        '''Return value or new nested dictionary described by *node*.'''
+        if isinstance(node, tuple):
+            return dict(
+                (key, self._materialise(child)) for key, child in node
+            )
+
+        return tuple.__getitem__(self, node)
+
+
+#: Record types created for each tuple of placeholder names.
+_TYPES = {}
+
+
+def get_type(fields):
+    '''Return :class:`Record` subclass storing values for *fields*.
+
+    *fields* should be a tuple of placeholder names, with periods separating
+    nested keys. The same subclass is returned for equal *fields*.
+
+    '''
+    record_type = _TYPES.get(fields)
+    if record_type is None:
+        tree = {}
+        for position, field in enumerate(fields):
+            target = tree
+            parts = field.split('.')
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+
+            target[parts[-1]] = position
+
+        record_type = _TYPES[fields] = type('Record', (Record,), {
+            '__slots__': (),
+            '_fields': fields,
+            '_positions': dict(
+                (field, position) for position, field in enumerate(fields)
+            ),
+            '_tree': dict(
+                (key, _freeze(node)) for key, node in tree.items()
+            )
+        })
+
+    return record_type
+
+
+def _freeze(node):
+    '''Return nested dictionary *node* as nested tuples of ``(key, node)``.'''
+    if isinstance(node, dict):
+        return tuple(
+            (key, _freeze(child)) for key, child in sorted(node.items())
+        )
+
+    return node
+
+
+def _restore(fields, values):
+    '''Return record for *fields* holding *values*.'''
+    return get_type(fields)(values)
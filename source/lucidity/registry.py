@@ -0,0 +1,128 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+from collections import OrderedDict, defaultdict
+
+import lucidity.error
+from lucidity.template import Resolver
+
+
+class Registry(Resolver):
+    '''Collection of templates indexed by name.
+
+    A registry conforms to the :class:`~lucidity.template.Resolver` interface
+    so can be set as the *template_resolver* of the templates it holds. It
+    also tracks which templates reference which, so that templates depending
+    on a replaced or removed template are invalidated.
+
+    Iterating over a registry yields templates in the order they were first
+    added, so it can be used wherever a list of templates is accepted.
+
+    '''
+
+    def __init__(self, templates=None):
+        '''Initialise registry with *templates*.'''
+        super(Registry, self).__init__()
+        self._templates = OrderedDict()
+        self._dependents = defaultdict(set)
+
+        for template in templates or []:
+            self.add(template)
+
+    def __repr__(self):
+        '''Return unambiguous representation of registry.'''
+        return '{0}({1!r})'.format(
+            self.__class__.__name__, list(self._templates.values())
+        )
+
+    def __iter__(self):
+        '''Iterate over templates in order added.'''
+        return iter(list(self._templates.values()))
+
+    def __len__(self):
+        '''Return number of templates.'''
+        return len(self._templates)
+
+    def __contains__(self, template_name):
+        '''Return whether template with *template_name* is registered.'''
+        return template_name in self._templates
+
+    def get(self, template_name, default=None):
+        '''Return template that matches *template_name*.
+
+        If no template matches then return *default*.
+
+        '''
+        return self._templates.get(template_name, default)
+
+    def add(self, template):
+        '''Add *template*, replacing any template with the same name.
+
+        Templates that reference a replaced template, directly or indirectly,
+        are invalidated so that they resolve the new template on next use.
+
+        '''
+        name = template.name
+        if name in self._templates:
+            self._unlink(self._templates[name])
+            self._invalidate(name)
+
+        self._templates[name] = template
+        for reference in template.references():
+            self._dependents[reference].add(name)
+
+    def remove(self, template_name):
+        '''Remove template with *template_name* and return it.
+
+        Templates that referenced it are invalidated.
+
+        Raise :py:exc:`~lucidity.error.NotFound` if no matching template.
+
+        '''
+        try:
+            template = self._templates.pop(template_name)
+        except KeyError:
+            raise lucidity.error.NotFound(
+                '{0} template not found in registry.'.format(template_name)
+            )
+
+        self._unlink(template)
+        self._invalidate(template_name)
+
+        return template
+
+    def dependents(self, template_name):
+        '''Return names of templates that reference *template_name*.
+
+        Includes templates that reference it indirectly through other
+        templates.
+
+        '''
+        dependents = set()
+        pending = [template_name]
+
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in dependents:
+                    dependents.add(dependent)
+                    pending.append(dependent)
+
+        dependents.discard(template_name)
+        return dependents
+
+    def _unlink(self, template):
+        '''Remove reference edges recorded for *template*.'''
+        for reference in template.references():
+            dependents = self._dependents.get(reference)
+            if dependents is not None:
+                dependents.discard(template.name)
+                if not dependents:
+                    del self._dependents[reference]
+
+    def _invalidate(self, template_name):
+        '''Discard cached state of templates depending on *template_name*.'''
+        for dependent in self.dependents(template_name):
+            template = self._templates.get(dependent)
+            if template is not None:
+                template._clear_cache()
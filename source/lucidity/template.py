@@ -5,10 +5,15 @@
 import abc
 import sys
 import re
+import operator
 import functools
-from collections import defaultdict
+import itertools
+from collections import defaultdict, Mapping
 
 import lucidity.error
+import lucidity.compiled_cache
+import lucidity.parse_cache
+import lucidity.record
 
 # Type of a RegexObject for isinstance check.
 _RegexType = type(re.compile(''))
@@ -20,15 +25,24 @@ class Template(object):
     _STRIP_EXPRESSION_REGEX = re.compile(r'{(.+?)(:(\\}|.)+?)}')
     _PLAIN_PLACEHOLDER_REGEX = re.compile(r'{(.+?)}')
     _TEMPLATE_REFERENCE_REGEX = re.compile(r'{@(?P<reference>.+?)}')
+    # Literal text can include newlines whereas placeholders are found in
+    # the same way as by the other expressions.
+    _COMPONENT_REGEX = re.compile(
+        r'(?P<placeholder>{(.+?)(:(\\}|.)+?)?})|(?P<other>[\s\S]+?)'
+    )
 
     ANCHOR_START, ANCHOR_END, ANCHOR_BOTH = (1, 2, 3)
 
     RELAXED, STRICT = (1, 2)
 
+    #: Whether templates defer validation to first use when *lazy* is not
+    #: specified on construction.
+    lazy = False
+
     def __init__(self, name, pattern, anchor=ANCHOR_START,
                  default_placeholder_expression='[\w_.\-]+',
                  duplicate_placeholder_mode=RELAXED,
-                 template_resolver=None):
+                 template_resolver=None, lazy=None):
         '''Initialise with *name* and *pattern*.
 
         *anchor* determines how the pattern is anchored during a parse. A
@@ -50,9 +64,23 @@ class Template(object):
         :class:`Resolver` interface. It can be changed at any time on the
         instance to affect future operations.
 
+        The *pattern* is validated on construction, raising :exc:`ValueError`
+        if invalid. If *lazy* is True then validation is instead deferred until
+        the template is first used or :meth:`validate` is called. If *lazy* is
+        None then the class default, :attr:`Template.lazy`, is used.
+
         '''
         super(Template, self).__init__()
         self.duplicate_placeholder_mode = duplicate_placeholder_mode
+
+        # Derived state (expanded pattern, compiled expression etc) is cached
+        # against the expanded pattern. The revision is incremented each time
+        # that state is rebuilt so that templates referencing this one can
+        # detect when their own cached state is stale.
+        self._cache = None
+        self._revision = 0
+        self._validated = False
+
         self.template_resolver = template_resolver
 
         self._default_placeholder_expression = default_placeholder_expression
@@ -62,8 +90,11 @@ class Template(object):
         self._pattern = pattern
         self._anchor = anchor
 
-        # Check that supplied pattern is valid and able to be compiled.
-        self._construct_regular_expression(self.pattern)
+        if lazy is None:
+            lazy = self.lazy
+
+        if not lazy:
+            self.validate()
 
     def __repr__(self):
         '''Return unambiguous representation of template.'''
@@ -71,6 +102,47 @@ class Template(object):
             self.__class__.__name__, self.name, self.pattern
         )
 
+    def __getstate__(self):
+        '''Return state for copying and pickling without cached state.'''
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        return state
+
+    def validate(self):
+        '''Check that pattern is valid and able to be compiled.
+
+        Raise :exc:`ValueError` if the pattern is invalid.
+
+        Template references are not resolved. Validation only happens once
+        per template so later calls return immediately.
+
+        '''
+        if self._validated:
+            return
+
+        # A pattern found in the compiled cache is already known to be valid
+        # so is instead compiled on first use.
+        regex = None
+        if self._get_compiled_cache_entry(self.pattern) is None:
+            regex = self._construct_regular_expression(self.pattern)
+
+        self._validated = True
+
+        # Without references the pattern is already fully expanded so reuse
+        # the validation result.
+        if (
+            self._cache is None
+            and self._TEMPLATE_REFERENCE_REGEX.search(self.pattern) is None
+        ):
+            self._cache = {
+                'expanded_pattern': self.pattern,
+                'references': []
+            }
+            if regex is not None:
+                self._cache['regex'] = regex
+
+            self._revision += 1
+
     @property
     def name(self):
         '''Return name of template.'''
@@ -81,6 +153,21 @@ class Template(object):
         '''Return template pattern.'''
         return self._pattern
 
+    @property
+    def template_resolver(self):
+        '''Return template resolver used to resolve template references.'''
+        return self._template_resolver
+
+    @template_resolver.setter
+    def template_resolver(self, template_resolver):
+        '''Set *template_resolver* and discard cached state.'''
+        self._template_resolver = template_resolver
+        self._clear_cache()
+
+    def _clear_cache(self):
+        '''Discard cached state so that it is rebuilt on next use.'''
+        self._cache = None
+
     def expanded_pattern(self):
         '''Return pattern with all referenced templates expanded recursively.
 
@@ -88,12 +175,77 @@ class Template(object):
         that cannot be resolved by currently set template_resolver.
 
         '''
-        return self._TEMPLATE_REFERENCE_REGEX.sub(
-            self._expand_reference, self.pattern
-        )
+        return self._state()['expanded_pattern']
+
+    def _state(self):
+        '''Return cached state for expanded pattern, rebuilding if stale.
+
+        The state is a dictionary holding the 'expanded_pattern', the resolved
+        'references' it was built from and any other values derived from the
+        expanded pattern (see :meth:`_get_cached`).
+
+        '''
+        state = self._cache
+        if state is not None and not self._is_current(state):
+            state = None
+
+        if state is None and not self._validated:
+            self.validate()
+            state = self._cache
+
+        if state is None:
+            references = []
+            expanded_pattern = self._TEMPLATE_REFERENCE_REGEX.sub(
+                functools.partial(
+                    self._expand_reference, references=references
+                ),
+                self.pattern
+            )
+            state = self._cache = {
+                'expanded_pattern': expanded_pattern,
+                'references': references
+            }
+            self._revision += 1
+
+        return state
 
-    def _expand_reference(self, match):
-        '''Expand reference represented by *match*.'''
+    def _is_current(self, state):
+        '''Return whether cached *state* is still valid.
+
+        *state* is stale when a reference now resolves to a different template
+        or when a referenced template has itself rebuilt its state.
+
+        '''
+        for reference, template, revision in state['references']:
+            if self.template_resolver.get(reference) is not template:
+                return False
+
+            template._state()
+            if template._revision != revision:
+                return False
+
+        return True
+
+    def _get_cached(self, key, factory):
+        '''Return value for *key* cached against the expanded pattern.
+
+        If no value is cached yet, call *factory* with the expanded pattern to
+        create it.
+
+        '''
+        state = self._state()
+        try:
+            return state[key]
+        except KeyError:
+            value = state[key] = factory(state['expanded_pattern'])
+            return value
+
+    def _expand_reference(self, match, references):
+        '''Expand reference represented by *match*.
+
+        Record resolved reference, template and revision in *references*.
+
+        '''
         reference = match.group('reference')
 
         if self.template_resolver is None:
@@ -109,7 +261,10 @@ class Template(object):
                 .format(reference)
             )
 
-        return template.expanded_pattern()
+        expanded_pattern = template.expanded_pattern()
+        references.append((reference, template, template._revision))
+
+        return expanded_pattern
 
     def parse(self, path):
         '''Return dictionary of data extracted from *path* using this template.
@@ -118,48 +273,149 @@ class Template(object):
         parsable by this template.
 
         '''
-        # Construct regular expression for expanded pattern.
-        regex = self._construct_regular_expression(self.expanded_pattern())
+        # Retrieve search function for expanded pattern.
+        search = self._get_cached('search', self._construct_search)
+
+        parse_cache = lucidity.parse_cache.get_active()
+        if parse_cache is None:
+            return self._match(search, path)
+
+        # The revision changes whenever the expression is rebuilt so results
+        # for an outdated expression are never returned.
+        key = (self, self._revision, self.duplicate_placeholder_mode, path)
+        result = parse_cache.get(key)
+        if result is None:
+            try:
+                result = lucidity.parse_cache.snapshot(
+                    self._match(search, path)
+                )
+            except lucidity.error.ParseError as error:
+                result = error
+
+            parse_cache.set(key, result)
+
+        if isinstance(result, lucidity.error.ParseError):
+            raise lucidity.error.ParseError(*result.args)
+
+        return lucidity.parse_cache.restore(result)
+
+    def _parse_uncached(self, path):
+        '''Return data parsed from *path* without using the parse cache.
+
+        Used by callers that cache their own overall result, such as
+        :class:`~lucidity.template_set.TemplateSet`, so that a lookup is not
+        stored twice.
+
+        Raise :py:class:`~lucidity.error.ParseError` if *path* is not
+        parsable by this template.
+
+        '''
+        return self._match(
+            self._get_cached('search', self._construct_search), path
+        )
 
-        # Parse.
-        parsed = {}
+    def _match(self, search, path):
+        '''Return dictionary of data extracted from *path* using *search*.
 
-        match = regex.search(path)
+        *search* should be the function returned by :meth:`_construct_search`.
+
+        '''
+        match = search(path)
         if match:
-            data = {}
-            for key, value in sorted(match.groupdict().items()):
-                # Strip number that was added to make group name unique.
-                key = key[:-3]
-
-                # If strict mode enabled for duplicate placeholders, ensure that
-                # all duplicate placeholders extract the same value.
-                if self.duplicate_placeholder_mode == self.STRICT:
-                    if key in parsed:
-                        if parsed[key] != value:
-                            raise lucidity.error.ParseError(
-                                'Different extracted values for placeholder '
-                                '{0!r} detected. Values were {1!r} and {2!r}.'
-                                .format(key, parsed[key], value)
-                            )
-                    else:
-                        parsed[key] = value
-
-                # Expand dot notation keys into nested dictionaries.
-                target = data
-
-                parts = key.split(self._period_code)
-                for part in parts[:-1]:
-                    target = target.setdefault(part, {})
-
-                target[parts[-1]] = value
-
-            return data
+            return self._extract(match.groups())
 
         else:
             raise lucidity.error.ParseError(
                 'Path {0!r} did not match template pattern.'.format(path)
             )
 
+    def parse_record(self, path):
+        '''Return :class:`~lucidity.record.Record` of data from *path*.
+
+        The record holds the same data as returned by :meth:`parse` in less
+        memory, only creating nested dictionaries on request.
+
+        Raise :py:class:`~lucidity.error.ParseError` if *path* is not
+        parsable by this template.
+
+        '''
+        search = self._get_cached('search', self._construct_search)
+        match = search(path)
+        if not match:
+            raise lucidity.error.ParseError(
+                'Path {0!r} did not match template pattern.'.format(path)
+            )
+
+        return self._extract_record(match.groups())
+
+    def _extract_record(self, groups):
+        '''Return :class:`~lucidity.record.Record` from matched *groups*.
+
+        *groups* should be the values of all groups in the regular expression
+        for the expanded pattern, as returned by :meth:`re.MatchObject.groups`.
+
+        Raise :py:class:`~lucidity.error.ParseError` if strict mode is enabled
+        for duplicate placeholders and differing values were extracted.
+
+        '''
+        record_type, positions, duplicates = self._get_cached(
+            'layout', self._construct_layout
+        )
+
+        if duplicates and self.duplicate_placeholder_mode == self.STRICT:
+            self._check_duplicates(groups, duplicates)
+
+        return record_type([groups[position] for position in positions])
+
+    def _extract(self, groups):
+        '''Return dictionary of data extracted from matched *groups*.
+
+        *groups* should be the values of all groups in the regular expression
+        for the expanded pattern, as returned by :meth:`re.MatchObject.groups`.
+
+        Raise :py:class:`~lucidity.error.ParseError` if strict mode is enabled
+        for duplicate placeholders and differing values were extracted.
+
+        '''
+        keys, get_values, containers, nested, duplicates = self._get_cached(
+            'extraction', self._construct_extraction
+        )
+
+        if duplicates and self.duplicate_placeholder_mode == self.STRICT:
+            self._check_duplicates(groups, duplicates)
+
+        data = dict(zip(keys, get_values(groups)))
+
+        if containers:
+            # Create nested dictionaries, parents first, then fill them.
+            targets = [data]
+            for parent, key in containers:
+                target = targets[parent][key] = {}
+                targets.append(target)
+
+            for target, key, position in nested:
+                targets[target][key] = groups[position]
+
+        return data
+
+    def _check_duplicates(self, groups, duplicates):
+        '''Raise ParseError if *duplicates* matched differing values.
+
+        *duplicates* should be a list of (placeholder, positions) as stored in
+        the layout (see :meth:`_construct_layout`).
+
+        '''
+        for key, positions in duplicates:
+            first = groups[positions[0]]
+            for position in positions[1:]:
+                value = groups[position]
+                if value != first:
+                    raise lucidity.error.ParseError(
+                        'Different extracted values for placeholder '
+                        '{0!r} detected. Values were {1!r} and {2!r}.'
+                        .format(key, first, value)
+                    )
+
     def format(self, data):
         '''Return a path formatted by applying *data* to this template.
 
@@ -167,41 +423,97 @@ class Template(object):
         supply enough information to fill the template fields.
 
         '''
-
-        format_specification = self._construct_format_specification(
-            self.expanded_pattern()
+        segments = self._get_cached(
+            'format_segments', self._construct_format_segments
         )
 
-        return self._PLAIN_PLACEHOLDER_REGEX.sub(
-            functools.partial(self._format, data=data),
-            format_specification
+        path = []
+        for literal, placeholder, parts in segments:
+            path.append(literal)
+            if placeholder is None:
+                continue
+
+            try:
+                value = data
+                for part in parts:
+                    value = value[part]
+
+            except (TypeError, KeyError):
+                raise lucidity.error.FormatError(
+                    'Could not format data {0!r} due to missing key {1!r}.'
+                    .format(data, placeholder)
+                )
+
+            # A value of None is formatted as an empty string.
+            if value is not None:
+                path.append(value)
+
+        return ''.join(path)
+
+    def format_many(self, records):
+        '''Yield path formatted by applying each of *records* to this template.
+
+        *records* can be an iterable of dictionaries, each as accepted by
+        :meth:`format`. Alternatively, pass a mapping of placeholder name to a
+        sequence of values, such as the columns returned by
+        :func:`lucidity.parse_columns`. Nested keys are named in full, such as
+        'job.code', in columns.
+
+        The pattern is processed once for all *records*. Yield None rather
+        than raising :py:class:`~lucidity.error.FormatError` for each record
+        that does not supply enough information to fill the template fields.
+        A value of None in a dictionary is formatted as an empty string, as
+        with :meth:`format`, whereas in columns it marks a row without that
+        placeholder, as returned by :func:`lucidity.parse_columns`, so yields
+        None.
+
+        '''
+        if isinstance(records, Mapping):
+            return self._format_columns(records)
+
+        formatter = self._get_cached('formatter', self._construct_formatter)
+        return (formatter(record) for record in records)
+
+    def _format_columns(self, columns):
+        '''Yield path formatted from each row of *columns* or None.'''
+        segments = self._get_cached(
+            'format_segments', self._construct_format_segments
         )
+        path = []
+        placeholders = []
+        for literal, placeholder, _ in segments:
+            path.append(literal)
+            if placeholder is not None:
+                path.append(None)
+                placeholders.append(placeholder)
 
-    def _format(self, match, data):
-        '''Return value from data for *match*.'''
-        placeholder = match.group(1)
-        parts = placeholder.split('.')
+        count = len(next(iter(columns.values()))) if columns else 0
 
         try:
-            value = data
-            for part in parts:
-                value = value[part]
-
-        except (TypeError, KeyError):
-            raise lucidity.error.FormatError(
-                'Could not format data {0!r} due to missing key {1!r}.'
-                .format(data, placeholder)
-            )
-
-        else:
-            return value
+            rows = itertools.izip(*[
+                columns[placeholder] for placeholder in placeholders
+            ])
+        except KeyError:
+            rows = itertools.repeat(None, count)
+
+        if not placeholders:
+            rows = itertools.repeat((), count)
+
+        for values in rows:
+            if values is None or None in values:
+                yield None
+                continue
+
+            joined = list(path)
+            joined[1::2] = values
+            try:
+                yield ''.join(joined)
+            except TypeError:
+                yield None
 
     def keys(self):
         '''Return unique set of placeholders in pattern.'''
-        format_specification = self._construct_format_specification(
-            self.expanded_pattern()
-        )
-        return set(self._PLAIN_PLACEHOLDER_REGEX.findall(format_specification))
+        return set(self._get_cached('keys', self._construct_keys))
 
     def references(self):
         '''Return unique set of referenced templates in pattern.'''
@@ -214,30 +526,309 @@ class Template(object):
         '''Return format specification from *pattern*.'''
         return self._STRIP_EXPRESSION_REGEX.sub('{\g<1>}', pattern)
 
-    def _construct_regular_expression(self, pattern):
-        '''Return a regular expression to represent *pattern*.'''
-        # Escape non-placeholder components.
-        expression = re.sub(
-            r'(?P<placeholder>{(.+?)(:(\\}|.)+?)?})|(?P<other>.+?)',
-            self._escape,
-            pattern
+    def _construct_keys(self, pattern):
+        '''Return frozen set of placeholders in *pattern*.'''
+        format_specification = self._construct_format_specification(pattern)
+        return frozenset(
+            self._PLAIN_PLACEHOLDER_REGEX.findall(format_specification)
         )
 
-        # Replace placeholders with regex pattern.
-        expression = re.sub(
-            r'{(?P<placeholder>.+?)(:(?P<expression>(\\}|.)+?))?}',
-            functools.partial(
-                self._convert, placeholder_count=defaultdict(int)
-            ),
-            expression
+    def _construct_required_keys(self, pattern):
+        '''Return frozen set of top level keys data must have for *pattern*.
+
+        Data without all of these keys cannot be formatted, so the set can be
+        compared against the keys of a dictionary before formatting.
+
+        '''
+        return frozenset(
+            placeholder.split('.', 1)[0]
+            for placeholder in self._get_cached('keys', self._construct_keys)
         )
 
-        if self._anchor is not None:
-            if bool(self._anchor & self.ANCHOR_START):
-                expression = '^{0}'.format(expression)
+    def _construct_format_segments(self, pattern):
+        '''Return format segments for *pattern*.
+
+        Each segment is a tuple of (literal, placeholder, parts) where
+        *literal* is the static text preceding *placeholder* and *parts* is the
+        placeholder split into the keys used to look up its value in nested
+        data. The final segment holds any trailing literal with a placeholder
+        and parts of None.
+
+        '''
+        format_specification = self._construct_format_specification(pattern)
+
+        segments = []
+        position = 0
+        for match in self._PLAIN_PLACEHOLDER_REGEX.finditer(
+            format_specification
+        ):
+            placeholder = match.group(1)
+            segments.append((
+                format_specification[position:match.start()],
+                placeholder,
+                tuple(placeholder.split('.'))
+            ))
+            position = match.end()
+
+        segments.append((format_specification[position:], None, None))
+
+        return segments
+
+    def _construct_formatter(self, pattern):
+        '''Return function formatting a record for *pattern*.
 
-            if bool(self._anchor & self.ANCHOR_END):
-                expression = '{0}$'.format(expression)
+        The function accepts a dictionary of data, as accepted by
+        :meth:`format`, and returns the formatted path or None if the data
+        does not supply enough information.
+
+        '''
+        segments = self._construct_format_segments(pattern)
+
+        path = []
+        keys = []
+        for literal, placeholder, parts in segments:
+            path.append(literal)
+            if placeholder is not None:
+                path.append(None)
+                keys.append(parts)
+
+        if not keys:
+            get_values = lambda data: ()
+
+        elif all(len(parts) == 1 for parts in keys):
+            # Retrieve all top level values in one call.
+            getter = operator.itemgetter(*[parts[0] for parts in keys])
+            if len(keys) == 1:
+                get_values = lambda data: (getter(data),)
+            else:
+                get_values = getter
+
+        else:
+            def get_values(data):
+                values = []
+                for parts in keys:
+                    value = data
+                    for part in parts:
+                        value = value[part]
+                    values.append(value)
+
+                return values
+
+        def formatter(data):
+            try:
+                values = get_values(data)
+            except (TypeError, KeyError):
+                return None
+
+            joined = list(path)
+            joined[1::2] = values
+            try:
+                return ''.join(joined)
+            except TypeError:
+                pass
+
+            # As with format, a value of None is formatted as an empty string.
+            joined[1::2] = ['' if value is None else value for value in values]
+            try:
+                return ''.join(joined)
+            except TypeError:
+                return None
+
+        return formatter
+
+    def _construct_literals(self, pattern):
+        '''Return literal (prefix, suffix) of *pattern*.
+
+        The prefix is the static text before the first placeholder and the
+        suffix the static text after the last placeholder. If *pattern* has no
+        placeholders then both are the full pattern.
+
+        '''
+        components = [
+            match.group('other')
+            for match in self._COMPONENT_REGEX.finditer(pattern)
+        ]
+
+        if None not in components:
+            return (pattern, pattern)
+
+        first = components.index(None)
+        last = len(components) - components[::-1].index(None)
+
+        return (''.join(components[:first]), ''.join(components[last:]))
+
+    def _construct_search(self, pattern):
+        '''Return function searching a path for a match of *pattern*.
+
+        The function returns a match object or None. Paths without the literal
+        text required by *pattern* (see :meth:`_construct_prefilter`) are
+        rejected without searching.
+
+        '''
+        regex = self._get_cached('regex', self._construct_regular_expression)
+        start, end, substrings = self._get_cached(
+            'prefilter', self._construct_prefilter
+        )
+
+        if start is None and end is None and not substrings:
+            return regex.search
+
+        regex_search = regex.search
+
+        def search(path):
+            if start is not None and not path.startswith(start):
+                return None
+
+            if end is not None and not path.endswith(end):
+                return None
+
+            for substring in substrings:
+                if substring not in path:
+                    return None
+
+            return regex_search(path)
+
+        return search
+
+    def _construct_prefilter(self, pattern):
+        '''Return literal text a path must have to match *pattern*.
+
+        Return a tuple of (start, end, substrings) where *start* is the text a
+        path must start with, *end* the text or tuple of texts a path must
+        end with (either may be None) and *substrings* a tuple of other text a
+        path must contain. Only anchored ends are checked.
+
+        '''
+        regex = self._get_cached('regex', self._construct_regular_expression)
+        if regex.flags & (re.IGNORECASE | re.MULTILINE):
+            # Inline flags in placeholder expressions can relax literals and
+            # anchors.
+            return (None, None, ())
+
+        runs = ['']
+        for match in self._COMPONENT_REGEX.finditer(pattern):
+            other = match.group('other')
+            if other is None:
+                runs.append('')
+            else:
+                runs[-1] += other
+
+        anchor = self._anchor or 0
+
+        start = None
+        if anchor & self.ANCHOR_START and runs[0]:
+            start = runs[0]
+            runs[0] = ''
+
+        end = None
+        if anchor & self.ANCHOR_END and runs[-1]:
+            # An end anchor also matches before a trailing newline.
+            end = (runs[-1], runs[-1] + '\n')
+            runs[-1] = ''
+
+        # Only the longest, and so most selective, text is worth checking as
+        # short separators such as '/' appear in nearly every path.
+        longest = max(runs, key=len)
+        substrings = (longest,) if len(longest) > 1 else ()
+
+        return (start, end, substrings)
+
+    def _construct_layout(self, pattern):
+        '''Return layout of values matched for *pattern*.
+
+        The layout is a tuple of (record_type, positions, duplicates) where
+        *record_type* is the :class:`~lucidity.record.Record` subclass for the
+        placeholders in *pattern*, *positions* the index into the matched
+        groups of the value stored for each of its fields and *duplicates* a
+        list of (placeholder, positions) for placeholders matched more than
+        once.
+
+        '''
+        regex = self._get_cached('regex', self._construct_regular_expression)
+
+        matched = defaultdict(list)
+        for name, index in sorted(regex.groupindex.items()):
+            # Strip number that was added to make group name unique.
+            key = name[:-3].replace(self._period_code, '.')
+            matched[key].append(index - 1)
+
+        fields = tuple(sorted(matched))
+        positions = [matched[key][-1] for key in fields]
+        duplicates = [
+            (key, matched[key]) for key in fields if len(matched[key]) > 1
+        ]
+
+        return (lucidity.record.get_type(fields), positions, duplicates)
+
+    def _construct_extraction(self, pattern):
+        '''Return plan for extracting nested data from groups for *pattern*.
+
+        The plan is a tuple of (keys, get_values, containers, nested,
+        duplicates) derived from the layout (see :meth:`_construct_layout`).
+        *keys* are the top level keys holding values, retrieved from the
+        matched groups as a sequence by *get_values*. *containers* is a list
+        of (parent, key) for each nested dictionary to create, where *parent*
+        is the index of the dictionary to add it to, with 0 the returned
+        dictionary and later indexes the nested dictionaries in order of
+        creation. *nested* is a list of (target, key, position) placing the
+        value at *position* in the matched groups into nested dictionary
+        *target*. *duplicates* is as in the layout.
+
+        '''
+        record_type, positions, duplicates = self._get_cached(
+            'layout', self._construct_layout
+        )
+
+        keys = []
+        top_positions = []
+        containers = []
+        nested = []
+        targets = {(): 0}
+        for field, position in zip(record_type._fields, positions):
+            parts = tuple(field.split('.'))
+            if len(parts) == 1:
+                keys.append(field)
+                top_positions.append(position)
+                continue
+
+            for index in range(1, len(parts)):
+                path = parts[:index]
+                if path not in targets:
+                    targets[path] = len(containers) + 1
+                    containers.append((targets[path[:-1]], path[-1]))
+
+            nested.append((targets[parts[:-1]], parts[-1], position))
+
+        if not top_positions:
+            get_values = lambda groups: ()
+        elif len(top_positions) == 1:
+            position = top_positions[0]
+            get_values = lambda groups: (groups[position],)
+        else:
+            get_values = operator.itemgetter(*top_positions)
+
+        return (keys, get_values, containers, nested, duplicates)
+
+    def _construct_regular_expression(self, pattern):
+        '''Return a regular expression to represent *pattern*.
+
+        If a compiled cache is enabled reuse the expression stored for
+        *pattern* and store newly constructed expressions (see
+        :mod:`lucidity.compiled_cache`).
+
+        '''
+        expression = self._get_compiled_cache_entry(pattern)
+        cached = expression is not None
+
+        if not cached:
+            expression = self._construct_expression(pattern)
+
+            if self._anchor is not None:
+                if bool(self._anchor & self.ANCHOR_START):
+                    expression = '^{0}'.format(expression)
+
+                if bool(self._anchor & self.ANCHOR_END):
+                    expression = '{0}$'.format(expression)
 
         # Compile expression.
         try:
@@ -254,14 +845,62 @@ class Template(object):
                 message = 'Invalid pattern: {0}'.format(value)
                 raise ValueError, message, traceback  #@IgnorePep8
 
+        compiled_cache = lucidity.compiled_cache.get_active()
+        if compiled_cache is not None and not cached:
+            compiled_cache.set(
+                self._get_compiled_cache_key(pattern), expression
+            )
+
         return compiled
 
-    def _convert(self, match, placeholder_count):
+    def _get_compiled_cache_key(self, pattern):
+        '''Return compiled cache key for *pattern* with current settings.'''
+        return lucidity.compiled_cache.CompiledCache.key(
+            pattern, self._anchor, self._default_placeholder_expression
+        )
+
+    def _get_compiled_cache_entry(self, pattern):
+        '''Return expression stored in compiled cache for *pattern*.
+
+        Return None if no compiled cache is enabled or *pattern* not stored.
+
+        '''
+        compiled_cache = lucidity.compiled_cache.get_active()
+        if compiled_cache is None:
+            return None
+
+        return compiled_cache.get(self._get_compiled_cache_key(pattern))
+
+    def _construct_expression(self, pattern, named_groups=True):
+        '''Return unanchored regular expression string for *pattern*.
+
+        If *named_groups* is False then placeholders are converted to unnamed
+        groups. The group numbering is the same in either case.
+
+        '''
+        # Escape non-placeholder components.
+        expression = self._COMPONENT_REGEX.sub(self._escape, pattern)
+
+        # Replace placeholders with regex pattern.
+        expression = re.sub(
+            r'{(?P<placeholder>.+?)(:(?P<expression>(\\}|.)+?))?}',
+            functools.partial(
+                self._convert, placeholder_count=defaultdict(int),
+                named_groups=named_groups
+            ),
+            expression
+        )
+
+        return expression
+
+    def _convert(self, match, placeholder_count, named_groups=True):
         '''Return a regular expression to represent *match*.
 
         *placeholder_count* should be a `defaultdict(int)` that will be used to
         store counts of unique placeholder names.
 
+        If *named_groups* is False return an unnamed group instead.
+
         '''
         placeholder_name = match.group('placeholder')
 
@@ -292,6 +931,9 @@ class Template(object):
         # Un-escape potentially escaped characters in expression.
         expression = expression.replace('\{', '{').replace('\}', '}')
 
+        if not named_groups:
+            return r'({0})'.format(expression)
+
         return r'(?P<{0}>{1})'.format(placeholder_name, expression)
 
     def _escape(self, match):
@@ -0,0 +1,729 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import os
+import re
+import collections
+import itertools
+import multiprocessing
+import multiprocessing.pool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+import lucidity.error
+import lucidity.parse_cache
+from lucidity.template import Template
+from lucidity.prefix_index import PrefixIndex
+
+
+#: Marker for a path with no result stored in the parse cache.
+_NOT_CACHED = object()
+
+#: Flags of a regular expression compiled without inline flags.
+_DEFAULT_FLAGS = re.compile('').flags
+
+
+class TemplateSet(object):
+    '''Ordered collection of templates that can be parsed against together.
+
+    Rather than trying each template in turn, templates are combined into as
+    few alternation regular expressions as possible (one branch per template)
+    so that a single match determines which template matched and the data it
+    extracted. The first template in declared order that can parse a path
+    wins, exactly as with :func:`lucidity.parse`.
+
+    A :class:`~lucidity.prefix_index.PrefixIndex` is consulted first so that
+    only templates whose literal prefix and suffix fit a path are considered.
+    Combined expressions are built and cached per distinct set of candidates.
+
+    '''
+
+    #: Maximum number of groups in a combined regular expression. Some versions
+    #: of the standard re module do not support more than 100 groups
+    #: (including the implicit whole match group).
+    MAXIMUM_GROUPS = 99
+
+    _GROUP_REFERENCE_REGEX = re.compile(r'\(\?P')
+    _ESCAPE_REGEX = re.compile(r'\\(.)')
+
+    def __init__(self, templates=None):
+        '''Initialise with *templates*.
+
+        *templates* should be an iterable of
+        :py:class:`~lucidity.template.Template` instances in the order that
+        they should be tried.
+
+        The index and combined expressions are built on first use from the
+        current expanded patterns of the templates. Call :meth:`refresh` after
+        changing template resolvers or referenced templates.
+
+        '''
+        super(TemplateSet, self).__init__()
+        self._templates = list(templates or [])
+        self._index = None
+        self._chunks = {}
+        self._positions = None
+        self._version = 0
+
+    def __repr__(self):
+        '''Return unambiguous representation of template set.'''
+        return '{0}({1!r})'.format(self.__class__.__name__, self._templates)
+
+    def __iter__(self):
+        '''Iterate over templates in order.'''
+        return iter(self._templates)
+
+    def __len__(self):
+        '''Return number of templates.'''
+        return len(self._templates)
+
+    def __getitem__(self, index):
+        '''Return template at *index*.'''
+        return self._templates[index]
+
+    def __getstate__(self):
+        '''Return state for copying and pickling without compiled state.'''
+        state = self.__dict__.copy()
+        state['_index'] = None
+        state['_chunks'] = {}
+        state['_positions'] = None
+        return state
+
+    def refresh(self):
+        '''Discard compiled state so that it is rebuilt on next use.'''
+        self._index = None
+        self._chunks = {}
+        self._version += 1
+
+    def candidates(self, path):
+        '''Return templates that could match *path* in declared order.'''
+        return [self._templates[position] for position in self._lookup(path)]
+
+    def parse(self, path):
+        '''Parse *path* against templates.
+
+        Return ``(data, template)`` from first successful parse.
+
+        Raise :py:class:`~lucidity.error.ParseError` if *path* is not
+        parseable by any of the templates.
+
+        '''
+        result = self._parse(path)
+        if result is None:
+            raise lucidity.error.ParseError(
+                'Path {0!r} did not match any of the supplied template '
+                'patterns.'.format(path)
+            )
+
+        return result
+
+    def parse_many(self, paths, processes=1, chunk_size=1000, ordered=True):
+        '''Parse each of *paths* against templates.
+
+        *paths* can be any iterable of strings, including an open file of
+        newline separated paths. Trailing newline characters are stripped
+        from each path.
+
+        Yield ``(path, data, template)`` for each path in turn. If a path is
+        not parseable by any of the templates then yield
+        ``(path, None, None)`` rather than raising an error.
+
+        If *processes* is greater than 1 then parse in a pool of that many
+        worker processes, or one per CPU if *processes* is None. The template
+        set is sent to each worker once and *paths* are distributed in lists
+        of *chunk_size*. Only a few chunks per worker are in flight at any
+        time so memory use does not grow with the number of paths. If
+        *ordered* is False then results are yielded as soon as each chunk
+        completes rather than in input order.
+
+        '''
+        if processes is not None and processes <= 1:
+            for path in paths:
+                yield self._parse_path(path)
+
+            return
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        pool = multiprocessing.Pool(
+            processes, initializer=_initialise_worker, initargs=(self,)
+        )
+
+        try:
+            pending = collections.deque()
+            limit = processes * 2
+
+            for chunk in _chunk(paths, chunk_size):
+                pending.append(pool.apply_async(_parse_paths, (chunk,)))
+
+                while len(pending) >= limit:
+                    for result in self._collect(pending, ordered):
+                        yield result
+
+            while pending:
+                for result in self._collect(pending, ordered):
+                    yield result
+
+            pool.close()
+            pool.join()
+
+        finally:
+            pool.terminate()
+
+    def scan(self, root, follow_links=False, threads=1):
+        '''Walk directory tree under *root* parsing file paths as found.
+
+        Yield ``(path, data, template)`` for each file whose path is parseable
+        by the templates. Directories are listed lazily, top down, and any
+        directory whose path could not begin a match for any template is not
+        descended into (see
+        :meth:`~lucidity.prefix_index.PrefixIndex.could_match_prefix`).
+
+        Symbolic links to directories are not followed unless *follow_links*
+        is True. Directories that cannot be listed are skipped.
+
+        If *threads* is greater than 1 then list up to that many directories
+        at once in a pool of threads, overlapping the time spent waiting on
+        slow, such as network, filesystems. Directories are then visited
+        breadth first so results are yielded in a different, though still
+        consistent, order. Paths are always parsed in the calling thread.
+
+        '''
+        if self._index is None:
+            self._index = PrefixIndex(self._templates)
+
+        if not self._index.could_match_prefix(os.path.join(root, '')):
+            return
+
+        if threads > 1:
+            for result in self._scan_threaded(root, follow_links, threads):
+                yield result
+
+            return
+
+        directories = [root]
+        while directories:
+            directory = directories.pop()
+
+            try:
+                entries = _list_directory(directory)
+            except OSError:
+                continue
+
+            subdirectories, results = self._scan_entries(
+                directory, entries, follow_links
+            )
+            for result in results:
+                yield result
+
+            directories.extend(reversed(subdirectories))
+
+    def _scan_threaded(self, root, follow_links, threads):
+        '''Yield scan results under *root* listing directories in *threads*.
+
+        Subdirectories are queued for listing before the results for their
+        parent are yielded so that listing continues while results are
+        consumed.
+
+        '''
+        pool = multiprocessing.pool.ThreadPool(threads)
+        try:
+            pending = collections.deque([
+                (root, pool.apply_async(_list_directory, (root,)))
+            ])
+            while pending:
+                directory, listing = pending.popleft()
+
+                try:
+                    entries = listing.get()
+                except OSError:
+                    continue
+
+                subdirectories, results = self._scan_entries(
+                    directory, entries, follow_links
+                )
+                for subdirectory in subdirectories:
+                    pending.append((
+                        subdirectory,
+                        pool.apply_async(_list_directory, (subdirectory,))
+                    ))
+
+                for result in results:
+                    yield result
+
+        finally:
+            # Let queued listings finish in the background rather than
+            # waiting on the pool's handler threads, which poll at intervals,
+            # to terminate.
+            pool.close()
+
+    def _scan_entries(self, directory, entries, follow_links):
+        '''Return subdirectories and parse results for listed *entries*.
+
+        *entries* should be as returned by :func:`_list_directory` for
+        *directory*. Return a tuple of (subdirectories, results) where
+        *subdirectories* are the paths of directories to descend into and
+        *results* a list of ``(path, data, template)`` for parseable files.
+
+        '''
+        subdirectories = []
+        results = []
+        for name, is_directory, is_link in entries:
+            path = os.path.join(directory, name)
+
+            if is_directory:
+                if (
+                    (follow_links or not is_link)
+                    and self._index.could_match_prefix(
+                        os.path.join(path, '')
+                    )
+                ):
+                    subdirectories.append(path)
+
+                continue
+
+            result = self._parse(path)
+            if result is not None:
+                results.append((path, result[0], result[1]))
+
+        return (subdirectories, results)
+
+    def parse_columns(self, paths, numpy=False):
+        '''Parse each of *paths* against templates returning columns of data.
+
+        *paths* can be any iterable of strings, including an open file of
+        newline separated paths. Trailing newline characters are stripped
+        from each path.
+
+        Return ``(template_indices, columns)``. *template_indices* holds, for
+        each path in turn, the index of the template that parsed it or -1 if
+        no template could. *columns* maps each placeholder name in any of the
+        templates, with periods separating nested keys, to a list of the
+        value parsed for each path. Where a path was not parsed by a template
+        with that placeholder the value is None.
+
+        If *numpy* is True then return a NumPy integer array of template
+        indices and a NumPy array for each column instead of lists, with
+        missing values as empty strings. Requires NumPy to be installed.
+
+        '''
+        template_indices = []
+        columns = {}
+
+        # For each template, the column lists to append to and the position
+        # of the value in its records, or None for columns it lacks.
+        plans = []
+        for template in self._templates:
+            record_type = template._get_cached(
+                'layout', template._construct_layout
+            )[0]
+            plans.append(record_type._positions)
+            for field in record_type._fields:
+                columns.setdefault(field, [])
+
+        plans = [
+            [
+                (column, positions.get(field))
+                for field, column in columns.items()
+            ]
+            for positions in plans
+        ]
+        unmatched = [(column, None) for column in columns.values()]
+
+        for path in paths:
+            path = path.rstrip('\r\n')
+            result = self._match(path, record=True)
+
+            if result is None:
+                template_indices.append(-1)
+                plan = unmatched
+                values = ()
+            else:
+                values, template = result
+                position = self._get_position(template)
+                template_indices.append(position)
+                plan = plans[position]
+
+            for column, position in plan:
+                if position is None:
+                    column.append(None)
+                else:
+                    column.append(tuple.__getitem__(values, position))
+
+        if numpy:
+            import numpy as np
+
+            template_indices = np.array(template_indices, dtype=int)
+            columns = dict(
+                (field, np.array([
+                    '' if value is None else value for value in column
+                ]))
+                for field, column in columns.items()
+            )
+
+        return (template_indices, columns)
+
+    def _get_position(self, template):
+        '''Return first declared position of *template*.'''
+        if self._positions is None:
+            self._positions = {}
+            for position, candidate in enumerate(self._templates):
+                self._positions.setdefault(id(candidate), position)
+
+        return self._positions[id(template)]
+
+    def _collect(self, pending, ordered):
+        '''Remove a completed chunk from *pending* and return its results.
+
+        If *ordered* then always wait for the oldest chunk, otherwise use
+        whichever completes first.
+
+        '''
+        if ordered:
+            chunk = pending.popleft()
+        else:
+            while True:
+                ready = [result for result in pending if result.ready()]
+                if ready:
+                    chunk = ready[0]
+                    pending.remove(chunk)
+                    break
+
+                pending[0].wait(0.01)
+
+        return [
+            (path, data, None if position is None
+             else self._templates[position])
+            for path, data, position in chunk.get()
+        ]
+
+    def _parse_path(self, path):
+        '''Return ``(path, data, template)`` for *path*.
+
+        Strip trailing newline characters from *path* first. If *path* is not
+        parseable return ``(path, None, None)``.
+
+        '''
+        path = path.rstrip('\r\n')
+
+        result = self._parse(path)
+        if result is None:
+            return (path, None, None)
+
+        return (path, result[0], result[1])
+
+    def _parse(self, path):
+        '''Return ``(data, template)`` parsed from *path* or None.
+
+        If a :mod:`parse cache <lucidity.parse_cache>` is enabled then return
+        a copy of the stored result for *path* when available.
+
+        '''
+        parse_cache = lucidity.parse_cache.get_active()
+        if parse_cache is None:
+            return self._match(path)
+
+        key = (self, self._version, path)
+        result = parse_cache.get(key, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            result = self._match(path)
+            if result is not None:
+                result = (lucidity.parse_cache.snapshot(result[0]), result[1])
+
+            parse_cache.set(key, result)
+
+        if result is None:
+            return None
+
+        return (lucidity.parse_cache.restore(result[0]), result[1])
+
+    def _match(self, path, record=False):
+        '''Return ``(data, template)`` parsed from *path* or None.
+
+        If *record* is True then data is returned as a
+        :class:`~lucidity.record.Record`.
+
+        '''
+        for regex, branches, templates in self._get_chunks(self._lookup(path)):
+            result = self._parse_chunk(
+                path, regex, branches, templates, record=record
+            )
+            if result is not None:
+                return result
+
+        return None
+
+    def _get_chunks(self, candidates):
+        '''Return combined expression chunks for *candidates*.
+
+        *candidates* should be a sorted tuple of template positions.
+
+        '''
+        chunks = self._chunks.get(candidates)
+        if chunks is None:
+            chunks = self._chunks[candidates] = self._construct_chunks([
+                self._templates[position] for position in candidates
+            ])
+
+        return chunks
+
+    def _lookup(self, path):
+        '''Return positions of candidate templates for *path*.'''
+        if self._index is None:
+            self._index = PrefixIndex(self._templates)
+
+        return self._index.lookup(path)
+
+    def _parse_chunk(self, path, regex, branches, templates, record=False):
+        '''Return ``(data, template)`` parsed from *path* or None.
+
+        *regex* is the combined expression for *templates* and *branches*
+        maps the group index of each branch to ``(position, group_count)``.
+        If *regex* is None then *templates* are tried individually.
+
+        If *record* is True then data is returned as a
+        :class:`~lucidity.record.Record`.
+
+        '''
+        if regex is not None:
+            match = regex.match(path)
+            if match is None:
+                return None
+
+            index = match.lastindex
+            position, count = branches[index]
+            template = templates[position]
+            groups = match.groups()[index:index + count]
+            try:
+                if record:
+                    data = template._extract_record(groups)
+                else:
+                    data = template._extract(groups)
+            except lucidity.error.ParseError:
+                # Strict duplicate placeholder check failed so fall back to
+                # trying the remaining templates in this chunk in turn.
+                templates = templates[position + 1:]
+            else:
+                return (data, template)
+
+        # The overall result is cached by the set so avoid storing results
+        # for each template too.
+        uncached = lucidity.parse_cache.get_active() is not None
+
+        for template in templates:
+            try:
+                if record:
+                    data = template.parse_record(path)
+                elif uncached:
+                    data = template._parse_uncached(path)
+                else:
+                    data = template.parse(path)
+            except lucidity.error.ParseError:
+                continue
+            else:
+                return (data, template)
+
+        return None
+
+    def _construct_chunks(self, templates):
+        '''Return list of chunks representing *templates*.
+
+        Each chunk is a tuple of ``(regex, branches, templates)`` covering
+        consecutive *templates*. Templates that cannot safely be combined are
+        placed in their own chunk with a *regex* of None.
+
+        '''
+        chunks = []
+        pending = []
+        group_count = 0
+
+        for template in templates:
+            count = template._get_cached(
+                'regex', template._construct_regular_expression
+            ).groups
+
+            combinable = (
+                count + 1 <= self.MAXIMUM_GROUPS
+                and self._is_combinable(template)
+            )
+
+            if not combinable or group_count + count + 1 > self.MAXIMUM_GROUPS:
+                if pending:
+                    chunks.append(self._construct_chunk(pending))
+                pending = []
+                group_count = 0
+
+            if not combinable:
+                chunks.append((None, None, [template]))
+                continue
+
+            pending.append(template)
+            group_count += count + 1
+
+        if pending:
+            chunks.append(self._construct_chunk(pending))
+
+        return chunks
+
+    def _construct_chunk(self, templates):
+        '''Return chunk combining *templates* into one regular expression.'''
+        branches = {}
+        expressions = []
+        index = 1
+
+        for position, template in enumerate(templates):
+            count = template._get_cached(
+                'regex', template._construct_regular_expression
+            ).groups
+            expressions.append(self._construct_branch(template))
+            branches[index] = (position, count)
+            index += count + 1
+
+        try:
+            regex = re.compile('|'.join(expressions))
+        except (re.error, AssertionError, OverflowError):
+            return (None, None, templates)
+
+        return (regex, branches, templates)
+
+    def _construct_branch(self, template):
+        '''Return branch expression for *template*.
+
+        The branch is matched from the start of a path so unanchored templates
+        are prefixed with a lazy match of any leading characters. This ensures
+        earlier branches are fully tried before later ones, preserving first
+        match wins behaviour.
+
+        '''
+        expression = self._get_branch_expression(template)
+
+        anchor = template._anchor
+        if anchor is None or not anchor & Template.ANCHOR_START:
+            expression = r'[\s\S]*?' + expression
+
+        if anchor is not None and anchor & Template.ANCHOR_END:
+            expression += '$'
+
+        return '({0})'.format(expression)
+
+    def _get_branch_expression(self, template):
+        '''Return unanchored expression for *template* with unnamed groups.'''
+        return template._get_cached(
+            'branch_expression',
+            lambda pattern: template._construct_expression(
+                pattern, named_groups=False
+            )
+        )
+
+    def _is_combinable(self, template):
+        '''Return whether *template* can be combined with other templates.
+
+        Templates using named groups, back references or conditional group
+        references in placeholder expressions would conflict with, or refer
+        to the wrong groups in, a combined expression. Inline flags, such as
+        ``(?i)``, would apply to every branch of a combined expression.
+
+        '''
+        regex = template._get_cached(
+            'regex', template._construct_regular_expression
+        )
+        if regex.flags != _DEFAULT_FLAGS:
+            return False
+
+        expression = self._get_branch_expression(template)
+
+        if self._GROUP_REFERENCE_REGEX.search(expression):
+            return False
+
+        if '(?(' in expression:
+            return False
+
+        for escaped in self._ESCAPE_REGEX.findall(expression):
+            if escaped in '123456789':
+                return False
+
+        return True
+
+
+#: Template set used by worker process and map of template identity to
+#: position. Set by :func:`_initialise_worker`.
+_worker_state = None
+
+
+def _initialise_worker(template_set):
+    '''Initialise worker process to parse against *template_set*.'''
+    global _worker_state
+    positions = {}
+    for position, template in enumerate(template_set):
+        positions.setdefault(id(template), position)
+
+    _worker_state = (template_set, positions)
+
+
+def _parse_paths(paths):
+    '''Return list of ``(path, data, position)`` for *paths* in worker.
+
+    Position is the index of the matching template, or None if no template
+    matched.
+
+    '''
+    template_set, positions = _worker_state
+
+    results = []
+    for path, data, template in template_set.parse_many(paths):
+        results.append(
+            (path, data, None if template is None else positions[id(template)])
+        )
+
+    return results
+
+
+def _chunk(iterable, size):
+    '''Yield lists of up to *size* items from *iterable*.'''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def _list_directory(path):
+    '''Return list of ``(name, is_directory, is_link)`` for entries in *path*.
+
+    Use :func:`os.scandir`, or the :mod:`scandir` backport if installed, when
+    available to avoid a stat per entry. Otherwise only directories are
+    checked for being links, as with :func:`os.walk`, and *is_link* is False
+    for other entries.
+
+    '''
+    if scandir is not None:
+        entries = []
+        for entry in scandir(path):
+            try:
+                is_directory = entry.is_dir()
+            except OSError:
+                is_directory = False
+
+            entries.append((entry.name, is_directory, entry.is_symlink()))
+
+        return entries
+
+    entries = []
+    for name in os.listdir(path):
+        entry_path = os.path.join(path, name)
+        is_directory = os.path.isdir(entry_path)
+        entries.append((
+            name, is_directory, is_directory and os.path.islink(entry_path)
+        ))
+
+    return entries
@@ -0,0 +1,415 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+'''Benchmark lucidity hot paths and report results as JSON.
+
+Run with lucidity importable, for example from the repository root::
+
+    PYTHONPATH=source python test/benchmark/run.py --output results.json
+
+Compare against results from a previous run::
+
+    python test/benchmark/run.py --compare previous.json
+
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import timeit
+import argparse
+import platform
+import tempfile
+
+import lucidity
+
+
+#: Roots used to give generated templates realistic literal prefixes.
+ROOTS = ('/jobs', '/mnt/archive', '/cache', '/library')
+
+
+def generate_templates(count):
+    '''Return list of *count* templates resembling a studio configuration.'''
+    templates = []
+    for index in range(count):
+        root = ROOTS[index % len(ROOTS)]
+        templates.append(lucidity.Template(
+            'template_{0}'.format(index),
+            '{0}/{{job.code}}/type_{1}/{{shot.code}}/{{task}}/'
+            '{{name}}.{{frame:\d+}}.{{ext}}'.format(root, index)
+        ))
+
+    return templates
+
+
+def generate_paths(templates):
+    '''Return dictionary of named paths to parse against *templates*.'''
+    last = len(templates) - 1
+    return {
+        'first': '/jobs/monty/type_0/sh010/comp/image.0001.exr',
+        'last': '{0}/monty/type_{1}/sh010/comp/image.0001.exr'.format(
+            ROOTS[last % len(ROOTS)], last
+        ),
+        'unmatched': '/jobs/monty/unknown/sh010/comp/image.0001.exr'
+    }
+
+
+def generate_skewed_paths(templates, count=100):
+    '''Return *count* paths mostly matching a few of *templates*.
+
+    Nine in ten paths match one of three templates and the rest match any
+    template or none, resembling a workload dominated by a few kinds of file.
+
+    '''
+    generator = random.Random(0)
+    frequent = [generator.randrange(len(templates)) for _ in range(3)]
+
+    paths = []
+    for _ in range(count):
+        if generator.random() < 0.9:
+            index = generator.choice(frequent)
+        else:
+            index = generator.randrange(len(templates) + 1)
+
+        if index == len(templates):
+            paths.append(generate_paths(templates)['unmatched'])
+        else:
+            paths.append(
+                '{0}/monty/type_{1}/sh010/comp/image.0001.exr'.format(
+                    ROOTS[index % len(ROOTS)], index
+                )
+            )
+
+    return paths
+
+
+DATA = {
+    'job': {'code': 'monty'},
+    'shot': {'code': 'sh010'},
+    'task': 'comp',
+    'name': 'image',
+    'frame': '0001',
+    'ext': 'exr'
+}
+
+
+def generate_format_templates(count):
+    '''Return *count* templates and data only the last can format.
+
+    Each template requires a key unique to it in addition to the keys in
+    :data:`DATA` so that earlier templates are rejected when formatting.
+
+    '''
+    templates = []
+    for index in range(count):
+        root = ROOTS[index % len(ROOTS)]
+        templates.append(lucidity.Template(
+            'template_{0}'.format(index),
+            '{0}/{{job.code}}/{{variant_{1}}}/{{shot.code}}/{{task}}/'
+            '{{name}}.{{frame:\d+}}.{{ext}}'.format(root, index)
+        ))
+
+    data = dict(DATA)
+    data['variant_{0}'.format(count - 1)] = 'type'
+
+    return templates, data
+
+
+def generate_reference_chain(depth):
+    '''Return template at end of chain of *depth* template references.'''
+    resolver = {}
+    resolver['level_0'] = lucidity.Template('level_0', '/root/{level_0}')
+    for index in range(1, depth + 1):
+        name = 'level_{0}'.format(index)
+        resolver[name] = lucidity.Template(
+            name, '{{@level_{0}}}/{{{1}}}'.format(index - 1, name),
+            template_resolver=resolver
+        )
+
+    return resolver['level_{0}'.format(depth)]
+
+
+def generate_mount_points(directory, count, templates_per_mount_point=10):
+    '''Write *count* mount points to *directory* in nested directories.'''
+    for index in range(count):
+        path = os.path.join(
+            directory, 'group_{0}'.format(index % 5),
+            'mount_point_{0}.py'.format(index)
+        )
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'w') as stream:
+            stream.write(
+                'import lucidity\n\n\n'
+                'def register():\n'
+                '    return [\n'
+            )
+            for offset in range(templates_per_mount_point):
+                stream.write(
+                    '        lucidity.Template(\'t_{0}_{1}\', '
+                    '\'/jobs/{{job}}/m{0}/t{1}/{{shot}}\'),\n'.format(
+                        index, offset
+                    )
+                )
+            stream.write('    ]\n')
+
+
+def ignore_parse_error(function, *args):
+    '''Call *function* with *args* ignoring :exc:`lucidity.ParseError`.'''
+    try:
+        return function(*args)
+    except lucidity.ParseError:
+        return None
+
+
+def collect_benchmarks(quick=False):
+    '''Return list of ``(name, parameters, callable)`` benchmarks.'''
+    benchmarks = []
+    sizes = (10, 100) if quick else (10, 100, 1000)
+
+    # Single template operations.
+    template = generate_templates(1)[0]
+    template_path = generate_paths([template])['first']
+    benchmarks.extend([
+        ('template.parse', {}, lambda: template.parse(template_path)),
+        ('template.format', {}, lambda: template.format(DATA)),
+        ('template.construct', {}, lambda: lucidity.Template(
+            'template', template.pattern
+        ))
+    ])
+
+    # Operations over template sets.
+    for size in sizes:
+        templates = generate_templates(size)
+        template_set = lucidity.TemplateSet(templates)
+        adaptive_template_set = lucidity.AdaptiveTemplateSet(templates)
+        paths = generate_paths(templates)
+
+        for kind, collection in (
+            ('list', templates), ('template_set', template_set),
+            ('adaptive_template_set', adaptive_template_set)
+        ):
+            for case, path in sorted(paths.items()):
+                benchmarks.append((
+                    'lucidity.parse',
+                    {'templates': size, 'collection': kind, 'path': case},
+                    lambda collection=collection, path=path: (
+                        ignore_parse_error(lucidity.parse, path, collection)
+                    )
+                ))
+
+        skewed_paths = generate_skewed_paths(templates)
+        for kind, collection in (
+            ('template_set', template_set),
+            ('adaptive_template_set', adaptive_template_set)
+        ):
+            benchmarks.append((
+                'lucidity.parse_skewed',
+                {
+                    'templates': size, 'collection': kind,
+                    'paths': len(skewed_paths)
+                },
+                lambda collection=collection, paths=skewed_paths: [
+                    ignore_parse_error(lucidity.parse, path, collection)
+                    for path in paths
+                ]
+            ))
+
+        format_templates, format_data = generate_format_templates(size)
+        benchmarks.append((
+            'lucidity.format', {'templates': size},
+            lambda templates=format_templates, data=format_data: (
+                lucidity.format(data, templates)
+            )
+        ))
+
+        batch = list(paths.values()) * 100
+        benchmarks.append((
+            'lucidity.parse_many', {'templates': size, 'paths': len(batch)},
+            lambda template_set=template_set, batch=batch: list(
+                lucidity.parse_many(batch, template_set)
+            )
+        ))
+
+    # Template reference chains.
+    for depth in ((1, 5) if quick else (1, 5, 20)):
+        chained = generate_reference_chain(depth)
+        chained_path = '/root' + ''.join(
+            '/value_{0}'.format(index) for index in range(depth + 1)
+        )
+
+        def expand_uncached(chained=chained):
+            chained._clear_cache()
+            return chained.expanded_pattern()
+
+        benchmarks.extend([
+            ('reference.expanded_pattern', {'depth': depth},
+             chained.expanded_pattern),
+            ('reference.expanded_pattern_uncached', {'depth': depth},
+             expand_uncached),
+            ('reference.parse', {'depth': depth},
+             lambda chained=chained, path=chained_path: chained.parse(path))
+        ])
+
+    return benchmarks
+
+
+def collect_discovery_benchmarks(directory, quick=False):
+    '''Return list of discovery benchmarks using mount points in *directory*.'''
+    benchmarks = []
+    for count in ((5,) if quick else (5, 50)):
+        mount_point_directory = os.path.join(directory, str(count))
+        generate_mount_points(mount_point_directory, count)
+
+        for cache in (False, True):
+            benchmarks.append((
+                'lucidity.discover_templates',
+                {'mount_points': count, 'cache': cache},
+                lambda path=mount_point_directory, cache=cache: (
+                    lucidity.discover_templates([path], cache=cache)
+                )
+            ))
+
+    return benchmarks
+
+
+def measure(function, repeat, minimum_time):
+    '''Return timing results for *function*.
+
+    Calibrate the number of calls per repeat so that each repeat takes at least
+    *minimum_time* seconds.
+
+    '''
+    timer = timeit.Timer(function)
+
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= minimum_time or number >= 10 ** 7:
+            break
+        number *= 10
+
+    timings = [elapsed / number for elapsed in timer.repeat(repeat, number)]
+
+    return {
+        'number': number,
+        'repeat': repeat,
+        'best': min(timings),
+        'mean': sum(timings) / len(timings)
+    }
+
+
+def run(filter_name=None, repeat=5, minimum_time=0.05, quick=False):
+    '''Run benchmarks and return report dictionary.
+
+    If *filter_name* is specified only run benchmarks whose name contains it.
+
+    '''
+    directory = tempfile.mkdtemp(prefix='lucidity_benchmark_')
+    try:
+        benchmarks = collect_benchmarks(quick=quick)
+        benchmarks.extend(collect_discovery_benchmarks(directory, quick=quick))
+
+        results = []
+        for name, parameters, function in benchmarks:
+            if filter_name and filter_name not in name:
+                continue
+
+            result = measure(function, repeat, minimum_time)
+            result['name'] = name
+            result['parameters'] = parameters
+            results.append(result)
+
+            sys.stderr.write('{0:<36} {1:<72} {2:>12.2f} us\n'.format(
+                name, json.dumps(parameters, sort_keys=True),
+                result['best'] * 1e6
+            ))
+
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        'lucidity': lucidity.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'unit': 'seconds',
+        'results': results
+    }
+
+
+def compare(report, previous):
+    '''Return lines comparing best timings in *report* with *previous*.'''
+    def identify(result):
+        return (
+            result['name'], json.dumps(result['parameters'], sort_keys=True)
+        )
+
+    baseline = dict(
+        (identify(result), result['best']) for result in previous['results']
+    )
+
+    lines = []
+    for result in report['results']:
+        key = identify(result)
+        if key not in baseline:
+            continue
+
+        lines.append('{0:<36} {1:<72} {2:>7.2f}x'.format(
+            key[0], key[1], result['best'] / baseline[key]
+        ))
+
+    return lines
+
+
+def main(arguments=None):
+    '''Run benchmarks from command line *arguments*.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--output', help='Write JSON report to file instead of stdout.'
+    )
+    parser.add_argument(
+        '--compare', help='Compare against JSON report from a previous run.'
+    )
+    parser.add_argument(
+        '--filter', help='Only run benchmarks with names containing value.'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='Number of repeats to time.'
+    )
+    parser.add_argument(
+        '--quick', action='store_true',
+        help='Run fewer and smaller benchmarks.'
+    )
+    namespace = parser.parse_args(arguments)
+
+    report = run(
+        filter_name=namespace.filter, repeat=namespace.repeat,
+        minimum_time=0.01 if namespace.quick else 0.05,
+        quick=namespace.quick
+    )
+
+    serialised = json.dumps(report, indent=4, sort_keys=True)
+    if namespace.output:
+        with open(namespace.output, 'w') as stream:
+            stream.write(serialised)
+    else:
+        sys.stdout.write(serialised + '\n')
+
+    if namespace.compare:
+        with open(namespace.compare) as stream:
+            previous = json.load(stream)
+
+        sys.stderr.write('\nRelative to {0}:\n'.format(namespace.compare))
+        for line in compare(report, previous):
+            sys.stderr.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
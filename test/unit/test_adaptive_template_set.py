@@ -0,0 +1,215 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import copy
+import random
+
+import pytest
+
+import lucidity
+import lucidity.parse_cache
+from lucidity import Template, AdaptiveTemplateSet
+from lucidity.error import ParseError
+
+
+@pytest.fixture
+def templates():
+    '''Return templates with a mixture of overlapping literal text.'''
+    return [
+        Template('strict', '/jobs/{a}/{a}', anchor=Template.ANCHOR_BOTH,
+                 duplicate_placeholder_mode=Template.STRICT),
+        Template('shot', '/jobs/{job}/shots/{shot}'),
+        Template('asset', '/jobs/{job}/assets/{asset}'),
+        Template('frame', '{name}.{frame:\d+}.{ext}',
+                 anchor=Template.ANCHOR_END),
+        Template('library', '/library/{item}'),
+        Template('generic', '/jobs/{a}/{b}', anchor=Template.ANCHOR_BOTH)
+    ]
+
+
+def _parse_sequentially(path, templates):
+    '''Return ``(data, template)`` parsed by trying each of *templates*.'''
+    for template in templates:
+        try:
+            return (template.parse(path), template)
+        except ParseError:
+            continue
+
+    return None
+
+
+def _overlapping(template_set):
+    '''Return earlier positions that may overlap each template in set.'''
+    return [
+        template_set._construct_overlapping(position)
+        for position in range(len(template_set))
+    ]
+
+
+def test_parse_matches_declared_order(templates):
+    '''Parse with same result as declared order regardless of hit rates.'''
+    paths = [
+        '/jobs/x/x', '/jobs/x/y', '/jobs/monty/shots/sh010',
+        '/jobs/monty/assets/prop', '/jobs/monty/assets/image.0001.exr',
+        '/library/image.0001.exr', '/library/chair', '/unknown'
+    ]
+    weights = [1, 1, 1, 20, 5, 5, 20, 3]
+
+    template_set = AdaptiveTemplateSet(templates, reorder_interval=10)
+    generator = random.Random(0)
+    for _ in range(500):
+        path = generator.choice([
+            path for path, weight in zip(paths, weights)
+            for _ in range(weight)
+        ])
+        expected = _parse_sequentially(path, templates)
+        if expected is None:
+            with pytest.raises(ParseError):
+                template_set.parse(path)
+        else:
+            assert template_set.parse(path) == expected
+
+    assert template_set.order()[0].name in ('asset', 'library')
+
+
+def test_earlier_overlapping_template_wins():
+    '''Verify earlier declared template after a hot template matches.'''
+    generic = Template('generic', '/jobs/{job}/{rest}')
+    specific = Template('specific', '/jobs/{job}/special')
+    other = Template('other', '/other/{thing}')
+    template_set = AdaptiveTemplateSet([generic, other, specific])
+
+    template_set._hits = [0, 0, 100]
+    template_set.reorder()
+    assert template_set.order()[0] is specific
+
+    data, template = template_set.parse('/jobs/monty/special')
+    assert template is generic
+    assert data == {'job': 'monty', 'rest': 'special'}
+
+
+def test_case_insensitive_template_overlaps():
+    '''Verify earlier case insensitive template despite differing prefix.'''
+    insensitive = Template('insensitive', '/jobs/{name:(?i)[a-z]+}')
+    upper = Template('upper', '/JOBS/{name}')
+    template_set = AdaptiveTemplateSet(
+        [insensitive, upper], attempts=1, reorder_interval=5
+    )
+    assert _overlapping(template_set) == [(), (0,)]
+
+    for _ in range(10):
+        assert template_set.parse('/JOBS/1N')[1] is upper
+
+    assert template_set.order()[0] is upper
+
+    data, template = template_set.parse('/JOBS/abc')
+    assert template is insensitive
+    assert data == {'name': 'abc'}
+
+
+def test_overlapping(templates):
+    '''Only verify templates that could match the same paths.'''
+    overlapping = _overlapping(AdaptiveTemplateSet(templates))
+    names = [
+        [templates[position].name for position in positions]
+        for positions in overlapping
+    ]
+    assert names == [
+        [],
+        [],
+        [],
+        ['strict', 'shot', 'asset'],
+        ['frame'],
+        ['strict', 'frame']
+    ]
+
+
+@pytest.mark.parametrize(('earlier', 'later', 'expected'), [
+    (Template('a', '/jobs/{job}/type_3/{shot}'),
+     Template('b', '/jobs/{job}/type_5/{shot}'), False),
+    (Template('a', '/jobs/{job:.+}/type_3/{shot}'),
+     Template('b', '/jobs/{job}/type_5/{shot}'), True),
+    (Template('a', '/jobs/type_{index:\d+}/{shot}'),
+     Template('b', '/jobs/type_x/{shot}'), False),
+    (Template('a', '/jobs/type_{index:\d+}/{shot}'),
+     Template('b', '/jobs/type_3/{shot}'), True),
+    (Template('a', '/jobs/{job:(?<=/)\w+}/x'),
+     Template('b', '/jobs/y/x'), True),
+    (Template('a', '{job}/shots/{name}.exr', anchor=Template.ANCHOR_END),
+     Template('b', '{job}/assets/{name}.exr', anchor=Template.ANCHOR_END),
+     False),
+    (Template('a', '/jobs/{job}/x', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/jobs/{job}/x/{shot}'), False),
+    (Template('a', '/jobs/{job}/x'),
+     Template('b', '/jobs/{job}/x/{shot}'), True)
+], ids=[
+    'differing literal segment',
+    'placeholder matching separator',
+    'literal segment not matching expression',
+    'literal segment matching expression',
+    'lookbehind',
+    'differing literal segment from end',
+    'fewer segments than required',
+    'unanchored end'
+])
+def test_overlapping_segments(earlier, later, expected):
+    '''Compare segments of templates where placeholders never match '/'.'''
+    overlapping = _overlapping(AdaptiveTemplateSet([earlier, later]))
+    assert overlapping == [(), (0,) if expected else ()]
+
+
+def test_reorder():
+    '''Order by hit count, halving counts each time.'''
+    templates = [
+        Template('a', '/a/{value}'), Template('b', '/b/{value}'),
+        Template('c', '/c/{value}')
+    ]
+    template_set = AdaptiveTemplateSet(templates, reorder_interval=4)
+    for path in ('/c/1', '/c/2', '/b/1'):
+        template_set.parse(path)
+
+    assert template_set.order() == templates
+
+    template_set.parse('/b/2')
+    assert [template.name for template in template_set.order()] == [
+        'c', 'b', 'a'
+    ]
+    assert template_set._hits == [0, 1, 1]
+
+
+def test_lucidity_parse_and_copy(templates):
+    '''Parse via module level function and after copying.'''
+    template_set = AdaptiveTemplateSet(templates)
+    data, template = lucidity.parse('/library/chair', template_set)
+    assert template.name == 'library'
+
+    copied = copy.deepcopy(template_set)
+    assert copied.parse('/library/chair')[1].name == 'library'
+
+
+def test_parse_cached_once(templates, request):
+    '''Store one result for each path rather than one for each template.'''
+    request.addfinalizer(lucidity.parse_cache.disable)
+    parse_cache = lucidity.parse_cache.enable(size=64)
+
+    template_set = AdaptiveTemplateSet(templates, reorder_interval=2)
+    paths = ['/jobs/monty/shots/sh010', '/library/chair', '/unknown']
+    for _ in range(5):
+        for path in paths:
+            try:
+                template_set.parse(path)
+            except ParseError:
+                pass
+
+    assert len(parse_cache) == 3
+    assert (parse_cache.hits, parse_cache.misses) == (12, 3)
+
+
+def test_parse_columns(templates):
+    '''Parse columns with same result as template set.'''
+    paths = ['/jobs/x/x', '/library/chair', '/jobs/monty/shots/sh010'] * 5
+    assert (
+        AdaptiveTemplateSet(templates, reorder_interval=2).parse_columns(paths)
+        == lucidity.TemplateSet(templates).parse_columns(paths)
+    )
@@ -0,0 +1,133 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import pytest
+
+from lucidity import Template
+import lucidity.analysis
+
+
+def _names(pairs):
+    '''Return names of templates in *pairs*.'''
+    return [(template.name, other.name) for template, other in pairs]
+
+
+@pytest.mark.parametrize(('first', 'second', 'expected'), [
+    (Template('a', '/jobs/{job}/shots'), Template('b', '/jobs/{job}/assets'),
+     False),
+    (Template('a', '/jobs/{job}/shots'), Template('b', '/jobs/{a}/{b}'),
+     True),
+    (Template('a', '/{value:\d+}', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/{value:[a-z]+}', anchor=Template.ANCHOR_BOTH),
+     False),
+    (Template('a', '/{value:\d+}', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/{value:[^/]+}', anchor=Template.ANCHOR_BOTH),
+     True),
+    (Template('a', '/{value:(x|y)\\{2,3\\}}', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/{value:xyz?}', anchor=Template.ANCHOR_BOTH),
+     True),
+    (Template('a', '/{value:x\\{4\\}}', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/{value:x\\{1,3\\}}', anchor=Template.ANCHOR_BOTH),
+     False),
+    (Template('a', '{name}.exr', anchor=Template.ANCHOR_END),
+     Template('b', '{name}.jpg', anchor=Template.ANCHOR_END),
+     False),
+    (Template('a', '{name}.exr', anchor=Template.ANCHOR_END),
+     Template('b', '/jobs/{job}'),
+     True),
+    (Template('a', 'cache/{item}', anchor=None),
+     Template('b', '/mnt/{item:.+}', anchor=Template.ANCHOR_BOTH),
+     True),
+    (Template('a', '/{value}', anchor=Template.ANCHOR_BOTH),
+     Template('b', '/{value:.+}\n', anchor=Template.ANCHOR_BOTH),
+     True),
+    (Template('a', '/backref/{value:(x+)\\2}'), Template('b', '/{value}'),
+     None)
+], ids=[
+    'distinct literals',
+    'placeholder covers literal',
+    'distinct expressions',
+    'overlapping expressions',
+    'bounded repeat overlap',
+    'bounded repeat disjoint',
+    'distinct suffixes',
+    'end and start anchored',
+    'unanchored',
+    'trailing newline',
+    'back reference'
+])
+def test_overlaps(first, second, expected):
+    '''Determine whether templates can match the same path.'''
+    analysis = lucidity.analysis.analyse([first, second])
+    assert analysis.overlaps(first, second) is expected
+    assert analysis.overlaps(second, first) is expected
+
+    pairs = [(first.name, second.name)]
+    assert _names(analysis.overlapping) == (pairs if expected else [])
+    assert _names(analysis.disjoint) == (pairs if expected is False else [])
+    assert _names(analysis.unknown) == (pairs if expected is None else [])
+
+
+def test_shadowed():
+    '''Report templates that earlier templates always match first.'''
+    templates = [
+        Template('shot', '/jobs/{job}/shots/{shot}'),
+        Template('asset', '/jobs/{job}/assets/{asset}'),
+        Template('specific', '/jobs/{job}/shots/sh010'),
+        Template('other', '/jobs/{job}/other/{thing}'),
+        Template('either', '/jobs/{job}/{kind:(shots|assets)}/{value}'),
+        Template('partial', '/jobs/{job}/{kind:(shots|other)}/{value:\d+}'),
+        Template('wider', '/jobs/{job}/{kind}/{value}')
+    ]
+    analysis = lucidity.analysis.analyse(templates)
+
+    assert [
+        (template.name, [other.name for other in shadowing])
+        for template, shadowing in analysis.shadowed
+    ] == [
+        ('specific', ['shot']),
+        ('either', ['shot', 'asset', 'specific']),
+        ('partial', ['shot', 'other', 'either'])
+    ]
+
+
+def test_strict_templates_do_not_shadow():
+    '''Ignore strict templates with duplicate placeholders when shadowing.'''
+    templates = [
+        Template('strict', '/{a}/{a}', anchor=Template.ANCHOR_BOTH,
+                 duplicate_placeholder_mode=Template.STRICT),
+        Template('pair', '/{a}/{b}', anchor=Template.ANCHOR_BOTH)
+    ]
+    analysis = lucidity.analysis.analyse(templates)
+    assert _names(analysis.overlapping) == [('strict', 'pair')]
+    assert analysis.shadowed == []
+
+
+def test_limit():
+    '''Report comparisons exceeding the state limit as unknown.'''
+    expression = '[ab]*{0}' + '[ab]' * 8
+    templates = [
+        Template('a', '/{value:' + expression.format('a') + '}x',
+                 anchor=Template.ANCHOR_BOTH),
+        Template('b', '/{value:' + expression.format('b') + '}y',
+                 anchor=Template.ANCHOR_BOTH)
+    ]
+    analysis = lucidity.analysis.analyse(templates, limit=10)
+    assert _names(analysis.unknown) == [('a', 'b')]
+
+
+def test_report():
+    '''Return human readable report.'''
+    templates = [
+        Template('shot', '/jobs/{job}/shots/{shot}'),
+        Template('specific', '/jobs/{job}/shots/sh010'),
+        Template('asset', '/jobs/{job}/assets/{asset}')
+    ]
+    assert lucidity.analysis.analyse(templates).report() == (
+        'Overlapping:\n'
+        '    shot / specific\n'
+        'Shadowed:\n'
+        '    specific by shot\n'
+        '1 overlapping, 2 disjoint, 0 unknown, 1 shadowed.'
+    )
@@ -0,0 +1,119 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import json
+
+import pytest
+
+import lucidity.compiled_cache
+from lucidity import Template
+from lucidity.compiled_cache import CompiledCache
+
+
+@pytest.fixture
+def cache_path(tmpdir):
+    '''Return path for compiled cache file.'''
+    return str(tmpdir.join('cache', 'compiled'))
+
+
+@pytest.fixture
+def enabled(cache_path, request):
+    '''Enable compiled cache for duration of test.'''
+    compiled_cache = lucidity.compiled_cache.enable(
+        cache_path, save_on_exit=False
+    )
+    request.addfinalizer(lucidity.compiled_cache.disable)
+    return compiled_cache
+
+
+def test_disabled_by_default():
+    '''Do not use compiled cache unless enabled.'''
+    assert lucidity.compiled_cache.get_active() is None
+
+
+def test_store_and_reuse_expression(enabled, cache_path, monkeypatch):
+    '''Store constructed expressions and reuse them on later construction.'''
+    template = Template('test', '/single/{variable}')
+    assert template.parse('/single/value') == {'variable': 'value'}
+    enabled.save()
+
+    with open(cache_path) as stream:
+        assert len(json.load(stream)['entries']) == 1
+
+    # Simulate new process with a fresh cache loaded from file.
+    lucidity.compiled_cache.enable(cache_path, save_on_exit=False)
+
+    def fail(*args, **kw):
+        raise AssertionError('Pattern processed despite cached expression.')
+
+    monkeypatch.setattr(Template, '_construct_expression', fail)
+
+    template = Template('test', '/single/{variable}')
+    assert 'regex' not in template._cache
+    assert template.parse('/single/value') == {'variable': 'value'}
+    assert all(isinstance(key, str) for key in template.parse('/single/value'))
+
+
+def test_reference_expression(enabled):
+    '''Store expression for expanded pattern of templates with references.'''
+    resolver = {'reference': Template('reference', '{variable}')}
+    template = Template(
+        'test', '/single/{@reference}', template_resolver=resolver
+    )
+    template.parse('/single/value')
+
+    key = template._get_compiled_cache_key('/single/{variable}')
+    assert enabled.get(key) == r'^\/single\/(?P<variable001>[\w_.\-]+)'
+
+
+@pytest.mark.parametrize('settings', [
+    {'anchor': Template.ANCHOR_END},
+    {'default_placeholder_expression': '\d+'}
+], ids=[
+    'anchor',
+    'default placeholder expression'
+])
+def test_key_includes_settings(settings, enabled):
+    '''Store separate expressions for different template settings.'''
+    Template('test', '/single/{variable}')
+    template = Template('other', '/single/{variable}', **settings)
+    assert template.parse('/single/1') == {'variable': '1'}
+    assert len(enabled._entries) == 2
+
+
+def test_invalid_pattern_not_stored(enabled):
+    '''Do not store expressions that fail to compile.'''
+    with pytest.raises(ValueError):
+        Template('test', '{variable:(?P<missing_closing_angle_bracket)}')
+
+    assert enabled._entries == {}
+    enabled.save()
+
+
+@pytest.mark.parametrize('content', [
+    b'not json',
+    b'\x80\x02(U\x05',
+    json.dumps({'version': '0.0.0', 'entries': {'key': 'value'}}),
+    json.dumps(['key', 'value'])
+], ids=[
+    'corrupt',
+    'pickle',
+    'different version',
+    'not an object'
+])
+def test_ignore_unusable_file(content, cache_path, tmpdir):
+    '''Treat unusable cache file as empty.'''
+    tmpdir.join('cache', 'compiled').write(content, mode='wb', ensure=True)
+
+    compiled_cache = CompiledCache(cache_path)
+    assert compiled_cache.get('key') is None
+
+
+def test_save_unmodified(cache_path, tmpdir):
+    '''Do not write cache file when nothing has changed.'''
+    compiled_cache = CompiledCache(cache_path)
+    assert compiled_cache.get('key') is None
+
+    compiled_cache.save()
+    assert not tmpdir.join('cache', 'compiled').check()
@@ -0,0 +1,170 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import os
+import json
+
+import pytest
+
+import lucidity
+import lucidity.definition
+from lucidity import Template
+
+
+DEFINITION = {
+    'templates': [
+        {'name': 'job', 'pattern': '/jobs/{job.code}'},
+        {
+            'name': 'shot',
+            'pattern': '{@job}/shots/{scene}_{shot}/{scene}',
+            'anchor': 'both',
+            'default_placeholder_expression': '[^/_]+',
+            'duplicate_placeholder_mode': 'strict'
+        },
+        {'name': 'anywhere', 'pattern': 'cache/{name}', 'anchor': None}
+    ]
+}
+
+
+@pytest.fixture
+def definition_path(tmpdir):
+    '''Return path to definition file.'''
+    path = tmpdir.join('templates' + lucidity.definition.EXTENSION)
+    path.write(json.dumps(DEFINITION))
+    return str(path)
+
+
+def test_load(definition_path):
+    '''Load templates from definition file.'''
+    templates = lucidity.definition.load(definition_path)
+    assert [template.name for template in templates] == [
+        'job', 'shot', 'anywhere'
+    ]
+
+    job, shot, anywhere = templates
+    assert job._anchor == Template.ANCHOR_START
+    assert job.duplicate_placeholder_mode == Template.RELAXED
+
+    assert shot._anchor == Template.ANCHOR_BOTH
+    assert shot.duplicate_placeholder_mode == Template.STRICT
+    assert shot.parse('/jobs/monty/shots/sc01_sh010/sc01') == {
+        'job': {'code': 'monty'}, 'scene': 'sc01', 'shot': 'sh010'
+    }
+    with pytest.raises(lucidity.ParseError):
+        shot.parse('/jobs/monty/shots/sc01_sh010/sc02')
+
+    assert anywhere._anchor is None
+    assert anywhere.parse('/tmp/cache/file') == {'name': 'file'}
+
+
+@pytest.mark.parametrize(('text', 'message'), [
+    ('{"templates": [', 'Invalid template definition'),
+    ('[]', 'expected an object with a list of templates'),
+    ('{"templates": ["job"]}', 'expected an object for each template'),
+    ('{"templates": [{"name": "job"}]}', "missing 'pattern'"),
+    ('{"templates": [{"name": "job", "pattern": "/{a}", "anchor": "top"}]}',
+     "unknown anchor u'top'"),
+    ('{"templates": [{"name": "job", "pattern": "/{a}", '
+     '"duplicate_placeholder_mode": "loose"}]}',
+     "unknown duplicate placeholder mode u'loose'"),
+    ('{"templates": [{"name": "job", "pattern": "/{a}", "lazy": true}]}',
+     'unknown fields lazy'),
+    ('{"templates": [{"name": "job", "pattern": "/{a:[}"}]}',
+     "template u'job' is invalid"),
+    ('{"templates": [{"name": "job", "pattern": "/{@missing}"}]}',
+     "template u'job' is invalid")
+], ids=[
+    'malformed json',
+    'not an object',
+    'template not an object',
+    'missing pattern',
+    'unknown anchor',
+    'unknown duplicate placeholder mode',
+    'unknown field',
+    'invalid pattern',
+    'unresolvable reference'
+])
+def test_parse_invalid(text, message):
+    '''Fail to parse invalid definitions.'''
+    with pytest.raises(ValueError) as error:
+        lucidity.definition.parse(text, 'test.lucidity.json')
+
+    assert 'test.lucidity.json' in str(error.value)
+    assert message in str(error.value)
+
+
+def test_precompile(definition_path, monkeypatch):
+    '''Load templates from precompiled sidecar without parsing definition.'''
+    sidecar_path = lucidity.definition.precompile(definition_path)
+    assert sidecar_path == (
+        definition_path + lucidity.definition.SIDECAR_EXTENSION
+    )
+
+    def parse(text, path='<string>'):
+        raise AssertionError('Definition parsed rather than sidecar loaded.')
+
+    monkeypatch.setattr(lucidity.definition, 'parse', parse)
+
+    templates = lucidity.definition.load(definition_path)
+    assert [template.name for template in templates] == [
+        'job', 'shot', 'anywhere'
+    ]
+    assert templates[1].parse('/jobs/monty/shots/sc01_sh010/sc01') == {
+        'job': {'code': 'monty'}, 'scene': 'sc01', 'shot': 'sh010'
+    }
+
+    with pytest.raises(AssertionError):
+        lucidity.definition.load(definition_path, use_sidecar=False)
+
+
+def test_sidecar_ignored_when_outdated(definition_path):
+    '''Parse definition when modified since sidecar was written.'''
+    lucidity.definition.precompile(definition_path)
+
+    with open(definition_path, 'w') as stream:
+        json.dump({'templates': [{'name': 'new', 'pattern': '/new'}]}, stream)
+
+    templates = lucidity.definition.load(definition_path)
+    assert [template.name for template in templates] == ['new']
+
+
+def test_corrupt_sidecar_ignored(definition_path):
+    '''Parse definition when sidecar cannot be read.'''
+    with open(
+        definition_path + lucidity.definition.SIDECAR_EXTENSION, 'wb'
+    ) as stream:
+        stream.write('not a sidecar')
+
+    templates = lucidity.definition.load(definition_path)
+    assert len(templates) == 3
+
+
+@pytest.mark.parametrize('threads', [1, 4], ids=[
+    'serial',
+    'threaded'
+])
+def test_discover(definition_path, threads):
+    '''Discover definition files alongside Python mount points.'''
+    directory = os.path.dirname(definition_path)
+    with open(os.path.join(directory, 'mount_point.py'), 'w') as stream:
+        stream.write(
+            'import lucidity\n\n\n'
+            'def register():\n'
+            '    return [lucidity.Template(\'module\', \'/module\')]\n'
+        )
+
+    with open(os.path.join(directory, 'data.json'), 'w') as stream:
+        stream.write('not a definition')
+
+    templates = lucidity.discover_templates(
+        [directory], cache=False, threads=threads
+    )
+    names = sorted(template.name for template in templates)
+    assert names == ['anywhere', 'job', 'module', 'shot']
+
+    cached = lucidity.discover_templates([directory], threads=threads)
+    assert [template.name for template in cached] == [
+        template.name for template in templates
+    ]
+    assert cached[0] is not templates[0]
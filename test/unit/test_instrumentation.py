@@ -0,0 +1,134 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import pytest
+
+import lucidity
+import lucidity.instrumentation
+from lucidity import Template, TemplateSet
+from lucidity.error import ParseError, FormatError
+
+
+@pytest.fixture
+def templates():
+    '''Return templates to instrument.'''
+    return [
+        Template('shot', '/jobs/{job}/{shot}/work'),
+        Template('asset', '/jobs/{job}/assets/{asset}'),
+        Template('reference', '/backref/{value:(x+)\\2}')
+    ]
+
+
+@pytest.fixture
+def statistics(request):
+    '''Enable instrumentation for duration of test and return statistics.'''
+    events = []
+
+    def callback(*event):
+        events.append(event)
+
+    statistics = lucidity.instrumentation.enable(callback)
+    statistics.events = events
+    request.addfinalizer(lucidity.instrumentation.disable)
+
+    return statistics
+
+
+def test_disabled_by_default():
+    '''Leave original functions in place unless enabled.'''
+    assert lucidity.instrumentation.get_statistics() is None
+    assert Template.parse.__module__ == 'lucidity.template'
+    assert lucidity.parse.__module__ == 'lucidity'
+
+
+def test_disable_restores_functions(statistics):
+    '''Restore original functions on disable.'''
+    assert Template.parse.__module__ == 'lucidity.template'
+    assert lucidity.instrumentation.get_statistics() is statistics
+
+    assert lucidity.instrumentation.disable() is statistics
+    Template('test', '/{a}').parse('/x')
+
+    assert lucidity.instrumentation.get_statistics() is None
+    assert statistics.parse == {}
+
+
+def test_template_parse_and_format(statistics, templates):
+    '''Count attempts, hits and misses of template operations.'''
+    shot = templates[0]
+    shot.parse('/jobs/monty/sh010/work')
+    with pytest.raises(ParseError):
+        shot.parse('/jobs/monty/assets/prop')
+
+    with pytest.raises(FormatError):
+        shot.format({})
+
+    counters = statistics.parse[shot]
+    assert (counters.attempts, counters.hits, counters.misses) == (2, 1, 1)
+    assert counters.hit_rate == 0.5
+    assert counters.time > 0
+
+    counters = statistics.format[shot]
+    assert (counters.attempts, counters.hits, counters.misses) == (1, 0, 1)
+
+    assert [event[:4] for event in statistics.events] == [
+        ('template.parse', shot, '/jobs/monty/sh010/work',
+         {'job': 'monty', 'shot': 'sh010'}),
+        ('template.parse', shot, '/jobs/monty/assets/prop', None),
+        ('template.format', shot, {}, None)
+    ]
+
+
+def test_lucidity_parse(statistics, templates):
+    '''Record paths that fall through every template.'''
+    lucidity.parse('/jobs/monty/assets/prop', templates)
+    with pytest.raises(ParseError):
+        lucidity.parse('/unknown', templates)
+
+    counters = statistics.parse_all
+    assert (counters.attempts, counters.hits, counters.misses) == (2, 1, 1)
+    assert statistics.parse[templates[0]].misses == 2
+    assert statistics.parse[templates[1]].hits == 1
+
+    assert [event[:4] for event in statistics.events[-1:]] == [
+        ('parse', None, '/unknown', None)
+    ]
+
+
+def test_lucidity_format(statistics, templates):
+    '''Record data that no template could format.'''
+    lucidity.format({'job': 'monty', 'asset': 'prop'}, templates)
+    with pytest.raises(FormatError):
+        lucidity.format({}, templates)
+
+    counters = statistics.format_all
+    assert (counters.attempts, counters.hits, counters.misses) == (2, 1, 1)
+
+
+def test_template_set(statistics, templates):
+    '''Record hits of templates matched by a template set.'''
+    template_set = TemplateSet(templates)
+    lucidity.parse('/jobs/monty/sh010/work', template_set)
+    lucidity.parse('/backref/xxxx', template_set)
+    list(lucidity.parse_many(['/jobs/monty/sh020/work', '/x'], template_set))
+
+    counters = statistics.parse_all
+    assert (counters.attempts, counters.hits, counters.misses) == (4, 3, 1)
+
+    assert statistics.parse[templates[0]].hits == 2
+    assert templates[1] not in statistics.parse
+
+    # Template that cannot be combined records its own attempt only once.
+    counters = statistics.parse[templates[2]]
+    assert (counters.attempts, counters.hits) == (1, 1)
+
+
+def test_templates_by_hit_rate(statistics, templates):
+    '''Order templates by hit rate.'''
+    for path in ('/jobs/a/assets/b', '/jobs/a/assets/c', '/jobs/a/s/work'):
+        lucidity.parse(path, templates)
+
+    assert [
+        template.name for template, _ in statistics.templates_by_hit_rate()
+    ] == ['asset', 'shot']
@@ -3,11 +3,14 @@
 # :license: See LICENSE.txt.
 
 import os
+import collections
 import operator
+import sys
 
 import pytest
 
 import lucidity
+import lucidity.error
 
 
 TEST_TEMPLATE_PATH = os.path.join(
@@ -39,6 +42,30 @@ def test_discover(recursive, expected):
     assert map(operator.attrgetter('name'), templates) == expected
 
 
+def test_discover_async():
+    '''Discover templates without blocking the calling thread.'''
+    received = []
+    result = lucidity.discover_templates_async(
+        [TEST_TEMPLATE_PATH], callback=received.append
+    )
+
+    templates = result.get(timeout=10)
+    assert map(operator.attrgetter('name'), templates) == ['a', 'b', 'c', 'd']
+    assert received == [templates]
+
+
+def test_discover_async_failure(monkeypatch):
+    '''Raise errors encountered while discovering when getting result.'''
+    def load(path, cache=True):
+        raise IOError('Failed to load {0}'.format(path))
+
+    monkeypatch.setattr(lucidity, '_load_mount_point', load)
+
+    result = lucidity.discover_templates_async([TEST_TEMPLATE_PATH])
+    with pytest.raises(IOError):
+        result.get(timeout=10)
+
+
 @pytest.mark.parametrize(('path', 'expected'), [
     (TEST_TEMPLATE_PATH, ['a', 'b', 'c', 'd']),
     (os.path.join(TEST_TEMPLATE_PATH, 'non-existant'), [])
@@ -106,6 +133,33 @@ def test_unsuccessfull_format(data, templates):
         lucidity.format(data, templates)
 
 
+def test_format_skips_templates_missing_keys(templates, monkeypatch):
+    '''Rule out templates requiring missing keys without formatting.'''
+    attempted = []
+    original = lucidity.Template.format
+
+    def format(self, data):  # @ReservedAssignment
+        attempted.append(self.name)
+        return original(self, data)
+
+    monkeypatch.setattr(lucidity.Template, 'format', format)
+
+    path, template = lucidity.format(
+        {'job': {'code': 'monty'}, 'rig_type': 'anim'}, templates
+    )
+    assert path == '/jobs/monty/assets/rig/anim'
+    assert attempted == ['rig']
+
+
+def test_format_mapping_with_default_values(templates):
+    '''Format mappings supplying values for keys they do not list.'''
+    data = collections.defaultdict(lambda: 'high')
+    data['job'] = {'code': 'monty'}
+
+    path, template = lucidity.format(data, templates)
+    assert path == '/jobs/monty/assets/model/high'
+
+
 def test_get_template(templates):
     '''Retrieve template by name.'''
     template = lucidity.get_template('rig', templates)
@@ -120,3 +174,417 @@ def test_get_missing_template(templates):
 
     with pytest.raises(lucidity.NotFound):
         lucidity.get_template('rig', [])
+
+
+def test_parse_many(templates):
+    '''Parse multiple paths against multiple candidate templates.'''
+    results = list(lucidity.parse_many([
+        '/jobs/monty/assets/model/high',
+        '/not/matching',
+        '/jobs/monty/assets/rig/anim'
+    ], templates))
+
+    assert results == [
+        ('/jobs/monty/assets/model/high',
+         {'job': {'code': 'monty'}, 'lod': 'high'}, templates[0]),
+        ('/not/matching', None, None),
+        ('/jobs/monty/assets/rig/anim',
+         {'job': {'code': 'monty'}, 'rig_type': 'anim'}, templates[1])
+    ]
+
+
+def test_format_many(templates):
+    '''Format multiple records against multiple candidate templates.'''
+    results = list(lucidity.format_many([
+        {'job': {'code': 'monty'}, 'lod': 'high'},
+        {'job': {'code': 'monty'}},
+        {'job': {'code': 'monty'}, 'rig_type': 'anim'}
+    ], templates))
+
+    assert results == [
+        ('/jobs/monty/assets/model/high', templates[0]),
+        (None, None),
+        ('/jobs/monty/assets/rig/anim', templates[1])
+    ]
+
+
+def test_format_many_columns(templates):
+    '''Format columns, trying later templates for rows that failed.'''
+    results = list(lucidity.format_many({
+        'job.code': ['monty', 'monty', 'monty'],
+        'lod': ['high', None, None],
+        'rig_type': [None, 'anim', None]
+    }, templates))
+
+    assert results == [
+        ('/jobs/monty/assets/model/high', templates[0]),
+        ('/jobs/monty/assets/rig/anim', templates[1]),
+        (None, None)
+    ]
+
+
+def test_format_many_round_trips_columns(templates):
+    '''Format columns returned from parsing back into the same paths.'''
+    paths = [
+        '/jobs/monty/assets/rig/anim',
+        '/jobs/monty/assets/model/high',
+        '/jobs/other/assets/model/low'
+    ]
+    _, columns = lucidity.parse_columns(paths, templates)
+
+    results = lucidity.format_many(columns, templates)
+    assert [path for path, _ in results] == paths
+
+
+def test_parse_many_from_file(templates, tmpdir):
+    '''Parse newline separated paths read from a file.'''
+    listing = tmpdir.join('listing.txt')
+    listing.write(
+        '/jobs/monty/assets/model/high\n'
+        '/not/matching\r\n'
+        '/jobs/monty/assets/rig/anim\n'
+    )
+
+    with open(str(listing)) as paths:
+        results = [
+            (path, template and template.name)
+            for path, data, template in lucidity.parse_many(paths, templates)
+        ]
+
+    assert results == [
+        ('/jobs/monty/assets/model/high', 'model'),
+        ('/not/matching', None),
+        ('/jobs/monty/assets/rig/anim', 'rig')
+    ]
+
+
+def test_parse_many_is_lazy(templates):
+    '''Consume paths lazily from iterable.'''
+    def paths():
+        yield '/jobs/monty/assets/model/high'
+        raise AssertionError('Consumed more paths than requested.')
+
+    results = lucidity.parse_many(paths(), templates)
+    path, data, template = next(results)
+    assert template is templates[0]
+
+
+@pytest.mark.parametrize('ordered', [True, False], ids=[
+    'ordered',
+    'unordered'
+])
+def test_parse_many_in_processes(ordered, templates):
+    '''Parse multiple paths in worker processes.'''
+    paths = [
+        '/jobs/job_{0}/assets/{1}/high'.format(index, kind)
+        for index in range(50) for kind in ('model', 'rig', 'other')
+    ]
+    expected = list(lucidity.parse_many(paths, templates))
+
+    results = list(lucidity.parse_many(
+        paths, templates, processes=2, chunk_size=7, ordered=ordered
+    ))
+
+    if not ordered:
+        results.sort(key=operator.itemgetter(0))
+        expected.sort(key=operator.itemgetter(0))
+
+    assert results == expected
+
+    # Templates should be those supplied rather than copies.
+    for _, _, template in results:
+        assert template is None or template in templates
+
+
+@pytest.fixture
+def directory_tree(tmpdir):
+    '''Return root of a directory tree of files to scan.'''
+    for path in (
+        'jobs/monty/assets/model/high',
+        'jobs/monty/assets/model/low',
+        'jobs/monty/assets/rig/anim',
+        'jobs/monty/assets/other/file',
+        'archive/monty/assets/model/high'
+    ):
+        tmpdir.join(path).ensure(file=True)
+
+    return str(tmpdir)
+
+
+def test_scan(directory_tree):
+    '''Scan directory tree parsing file paths.'''
+    templates = [
+        lucidity.Template(
+            'model',
+            os.path.join(directory_tree, 'jobs/{job}/assets/model/{lod}')
+        ),
+        lucidity.Template(
+            'rig',
+            os.path.join(directory_tree, 'jobs/{job}/assets/rig/{type}')
+        )
+    ]
+
+    results = sorted(
+        (path, data, template.name)
+        for path, data, template in lucidity.scan(directory_tree, templates)
+    )
+
+    assert results == [
+        (os.path.join(directory_tree, 'jobs/monty/assets/model/high'),
+         {'job': 'monty', 'lod': 'high'}, 'model'),
+        (os.path.join(directory_tree, 'jobs/monty/assets/model/low'),
+         {'job': 'monty', 'lod': 'low'}, 'model'),
+        (os.path.join(directory_tree, 'jobs/monty/assets/rig/anim'),
+         {'job': 'monty', 'type': 'anim'}, 'rig')
+    ]
+
+
+def test_scan_in_threads(directory_tree, monkeypatch):
+    '''Scan directory tree listing directories in a pool of threads.'''
+    listed = []
+    list_directory = lucidity.template_set._list_directory
+
+    def record(path):
+        listed.append(os.path.relpath(path, directory_tree))
+        if path.endswith('rig'):
+            raise OSError('Permission denied')
+
+        return list_directory(path)
+
+    monkeypatch.setattr(lucidity.template_set, '_list_directory', record)
+
+    templates = [
+        lucidity.Template(
+            'model',
+            os.path.join(directory_tree, 'jobs/{job}/assets/model/{lod}')
+        ),
+        lucidity.Template(
+            'rig',
+            os.path.join(directory_tree, 'jobs/{job}/assets/rig/{type}')
+        )
+    ]
+
+    results = [
+        (path, data, template.name)
+        for path, data, template in lucidity.scan(
+            directory_tree, templates, threads=4
+        )
+    ]
+
+    assert sorted(results) == [
+        (os.path.join(directory_tree, 'jobs/monty/assets/model/high'),
+         {'job': 'monty', 'lod': 'high'}, 'model'),
+        (os.path.join(directory_tree, 'jobs/monty/assets/model/low'),
+         {'job': 'monty', 'lod': 'low'}, 'model')
+    ]
+    assert 'archive' not in listed
+
+
+def test_scan_prunes_directories(directory_tree, monkeypatch):
+    '''Skip directories that cannot contain matching paths.'''
+    listed = []
+    list_directory = lucidity.template_set._list_directory
+
+    def record(path):
+        listed.append(os.path.relpath(path, directory_tree))
+        return list_directory(path)
+
+    monkeypatch.setattr(lucidity.template_set, '_list_directory', record)
+
+    templates = [
+        lucidity.Template(
+            'model',
+            os.path.join(directory_tree, 'jobs/{job}/assets/model/{lod}')
+        )
+    ]
+    list(lucidity.scan(directory_tree, templates))
+
+    assert 'archive' not in listed
+    assert os.path.join('jobs', 'monty') in listed
+
+    # Directories can only be pruned on literal prefixes.
+    assert os.path.join('jobs', 'monty', 'assets', 'rig') in listed
+
+
+def test_scan_without_prunable_templates(directory_tree):
+    '''Scan whole tree when templates are not anchored at start.'''
+    templates = [
+        lucidity.Template('model', 'assets/model/{lod}', anchor=None)
+    ]
+    results = sorted(
+        os.path.relpath(path, directory_tree)
+        for path, data, template in lucidity.scan(directory_tree, templates)
+    )
+
+    assert results == [
+        'archive/monty/assets/model/high',
+        'jobs/monty/assets/model/high',
+        'jobs/monty/assets/model/low'
+    ]
+
+
+@pytest.mark.parametrize('use_scandir', [True, False], ids=[
+    'scandir',
+    'listdir'
+])
+def test_scan_list_directory(tmpdir, monkeypatch, use_scandir):
+    '''List directory checking only directories for links.'''
+    tmpdir.mkdir('directory')
+    tmpdir.join('file').write('')
+    os.symlink(str(tmpdir.join('directory')), str(tmpdir.join('link')))
+
+    if not use_scandir:
+        monkeypatch.setattr(lucidity.template_set, 'scandir', None)
+
+    checked = []
+    islink = os.path.islink
+
+    def record(path):
+        checked.append(os.path.basename(path))
+        return islink(path)
+
+    monkeypatch.setattr(os.path, 'islink', record)
+
+    entries = lucidity.template_set._list_directory(str(tmpdir))
+    assert sorted(entries) == [
+        ('directory', True, False),
+        ('file', False, False),
+        ('link', True, True)
+    ]
+
+    if not use_scandir:
+        assert sorted(checked) == ['directory', 'link']
+
+
+def _write_mount_point(directory, names):
+    '''Write mount point to *directory* registering templates with *names*.'''
+    directory.join('mount_point.py').write(
+        'import lucidity\n\n\n'
+        'def register():\n'
+        '    return [{0}]\n'.format(', '.join(
+            'lucidity.Template({0!r}, \'/{0}/pattern\')'.format(name)
+            for name in names
+        ))
+    )
+
+
+def test_discover_reuses_unchanged_mount_points(tmpdir):
+    '''Reuse previously loaded templates when mount point is unchanged.'''
+    _write_mount_point(tmpdir, ['a'])
+    path = str(tmpdir.join('mount_point.py'))
+
+    templates = lucidity.discover_templates([str(tmpdir)])
+    assert map(operator.attrgetter('name'), templates) == ['a']
+    module = lucidity._MOUNT_POINT_CACHE[path][2]
+
+    # Copies of the templates should be returned without loading the mount
+    # point again.
+    cached = lucidity.discover_templates([str(tmpdir)])
+    assert map(operator.attrgetter('name'), cached) == ['a']
+    assert cached[0] is not templates[0]
+    assert lucidity._MOUNT_POINT_CACHE[path][2] is module
+
+    # Forcing a reload should load the mount point again.
+    reloaded = lucidity.discover_templates([str(tmpdir)], cache=False)
+    assert map(operator.attrgetter('name'), reloaded) == ['a']
+    assert lucidity._MOUNT_POINT_CACHE[path][2] is not module
+
+
+def test_discover_isolates_changes_to_cached_templates(tmpdir):
+    '''Do not share changes to returned templates with later callers.'''
+    _write_mount_point(tmpdir, ['a'])
+
+    templates = lucidity.discover_templates([str(tmpdir)])
+    assert templates[0].parse('/a/pattern') == {}
+    templates[0].template_resolver = {}
+
+    cached = lucidity.discover_templates([str(tmpdir)])
+    assert cached[0].template_resolver is None
+    assert cached[0].parse('/a/pattern') == {}
+
+
+def test_discover_reloads_changed_mount_points(tmpdir):
+    '''Load mount point again when it changes on disk.'''
+    _write_mount_point(tmpdir, ['a'])
+    templates = lucidity.discover_templates([str(tmpdir)])
+    assert map(operator.attrgetter('name'), templates) == ['a']
+
+    _write_mount_point(tmpdir, ['a', 'b'])
+    templates = lucidity.discover_templates([str(tmpdir)])
+    assert map(operator.attrgetter('name'), templates) == ['a', 'b']
+
+
+@pytest.mark.parametrize('recursive', [True, False], ids=[
+    'recursive',
+    'non-recursive'
+])
+def test_discover_in_threads(recursive, tmpdir):
+    '''Discover templates in a pool of threads in the same order as serially.'''
+    for index, directory in enumerate([
+        'b', 'a', 'a/c', 'a/c/e', 'a/d', 'f', ''
+    ]):
+        _write_mount_point(
+            tmpdir.join(directory).ensure(dir=True), ['t{0}'.format(index)]
+        )
+    tmpdir.join('a', 'not_a_mount_point.txt').write('ignored')
+
+    paths = [str(tmpdir), str(tmpdir.join('missing')), str(tmpdir.join('a'))]
+    expected = lucidity.discover_templates(
+        paths, recursive=recursive, cache=False
+    )
+    templates = lucidity.discover_templates(
+        paths, recursive=recursive, cache=False, threads=4
+    )
+
+    assert [template.name for template in templates] == [
+        template.name for template in expected
+    ]
+    assert len(templates) == (11 if recursive else 2)
+
+    # Cached templates are reused without reading mount points again.
+    cached = lucidity.discover_templates(
+        paths, recursive=recursive, threads=4
+    )
+    assert [template.name for template in cached] == [
+        template.name for template in expected
+    ]
+
+
+def test_discover_does_not_leak_modules(tmpdir):
+    '''Do not leave loaded mount point modules in sys.modules.'''
+    _write_mount_point(tmpdir, ['a'])
+    modules = set(sys.modules)
+
+    lucidity.discover_templates([str(tmpdir)], cache=False)
+    assert set(sys.modules) == modules
+
+
+def test_validate_all(templates):
+    '''Validate valid templates.'''
+    lucidity.validate_all(templates)
+
+
+@pytest.mark.parametrize(('template', 'resolve', 'error'), [
+    (lucidity.Template('invalid', '{}', lazy=True), True, ValueError),
+    (lucidity.Template('invalid', '{}', lazy=True), False, ValueError),
+    (lucidity.Template('invalid', '{@missing}', lazy=True), True,
+     lucidity.error.ResolveError),
+    (lucidity.Template('invalid', '{@missing}', lazy=True), False, None)
+], ids=[
+    'invalid pattern',
+    'invalid pattern without resolving',
+    'unresolvable reference',
+    'unresolvable reference without resolving'
+])
+def test_validate_all_failure(template, resolve, error, templates):
+    '''Fail to validate invalid templates.'''
+    templates.append(template)
+
+    if error is None:
+        lucidity.validate_all(templates, resolve=resolve)
+        return
+
+    with pytest.raises(error) as exception:
+        lucidity.validate_all(templates, resolve=resolve)
+
+    assert '\'invalid\'' in str(exception.value)
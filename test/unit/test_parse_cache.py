@@ -0,0 +1,147 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import pytest
+
+import lucidity
+import lucidity.parse_cache
+from lucidity import Template, TemplateSet
+from lucidity.error import ParseError
+from lucidity.parse_cache import ParseCache
+
+
+@pytest.fixture
+def parse_cache(request):
+    '''Enable parse cache for duration of test and return it.'''
+    request.addfinalizer(lucidity.parse_cache.disable)
+    return lucidity.parse_cache.enable(size=2)
+
+
+def test_least_recently_used_discarded():
+    '''Discard least recently used values once full.'''
+    cache = ParseCache(size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    cache.clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_disabled_by_default():
+    '''Parse without caching unless enabled.'''
+    assert lucidity.parse_cache.get_active() is None
+
+
+def test_template_parse(parse_cache):
+    '''Return cached copy of data parsed by template.'''
+    template = Template('test', '/jobs/{job.code}/{shot}')
+    data = template.parse('/jobs/monty/sh010')
+    data['job']['code'] = 'modified'
+
+    assert template.parse('/jobs/monty/sh010') == {
+        'job': {'code': 'monty'}, 'shot': 'sh010'
+    }
+    assert (parse_cache.hits, parse_cache.misses) == (1, 1)
+
+
+def test_template_parse_failure(parse_cache):
+    '''Cache failure to parse.'''
+    template = Template('test', '/jobs/{job}')
+    for _ in range(2):
+        with pytest.raises(ParseError):
+            template.parse('/other')
+
+    assert (parse_cache.hits, parse_cache.misses) == (1, 1)
+
+
+def test_template_change_not_stale(parse_cache):
+    '''Ignore results cached before a referenced template changed.'''
+    resolver = {'reference': Template('reference', '{variable}')}
+    template = Template('test', '/{@reference}', template_resolver=resolver)
+    assert template.parse('/value') == {'variable': 'value'}
+
+    resolver['reference'] = Template('reference', '{other}')
+    assert template.parse('/value') == {'other': 'value'}
+
+
+def test_template_set(parse_cache):
+    '''Cache results of parsing against template set.'''
+    resolver = {'reference': Template('reference', '{variable}')}
+    templates = [
+        Template('test', '/root/{@reference}', template_resolver=resolver)
+    ]
+    template_set = TemplateSet(templates)
+
+    for _ in range(2):
+        data, template = lucidity.parse('/root/value', template_set)
+        assert data == {'variable': 'value'}
+        assert template is templates[0]
+        data['variable'] = 'modified'
+
+        with pytest.raises(ParseError):
+            lucidity.parse('/other', template_set)
+
+    assert (parse_cache.hits, parse_cache.misses) == (2, 2)
+
+    resolver['reference'] = Template('reference', '{other}')
+    template_set.refresh()
+    assert lucidity.parse('/root/value', template_set)[0] == {
+        'other': 'value'
+    }
+
+
+def test_template_list(parse_cache):
+    '''Cache results for each template tried from a list of templates.'''
+    parse_cache = lucidity.parse_cache.enable(size=64)
+    resolver = {'reference': Template('reference', '{variable}')}
+    templates = [
+        Template('other_{0}'.format(index), '/other/{0}/{{a}}'.format(index))
+        for index in range(10)
+    ] + [
+        Template('test', '/root/{@reference}', template_resolver=resolver)
+    ]
+
+    for _ in range(2):
+        data, template = lucidity.parse('/root/value', templates)
+        assert data == {'variable': 'value'}
+        assert template is templates[-1]
+        data['variable'] = 'modified'
+
+        with pytest.raises(ParseError):
+            lucidity.parse('/missing', templates)
+
+    assert (parse_cache.hits, parse_cache.misses) == (22, 22)
+    assert len(parse_cache) == 22
+
+    # Results are shared with a list containing the same templates.
+    with pytest.raises(ParseError):
+        lucidity.parse('/root/value', templates[:-1])
+
+    assert parse_cache.hits == 32
+
+    resolver['reference'] = Template('reference', '{other}')
+    assert lucidity.parse('/root/value', templates)[0] == {'other': 'value'}
+
+
+def test_template_set_fallback_cached_once(parse_cache):
+    '''Store one result when a template set parses templates individually.'''
+    template_set = TemplateSet([
+        Template('test', '/root/{value:(?i)[a-z]+}')
+    ])
+
+    for _ in range(2):
+        data, template = template_set.parse('/root/VALUE')
+        assert data == {'value': 'VALUE'}
+
+    assert len(parse_cache) == 1
+    assert (parse_cache.hits, parse_cache.misses) == (1, 1)
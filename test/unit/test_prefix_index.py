@@ -0,0 +1,150 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import operator
+
+import pytest
+
+import lucidity
+from lucidity import Template
+from lucidity.prefix_index import PrefixIndex
+
+
+@pytest.fixture
+def templates():
+    '''Return templates with a variety of literal prefixes and suffixes.'''
+    return [
+        Template('job', '/jobs/{job}'),
+        Template('shot', '/jobs/{job}/shots/{shot}'),
+        Template('archive', '/mnt/archive/{item}'),
+        Template('cache', '/cache/{item}.abc', anchor=Template.ANCHOR_BOTH),
+        Template('image', '{name}.exr', anchor=Template.ANCHOR_END),
+        Template('anywhere', 'thumbnails/{name}', anchor=None),
+        Template('static', '/static', anchor=Template.ANCHOR_BOTH)
+    ]
+
+
+@pytest.mark.parametrize(('path', 'expected'), [
+    ('/jobs/monty/shots/sh010', ['job', 'shot', 'anywhere']),
+    ('/mnt/archive/monty', ['archive', 'anywhere']),
+    ('/cache/thing.abc', ['cache', 'anywhere']),
+    ('/cache/thing.exr', ['image', 'anywhere']),
+    ('/cache/thing.exr\n', ['image', 'anywhere']),
+    ('/mnt/other', ['anywhere']),
+    ('/static', ['anywhere', 'static'])
+], ids=[
+    'shared prefix',
+    'nested prefix',
+    'prefix and suffix',
+    'suffix',
+    'suffix before trailing newline',
+    'no literal match',
+    'full static pattern'
+])
+def test_candidates(path, expected, templates):
+    '''Return only templates that could match path in declared order.'''
+    index = PrefixIndex(templates)
+    candidates = index.candidates(path)
+    assert map(operator.attrgetter('name'), candidates) == expected
+
+    # Candidates should never exclude a template that matches.
+    for template in templates:
+        try:
+            template.parse(path)
+        except Exception:
+            continue
+
+        assert template in candidates
+
+
+def test_lookup(templates):
+    '''Return positions of candidate templates.'''
+    index = PrefixIndex(templates)
+    assert index.lookup('/mnt/archive/monty') == (2, 5)
+
+
+def test_reference_prefix():
+    '''Index templates by literal prefix of expanded pattern.'''
+    resolver = {'job': Template('job', '/jobs/{job}')}
+    templates = [
+        Template('shot', '{@job}/shots/{shot}', template_resolver=resolver),
+        Template('archive', '/archive/{item}')
+    ]
+    index = PrefixIndex(templates)
+    assert index.candidates('/jobs/monty/shots/sh010') == templates[:1]
+
+
+@pytest.mark.parametrize(('prefix', 'expected'), [
+    ('/', True),
+    ('/jobs/', True),
+    ('/jobs/monty/', True),
+    ('/mnt/', True),
+    ('/mnt/other/', False),
+    ('/other/', False)
+], ids=[
+    'root',
+    'literal prefix',
+    'beyond literal prefix',
+    'partial literal prefix',
+    'diverging from literal prefix',
+    'unknown'
+])
+def test_could_match_prefix(prefix, expected):
+    '''Determine whether any template could match paths under prefix.'''
+    index = PrefixIndex([
+        Template('job', '/jobs/{job}'),
+        Template('archive', '/mnt/archive/{item}')
+    ])
+    assert index.could_match_prefix(prefix) is expected
+
+
+def test_could_match_prefix_with_unanchored_template():
+    '''Never rule out prefix when a template is not anchored at start.'''
+    index = PrefixIndex([
+        Template('job', '/jobs/{job}'),
+        Template('image', '{name}.exr', anchor=Template.ANCHOR_END)
+    ])
+    assert index.could_match_prefix('/other/') is True
+
+
+@pytest.mark.parametrize('pattern', [
+    '/jobs/{name:(?i)[a-z]+}/x',
+    '/jobs/{name:(?m)[a-z]+}/x'
+], ids=[
+    'ignore case',
+    'multiline'
+])
+def test_flagged_templates_always_candidates(pattern):
+    '''Never rule out templates whose inline flags relax literals.'''
+    template = Template('flagged', pattern, anchor=Template.ANCHOR_BOTH)
+    index = PrefixIndex([template])
+
+    assert index.candidates('/JOBS/abc/X') == [template]
+    assert index.candidates('other\n/jobs/abc/x\nother') == [template]
+    assert index.could_match_prefix('/JOBS/') is True
+
+
+def test_literals_with_newlines():
+    '''Index literal text including newlines.'''
+    template = Template('test', '{x}/a\nb', anchor=Template.ANCHOR_END)
+    index = PrefixIndex([template])
+
+    assert index.candidates('z/a\nb') == [template]
+    assert index.candidates('z/a\nc') == []
+
+
+def test_template_set_with_case_insensitive_template(tmpdir):
+    '''Parse and scan paths matching case insensitive template.'''
+    template = Template(
+        'insensitive', str(tmpdir) + '/jobs/{name:(?i)[a-z]+}/x'
+    )
+    path = str(tmpdir) + '/JOBS/abc/x'
+    template_set = lucidity.TemplateSet([template])
+
+    assert template_set.parse(path) == ({'name': 'abc'}, template)
+
+    tmpdir.join('JOBS', 'abc', 'x').ensure(file=True)
+    assert list(template_set.scan(str(tmpdir))) == [
+        (path, {'name': 'abc'}, template)
+    ]
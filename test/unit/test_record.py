@@ -0,0 +1,128 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import copy
+import pickle
+
+import pytest
+
+from lucidity import Template
+from lucidity.error import ParseError
+from lucidity.record import Record, get_type
+
+
+@pytest.fixture
+def template():
+    '''Return template with nested and duplicate placeholders.'''
+    return Template(
+        'test', '/jobs/{job.code}/{job.name}/{shot}/{shot}'
+    )
+
+
+@pytest.fixture
+def record(template):
+    '''Return record parsed by template.'''
+    return template.parse_record('/jobs/monty/Monty/sh010/sh020')
+
+
+def test_matches_parse(template, record):
+    '''Hold same data as parse.'''
+    expected = template.parse('/jobs/monty/Monty/sh010/sh020')
+    assert isinstance(record, Record)
+    assert record == expected
+    assert record.to_dict() == expected
+    assert not record != expected
+
+
+def test_mapping_access(record):
+    '''Access values by key as with dictionary.'''
+    assert record['job'] == {'code': 'monty', 'name': 'Monty'}
+    assert record['job.code'] == 'monty'
+    assert record['shot'] == 'sh020'
+    assert record.get('missing', 'default') == 'default'
+    assert sorted(record) == ['job', 'shot']
+    assert sorted(record.keys()) == ['job', 'shot']
+    assert len(record) == 2
+    assert 'job' in record
+    assert 'job.name' in record
+    assert 'missing' not in record
+    assert sorted(record.items()) == [
+        ('job', {'code': 'monty', 'name': 'Monty'}), ('shot', 'sh020')
+    ]
+
+    with pytest.raises(KeyError):
+        record['missing']
+
+
+def test_attribute_access(record):
+    '''Access top level values as attributes.'''
+    assert record.shot == 'sh020'
+    assert record.job == {'code': 'monty', 'name': 'Monty'}
+
+    with pytest.raises(AttributeError):
+        record.missing
+
+
+def test_attribute_access_colliding_keys():
+    '''Read keys named as record attributes by key rather than attribute.'''
+    template = Template('test', '/{index}/{count}/{keys}/{to_dict}')
+    record = template.parse_record('/1/2/3/4')
+
+    assert record['index'] == '1'
+    assert record['count'] == '2'
+    assert record['keys'] == '3'
+    assert record['to_dict'] == '4'
+    assert sorted(record.keys()) == ['count', 'index', 'keys', 'to_dict']
+    assert callable(record.index)
+
+
+def test_nested_dictionaries_are_new(record):
+    '''Return new nested dictionaries each time.'''
+    record['job']['code'] = 'modified'
+    assert record['job.code'] == 'monty'
+
+
+def test_compact(record):
+    '''Store only placeholder values.'''
+    assert tuple.__len__(record) == 3
+    assert record.fields() == [
+        ('job.code', 'monty'), ('job.name', 'Monty'), ('shot', 'sh020')
+    ]
+    assert not hasattr(record, '__dict__')
+
+
+def test_type_shared(template):
+    '''Share record type between templates with the same placeholders.'''
+    other = Template('other', '/other/{job.code}/{job.name}/{shot}')
+    assert type(other.parse_record('/other/a/b/c')) is type(
+        template.parse_record('/jobs/a/b/c/c')
+    )
+    assert get_type(('a',)) is get_type(('a',))
+
+
+@pytest.mark.parametrize('duplicate', [copy.copy, copy.deepcopy, lambda
+    record: pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+], ids=['copy', 'deepcopy', 'pickle'])
+def test_copy(record, duplicate):
+    '''Copy and pickle records.'''
+    duplicated = duplicate(record)
+    assert type(duplicated) is type(record)
+    assert duplicated == record
+
+
+def test_strict_duplicates():
+    '''Raise when strict duplicate placeholders differ.'''
+    template = Template(
+        'test', '/{a}/{b}/{a}', duplicate_placeholder_mode=Template.STRICT
+    )
+    assert template.parse_record('/x/y/x') == {'a': 'x', 'b': 'y'}
+
+    with pytest.raises(ParseError):
+        template.parse_record('/x/y/z')
+
+
+def test_no_match(template):
+    '''Raise when path does not match.'''
+    with pytest.raises(ParseError):
+        template.parse_record('/other')
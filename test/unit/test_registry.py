@@ -0,0 +1,126 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import pytest
+
+import lucidity
+from lucidity import Template, Registry, Resolver
+from lucidity.error import NotFound, ResolveError
+
+
+@pytest.fixture
+def registry():
+    '''Return registry of templates referencing each other.'''
+    registry = Registry()
+    for name, pattern in (
+        ('root', '/jobs'),
+        ('job', '{@root}/{job}'),
+        ('shot', '{@job}/shots/{shot}'),
+        ('asset', '{@job}/assets/{asset}'),
+        ('other', '/other/{item}')
+    ):
+        registry.add(Template(name, pattern, template_resolver=registry))
+
+    return registry
+
+
+def test_resolver_interface(registry):
+    '''Conform to template resolver interface.'''
+    assert isinstance(registry, Resolver)
+    assert registry.get('shot').name == 'shot'
+    assert registry.get('missing') is None
+    assert registry.get('missing', 'default') == 'default'
+
+
+def test_container(registry):
+    '''Access registry like an ordered collection of templates.'''
+    assert len(registry) == 5
+    assert 'job' in registry
+    assert 'missing' not in registry
+    assert [template.name for template in registry] == [
+        'root', 'job', 'shot', 'asset', 'other'
+    ]
+
+
+def test_resolve_references(registry):
+    '''Resolve template references using registry.'''
+    assert registry.get('shot').parse('/jobs/monty/shots/sh010') == {
+        'job': 'monty', 'shot': 'sh010'
+    }
+
+
+@pytest.mark.parametrize(('name', 'expected'), [
+    ('root', ['job', 'shot', 'asset']),
+    ('job', ['shot', 'asset']),
+    ('shot', []),
+    ('missing', [])
+], ids=[
+    'indirect dependents',
+    'direct dependents',
+    'no dependents',
+    'missing template'
+])
+def test_dependents(name, expected, registry):
+    '''Find templates depending on template.'''
+    assert sorted(registry.dependents(name)) == sorted(expected)
+
+
+def test_replace(registry):
+    '''Invalidate dependents when replacing template.'''
+    shot = registry.get('shot')
+    asset = registry.get('asset')
+    other = registry.get('other')
+    for template in (shot, asset, other):
+        template.expanded_pattern()
+
+    registry.add(Template('root', '/projects', template_resolver=registry))
+
+    assert shot._cache is None
+    assert asset._cache is None
+    assert other._cache is not None
+    assert shot.expanded_pattern() == '/projects/{job}/shots/{shot}'
+
+    # Order should be preserved on replacement.
+    assert [template.name for template in registry][0] == 'root'
+
+
+def test_replace_updates_dependents(registry):
+    '''Update dependency graph when template references change.'''
+    registry.add(Template('shot', '{@root}/shots/{shot}'))
+    assert sorted(registry.dependents('job')) == ['asset']
+    assert sorted(registry.dependents('root')) == ['asset', 'job', 'shot']
+
+
+def test_remove(registry):
+    '''Remove template and invalidate dependents.'''
+    shot = registry.get('shot')
+    shot.expanded_pattern()
+
+    removed = registry.remove('job')
+    assert removed.name == 'job'
+    assert 'job' not in registry
+    assert shot._cache is None
+
+    with pytest.raises(ResolveError):
+        shot.expanded_pattern()
+
+
+def test_remove_missing(registry):
+    '''Fail to remove missing template.'''
+    with pytest.raises(NotFound):
+        registry.remove('missing')
+
+
+def test_get_template(registry):
+    '''Retrieve template by name from registry.'''
+    assert lucidity.get_template('asset', registry) is registry.get('asset')
+
+    with pytest.raises(NotFound):
+        lucidity.get_template('missing', registry)
+
+
+def test_parse(registry):
+    '''Parse path against templates in registry.'''
+    data, template = lucidity.parse('/other/thing', registry)
+    assert template.name == 'other'
@@ -2,6 +2,9 @@
 # :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
 # :license: See LICENSE.txt.
 
+import copy
+import pickle
+
 import pytest
 
 from lucidity import Template, Resolver
@@ -216,6 +219,7 @@ def test_anchor(path, anchor, expected):
      '/first/static/second'),
     ('/single/{@reference}', {'variable': 'value'}, '/single/value'),
     ('{@nested}/reference', {'variable': 'value'}, '/root/value/reference'),
+    ('/{a}/{b}', {'a': None, 'b': 'b'}, '//b')
 ], ids=[
     'static string',
     'single variable',
@@ -224,7 +228,8 @@ def test_anchor(path, anchor, expected):
     'mix of static and variables',
     'structured placeholders',
     'reference',
-    'nested reference'
+    'nested reference',
+    'value of None'
 ])
 def test_format(pattern, data, expected, template_resolver):
     '''Format data against pattern.'''
@@ -311,6 +316,20 @@ def test_keys_mutable_side_effect():
     assert placeholders_b == set(['variable'])
 
 
+def test_keys_reuses_placeholders():
+    '''Construct placeholders once across repeated calls to keys.'''
+    template = Template('test', '/{a}/{b.c}/{b.d}')
+    assert template.keys() == set(['a', 'b.c', 'b.d'])
+
+    keys = template._state()['keys']
+    assert template.keys() == set(['a', 'b.c', 'b.d'])
+    assert template._state()['keys'] is keys
+
+    assert template._get_cached(
+        'required_keys', template._construct_required_keys
+    ) == frozenset(['a', 'b'])
+
+
 @pytest.mark.parametrize(('pattern', 'expected'), [
     ('/static/string', []),
     ('/single/{variable}', []),
@@ -367,3 +386,305 @@ def test_resolver_failure(operation, arguments):
     template = Template('test', '{@reference}', template_resolver={})
     with pytest.raises(ResolveError):
         getattr(template, operation)(*arguments)
+
+
+def test_parse_reuses_compiled_expression():
+    '''Compile regular expression once across repeated parses.'''
+    template = Template('test', '/single/{variable}')
+    template.parse('/single/value')
+    state = template._state()
+
+    template.parse('/single/other')
+    assert template._state() is state
+    assert 'regex' in state
+
+
+def test_cache_invalidated_on_resolver_change():
+    '''Rebuild cached state when template resolver is replaced.'''
+    template = Template(
+        'test', '/single/{@reference}',
+        template_resolver={'reference': Template('reference', '{variable}')}
+    )
+    assert template.parse('/single/value') == {'variable': 'value'}
+
+    template.template_resolver = {
+        'reference': Template('reference', '{other}')
+    }
+    assert template.parse('/single/value') == {'other': 'value'}
+
+
+def test_cache_invalidated_on_reference_change():
+    '''Rebuild cached state when a referenced template changes.'''
+    resolver = {'reference': Template('reference', '{variable}')}
+    template = Template(
+        'test', '/single/{@reference}', template_resolver=resolver
+    )
+    assert template.expanded_pattern() == '/single/{variable}'
+
+    # Replace referenced template.
+    resolver['reference'] = Template('reference', '{other:\d+}')
+    assert template.expanded_pattern() == '/single/{other:\d+}'
+    assert template.parse('/single/1') == {'other': '1'}
+
+
+def test_cache_invalidated_on_nested_reference_change():
+    '''Rebuild cached state when a nested referenced template changes.'''
+    resolver = {}
+    resolver['reference'] = Template('reference', '{variable}')
+    resolver['nested'] = Template(
+        'nested', '/root/{@reference}', template_resolver=resolver
+    )
+    template = Template(
+        'test', '{@nested}/leaf', template_resolver=resolver
+    )
+    assert template.keys() == set(['variable'])
+
+    # Change resolver of intermediate template only.
+    resolver['nested'].template_resolver = {
+        'reference': Template('reference', '{other}')
+    }
+    assert template.keys() == set(['other'])
+
+
+def test_deepcopy_after_parse():
+    '''Deepcopy template holding cached state.'''
+    template = Template('test', '/single/{variable}')
+    template.parse('/single/value')
+
+    copied = copy.deepcopy(template)
+    assert copied.parse('/single/value') == {'variable': 'value'}
+
+
+def test_parse_reuses_extraction_plan():
+    '''Construct extraction plan once across repeated parses.'''
+    template = Template('test', '/{a}/{b.c}/{b.d.e}/{f}/{a}')
+    assert template.parse('/x/y/z/w/x') == {
+        'a': 'x', 'b': {'c': 'y', 'd': {'e': 'z'}}, 'f': 'w'
+    }
+
+    plan = template._state()['extraction']
+    keys, _, containers, nested, duplicates = plan
+    assert keys == ['a', 'f']
+    assert containers == [(0, 'b'), (1, 'd')]
+    assert nested == [(1, 'c', 1), (2, 'e', 2)]
+    assert duplicates == [('a', [0, 4])]
+
+    assert template.parse('/1/2/3/4/5') == {
+        'a': '5', 'b': {'c': '2', 'd': {'e': '3'}}, 'f': '4'
+    }
+    assert template._state()['extraction'] is plan
+
+
+@pytest.mark.parametrize(('pattern', 'anchor', 'expected'), [
+    ('/jobs/{job}/shots/{shot}.ext', Template.ANCHOR_START,
+     ('/jobs/', None, ('/shots/',))),
+    ('/jobs/{job}/shots/{shot}.ext', Template.ANCHOR_BOTH,
+     ('/jobs/', ('.ext', '.ext\n'), ('/shots/',))),
+    ('/jobs/{job}/shots/{shot}.ext', None,
+     (None, None, ('/shots/',))),
+    ('{job}/{shot}', Template.ANCHOR_BOTH, (None, None, ())),
+    ('/{job:(?i)[a-z]+}/shots', Template.ANCHOR_BOTH, (None, None, ())),
+    ('/{job:(?m)[a-z]+}/shots', Template.ANCHOR_BOTH, (None, None, ()))
+], ids=[
+    'start anchor',
+    'both anchors',
+    'no anchor',
+    'no selective literals',
+    'case insensitive',
+    'multiline'
+])
+def test_prefilter(pattern, anchor, expected):
+    '''Construct literal text required to match pattern.'''
+    template = Template('test', pattern, anchor=anchor)
+    assert template._get_cached(
+        'prefilter', template._construct_prefilter
+    ) == expected
+
+
+@pytest.mark.parametrize(('pattern', 'anchor', 'path', 'expected'), [
+    ('/jobs/{job}/shots', Template.ANCHOR_BOTH, '/jobs/monty/shots\n',
+     {'job': 'monty'}),
+    ('/jobs/{job}/shots', Template.ANCHOR_BOTH, '/jobs/monty/shots/x', None),
+    ('/jobs/{job}/shots', None, '/mnt/jobs/monty/shots/x', {'job': 'monty'}),
+    ('/jobs/{job}/shots', None, '/mnt/jobs/monty/assets', None),
+    ('/{job:(?i)[a-z]+}/SHOTS', Template.ANCHOR_BOTH, '/monty/shots',
+     {'job': 'monty'}),
+    ('/a/{x:(?m)\w+}', Template.ANCHOR_START, 'zz\n/a/b', {'x': 'b'}),
+    ('/a\n/{x}', None, 'q/a\n/b', {'x': 'b'}),
+    ('{x}/a\nb', Template.ANCHOR_END, 'z/a\nb', {'x': 'z'})
+], ids=[
+    'trailing newline',
+    'missing suffix',
+    'unanchored',
+    'missing substring',
+    'case insensitive',
+    'multiline',
+    'newline in substring',
+    'newline in suffix'
+])
+def test_parse_with_prefilter(pattern, anchor, path, expected):
+    '''Parse paths checked against required literal text first.'''
+    template = Template('test', pattern, anchor=anchor)
+    if expected is None:
+        with pytest.raises(ParseError):
+            template.parse(path)
+    else:
+        assert template.parse(path) == expected
+
+
+def test_format_reuses_segments():
+    '''Construct format segments once across repeated formats.'''
+    template = Template('test', '/{a}/static/{b.c:\d+}.ext')
+    assert template.format({'a': 'x', 'b': {'c': '1'}}) == '/x/static/1.ext'
+
+    segments = template._state()['format_segments']
+    assert segments == [
+        ('/', 'a', ('a',)),
+        ('/static/', 'b.c', ('b', 'c')),
+        ('.ext', None, None)
+    ]
+
+    assert template.format({'a': 'y', 'b': {'c': '2'}}) == '/y/static/2.ext'
+    assert template._state()['format_segments'] is segments
+
+
+def test_format_many():
+    '''Format multiple records, yielding None for failures.'''
+    template = Template('test', '/{a}/static/{b.c:\d+}.ext')
+    results = list(template.format_many([
+        {'a': 'x', 'b': {'c': '1'}},
+        {'a': 'y'},
+        {'a': 'z', 'b': 'not-nested'},
+        {'a': 'w', 'b': {'c': 2}},
+        {'a': 'v', 'b': {'c': '3'}, 'extra': 'ignored'}
+    ]))
+
+    assert results == [
+        '/x/static/1.ext', None, None, None, '/v/static/3.ext'
+    ]
+
+
+@pytest.mark.parametrize(('pattern', 'records', 'expected'), [
+    ('/{a}/{b}', [{'a': 'x', 'b': 'y'}, {'b': 'y'}], ['/x/y', None]),
+    ('/{a}', [{'a': 'x'}, {}], ['/x', None]),
+    ('/static', [{}, {'a': 'x'}], ['/static', '/static']),
+    ('/{a}/{a}', [{'a': 'x'}], ['/x/x']),
+    ('/{a}/{b}', [{'a': None, 'b': 'y'}, {'a': None, 'b': 1}], ['//y', None]),
+    ('/{a}', [{'a': None}], ['/'])
+], ids=[
+    'multiple placeholders',
+    'single placeholder',
+    'no placeholders',
+    'duplicate placeholders',
+    'value of None',
+    'single value of None'
+])
+def test_format_many_placeholder_counts(pattern, records, expected):
+    '''Format multiple records against varying numbers of placeholders.'''
+    template = Template('test', pattern)
+    assert list(template.format_many(records)) == expected
+
+
+def test_format_many_columns():
+    '''Format rows of columns keyed by placeholder name.'''
+    template = Template('test', '/jobs/{job.code}/shots/{shot}')
+    results = list(template.format_many({
+        'job.code': ['monty', 'monty', None],
+        'shot': ['sh010', None, 'sh030'],
+        'unused': ['a', 'b', 'c']
+    }))
+    assert results == ['/jobs/monty/shots/sh010', None, None]
+
+    results = list(template.format_many({'shot': ['sh010', 'sh020']}))
+    assert results == [None, None]
+
+    results = list(Template('test', '/static').format_many({'a': [1, 2]}))
+    assert results == ['/static', '/static']
+
+
+def test_format_many_matches_format(template_resolver):
+    '''Format references to other templates in the same way as format.'''
+    template = Template(
+        'test', '{@nested}/{name}', template_resolver=template_resolver
+    )
+    data = {'variable': 'value', 'name': 'file'}
+    assert list(template.format_many([data])) == [template.format(data)]
+
+
+@pytest.mark.parametrize(('pattern', 'expected'), [
+    ('/static/string', ('/static/string', '/static/string')),
+    ('/single/{variable}', ('/single/', '')),
+    ('{a}/static/{b}.ext', ('', '.ext')),
+    ('/{a}_{b:\d\{4\}}/end', ('/', '/end')),
+    ('/root/{@reference}/leaf', ('/root/', '/leaf')),
+    ('/a\nb/{x}/c\nd', ('/a\nb/', '/c\nd'))
+], ids=[
+    'static string',
+    'prefix only',
+    'suffix only',
+    'custom expression',
+    'reference',
+    'newlines'
+])
+def test_literals(pattern, expected, template_resolver):
+    '''Extract literal prefix and suffix of expanded pattern.'''
+    template = Template('test', pattern, template_resolver=template_resolver)
+    assert template._construct_literals(template.expanded_pattern()) == expected
+
+
+def test_pickle(template_resolver):
+    '''Pickle template with references and cached state.'''
+    template = Template(
+        'test', '{@nested}/{leaf}', template_resolver=template_resolver
+    )
+    template.parse('/root/value/leaf')
+
+    unpickled = pickle.loads(pickle.dumps(template, pickle.HIGHEST_PROTOCOL))
+    assert unpickled.parse('/root/value/leaf') == {
+        'variable': 'value', 'leaf': 'leaf'
+    }
+
+
+@pytest.mark.parametrize('pattern', [
+    '{}',
+    '{variable:(?P<missing_closing_angle_bracket)}'
+], ids=[
+    'empty placeholder',
+    'invalid placeholder expression'
+])
+def test_lazy_validation(pattern):
+    '''Defer validation of invalid pattern until first use.'''
+    template = Template('test', pattern, lazy=True)
+
+    with pytest.raises(ValueError):
+        template.parse('')
+
+    with pytest.raises(ValueError):
+        template.validate()
+
+
+def test_lazy_validation_default(monkeypatch):
+    '''Defer validation for all templates using class default.'''
+    monkeypatch.setattr(Template, 'lazy', True)
+    template = Template('test', '{}')
+
+    with pytest.raises(ValueError):
+        template.validate()
+
+    # Explicit argument should override default.
+    with pytest.raises(ValueError):
+        Template('test', '{}', lazy=False)
+
+
+def test_lazy_template_operations(template_resolver):
+    '''Perform operations on lazily validated templates.'''
+    template = Template('test', '/single/{variable}', lazy=True)
+    assert template._cache is None
+    assert template.parse('/single/value') == {'variable': 'value'}
+    assert template.format({'variable': 'value'}) == '/single/value'
+
+    template = Template(
+        'test', '{@nested}/{leaf}', template_resolver=template_resolver,
+        lazy=True
+    )
+    assert template.keys() == set(['variable', 'leaf'])
@@ -0,0 +1,228 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2013 Martin Pengelly-Phillips
+# :license: See LICENSE.txt.
+
+import copy
+
+import pytest
+
+import lucidity
+from lucidity import Template, TemplateSet
+from lucidity.error import ParseError
+
+
+@pytest.fixture
+def templates():
+    '''Return candidate templates covering a range of features.'''
+    resolver = {}
+    resolver['job'] = Template('job', '/jobs/{job.code}')
+
+    return [
+        Template('strict', '/jobs/{a}/{a}', anchor=Template.ANCHOR_BOTH,
+                 duplicate_placeholder_mode=Template.STRICT),
+        Template('model', '{@job}/assets/model/{lod}',
+                 template_resolver=resolver),
+        Template('rig', '/jobs/{job.code}/assets/rig/{rig_type}'),
+        Template('frame', '{name}.{frame:\d+}.{ext}',
+                 anchor=Template.ANCHOR_END),
+        Template('grouped', '/grouped/{kind:(a|b)}{index:\d+}'),
+        Template('reference', '/backref/{value:(x+)\\2}'),
+        Template('anywhere', 'cache/{item}', anchor=None),
+        Template('fallback', '/jobs/{a}/{b}', anchor=Template.ANCHOR_BOTH)
+    ]
+
+
+def _parse_sequentially(path, templates):
+    '''Return ``(data, template)`` parsed by trying each of *templates*.'''
+    for template in templates:
+        try:
+            return (template.parse(path), template)
+        except ParseError:
+            continue
+
+    return None
+
+
+@pytest.mark.parametrize('path', [
+    '/jobs/x/x',
+    '/jobs/x/y',
+    '/jobs/monty/assets/model/high',
+    '/jobs/monty/assets/rig/anim',
+    '/renders/image.0001.exr',
+    '/grouped/b12',
+    '/backref/xxxx',
+    '/backref/xxx',
+    '/mnt/cache/thing/extra',
+    '/not/matching'
+], ids=[
+    'strict duplicate',
+    'strict failure falls through',
+    'reference',
+    'nested key',
+    'anchor end',
+    'unnamed group in expression',
+    'back reference',
+    'back reference failure',
+    'anchor none',
+    'no match'
+])
+def test_parse_matches_sequential_order(path, templates):
+    '''Parse path with same result as trying each template in turn.'''
+    expected = _parse_sequentially(path, templates)
+
+    template_set = TemplateSet(templates)
+    if expected is None:
+        with pytest.raises(ParseError):
+            template_set.parse(path)
+    else:
+        data, template = template_set.parse(path)
+        assert (data, template) == expected
+
+
+@pytest.mark.parametrize(('templates', 'path'), [
+    ([Template('flagged', '/root/{name:(?i)x}/z'),
+      Template('other', '/root/{n:[a-z]+}/{m:[a-z]+}')], '/root/ABC/DEF'),
+    ([Template('flagged', '/root/{name:(?s)x.}'),
+      Template('other', '/root/{n:x.}', anchor=Template.ANCHOR_BOTH)],
+     '/root/x\n'),
+    ([Template('conditional', '/{v:(q)?(?(2)r|s)}',
+               anchor=Template.ANCHOR_BOTH)], '/qr'),
+    ([Template('conditional', '/{v:(q)?(?(2)r|s)}',
+               anchor=Template.ANCHOR_BOTH)], '/qs')
+], ids=[
+    'inline ignore case flag',
+    'inline dot all flag',
+    'conditional group reference match',
+    'conditional group reference failure'
+])
+def test_uncombinable_templates_match_sequential_order(templates, path):
+    '''Parse templates that cannot be combined with same result as in turn.'''
+    expected = _parse_sequentially(path, templates)
+
+    template_set = TemplateSet(templates)
+    if expected is None:
+        with pytest.raises(ParseError):
+            template_set.parse(path)
+    else:
+        assert template_set.parse(path) == expected
+
+    assert not template_set._is_combinable(templates[0])
+
+
+def test_first_match_wins_for_unanchored_templates():
+    '''Prefer earlier template even when a later one matches earlier in path.'''
+    templates = [
+        Template('late', 'b/{value}', anchor=None),
+        Template('early', 'a/{value}', anchor=None)
+    ]
+    data, template = TemplateSet(templates).parse('a/x/b/y')
+    assert template.name == 'late'
+    assert data == {'value': 'y'}
+
+
+def test_parse_many_templates_across_chunks():
+    '''Parse against more templates than fit in one combined expression.'''
+    templates = [
+        Template('template_{0}'.format(index),
+                 '/{{a}}/{0}/{{b}}/{{c}}'.format(index))
+        for index in range(100)
+    ]
+    template_set = TemplateSet(templates)
+
+    data, template = template_set.parse('/x/73/y/z')
+    assert template is templates[73]
+    assert data == {'a': 'x', 'b': 'y', 'c': 'z'}
+    chunks = template_set._chunks[tuple(range(100))]
+    assert len(chunks) > 1
+
+
+def test_lucidity_parse_with_template_set(templates):
+    '''Parse path using template set via module level function.'''
+    data, template = lucidity.parse(
+        '/jobs/monty/assets/rig/anim', TemplateSet(templates)
+    )
+    assert template.name == 'rig'
+    assert data == {'job': {'code': 'monty'}, 'rig_type': 'anim'}
+
+
+def test_refresh():
+    '''Rebuild combined expressions after referenced template changes.'''
+    resolver = {'reference': Template('reference', '{variable}')}
+    template_set = TemplateSet([
+        Template('test', '/root/{@reference}', template_resolver=resolver)
+    ])
+    assert template_set.parse('/root/value')[0] == {'variable': 'value'}
+
+    resolver['reference'] = Template('reference', '{other}')
+    template_set.refresh()
+    assert template_set.parse('/root/value')[0] == {'other': 'value'}
+
+
+def test_deepcopy(templates):
+    '''Deepcopy template set holding compiled state.'''
+    template_set = TemplateSet(templates)
+    template_set.parse('/jobs/monty/assets/rig/anim')
+
+    copied = copy.deepcopy(template_set)
+    data, template = copied.parse('/jobs/monty/assets/rig/anim')
+    assert template.name == 'rig'
+    assert len(copied) == len(template_set)
+
+
+def test_candidates(templates):
+    '''Return templates that could match path according to literal text.'''
+    template_set = TemplateSet(templates)
+    candidates = template_set.candidates('/grouped/a1')
+    assert [template.name for template in candidates] == [
+        'frame', 'grouped', 'anywhere'
+    ]
+
+
+def test_parse_columns():
+    '''Parse paths into columns of values.'''
+    templates = [
+        Template('shot', '/jobs/{job.code}/shots/{shot}'),
+        Template('asset', '/jobs/{job.code}/assets/{asset}'),
+        Template('strict', '/strict/{a}/{a}',
+                 duplicate_placeholder_mode=Template.STRICT),
+        Template('reference', '/backref/{value:(x+)\\2}')
+    ]
+    template_indices, columns = TemplateSet(templates).parse_columns([
+        '/jobs/monty/shots/sh010\n',
+        '/unknown',
+        '/jobs/monty/assets/prop',
+        '/strict/x/x',
+        '/strict/x/y',
+        '/backref/xxxx'
+    ])
+
+    assert template_indices == [0, -1, 1, 2, -1, 3]
+    assert columns == {
+        'job.code': ['monty', None, 'monty', None, None, None],
+        'shot': ['sh010', None, None, None, None, None],
+        'asset': [None, None, 'prop', None, None, None],
+        'a': [None, None, None, 'x', None, None],
+        'value': [None, None, None, None, None, 'xxxx']
+    }
+
+
+def test_lucidity_parse_columns(templates):
+    '''Parse columns using list of templates via module level function.'''
+    template_indices, columns = lucidity.parse_columns(
+        ['/jobs/monty/assets/rig/anim'], templates
+    )
+    assert [templates[index].name for index in template_indices] == ['rig']
+    assert columns['rig_type'] == ['anim']
+
+
+def test_parse_columns_numpy():
+    '''Return NumPy arrays when requested.'''
+    numpy = pytest.importorskip('numpy')
+
+    template_indices, columns = TemplateSet([
+        Template('shot', '/jobs/{job}/{shot}')
+    ]).parse_columns(['/jobs/monty/sh010', '/unknown'], numpy=True)
+
+    assert isinstance(template_indices, numpy.ndarray)
+    assert template_indices.tolist() == [0, -1]
+    assert columns['shot'].tolist() == ['sh010', '']